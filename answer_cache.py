@@ -0,0 +1,300 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from language_routing import detect_language
+
+# Default cache settings (can be overridden by the caller)
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL_SECONDS = 60 * 60
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+DEFAULT_CORPUS_CHECK_INTERVAL = 60
+
+
+def normalize_question(question):
+    """Normalize a question so trivially different spellings share a cache key"""
+    text = unicodedata.normalize("NFKC", question).strip().lower()
+    return " ".join(text.split())
+
+
+CORPUS_VERSION_ID = "corpus-version"
+
+
+def corpus_version_namespace(namespace):
+    """Namespace of the corpus version marker, kept apart from the chunks so searches never return it"""
+    return f"{namespace or ''}__corpus_version"
+
+
+def mark_corpus_version(index, namespace, version, dimension=None):
+    """Record a new content version for the namespace (ingest.py and query_scope.py tag call this)
+
+    Replacing or re-tagging chunks leaves the vector count unchanged, so
+    writers upsert a marker record whose metadata carries the version.
+    """
+    if dimension is None:
+        stats = index.describe_index_stats()
+        dimension = stats.get("dimension") if isinstance(stats, dict) else stats.dimension
+    index.upsert(
+        vectors=[{"id": CORPUS_VERSION_ID, "values": [1.0] + [0.0] * (dimension - 1),
+                  "metadata": {"version": version, "updated_at": int(time.time())}}],
+        namespace=corpus_version_namespace(namespace)
+    )
+
+
+def _corpus_version_marker(index, namespace):
+    fetched = index.fetch(ids=[CORPUS_VERSION_ID], namespace=corpus_version_namespace(namespace))
+    vectors = fetched.get("vectors", {}) if isinstance(fetched, dict) else fetched.vectors
+    marker = vectors.get(CORPUS_VERSION_ID)
+    if marker is None:
+        return ""
+    metadata = marker.get("metadata") if isinstance(marker, dict) else marker.metadata
+    return (metadata or {}).get("version", "")
+
+
+def namespace_fingerprint(index, namespace):
+    """Describe the namespace content so cache entries can be dropped when it changes
+
+    The vector count catches additions and deletions; the version marker
+    written by the ingestor catches chunks replaced in place.
+    """
+    stats = index.describe_index_stats()
+    namespaces = stats.get("namespaces", {}) if isinstance(stats, dict) else stats.namespaces
+    ns_stats = namespaces.get(namespace or "", {})
+    vector_count = ns_stats.get("vector_count", 0) if isinstance(ns_stats, dict) else ns_stats.vector_count
+    return f"{namespace or ''}:{vector_count}:{_corpus_version_marker(index, namespace)}"
+
+
+class _CacheEntry:
+    __slots__ = ("question", "partition", "embedding", "result", "created_at")
+
+    def __init__(self, question, partition, embedding, result, created_at):
+        self.question = question
+        self.partition = partition
+        self.embedding = embedding
+        self.result = result
+        self.created_at = created_at
+
+
+class _PartitionIndex:
+    """Query embeddings of one partition as rows of a matrix, so a lookup is one matrix-vector product"""
+
+    __slots__ = ("keys", "rows", "matrix")
+
+    def __init__(self, dimension):
+        self.keys = []
+        self.rows = {}
+        self.matrix = np.empty((8, dimension), dtype=np.float32)
+
+    def add(self, key, vector):
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self.matrix):
+                self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix)])
+            self.rows[key] = row
+            self.keys.append(key)
+        self.matrix[row] = vector
+
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        # Move the last row into the hole
+        last = len(self.keys) - 1
+        if row != last:
+            moved = self.keys[last]
+            self.keys[row] = moved
+            self.rows[moved] = row
+            self.matrix[row] = self.matrix[last]
+        self.keys.pop()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def candidates(self, vector, threshold):
+        """(key, score) of the rows scoring at least threshold, best first"""
+        scores = self.matrix[:len(self.keys)] @ vector
+        rows = np.flatnonzero(scores >= threshold)
+        return [(self.keys[row], float(scores[row])) for row in rows[np.argsort(-scores[rows])]]
+
+
+class SemanticAnswerCache:
+    """Process-wide answer cache with exact and near-duplicate (cosine) lookups
+
+    Entries are partitioned by (language, prompt_type, retrieval_k,
+    committee) so a semantic hit never crosses languages, response settings
+    or committee filters. Callers pass the language the router chose for
+    the question (Route.language), so the partition matches the prompt
+    variant under any LANGUAGE_ROUTING_THRESHOLD; without one it is
+    detected with the default threshold. Eviction is
+    LRU with a per-entry TTL, and the whole cache is dropped when the corpus
+    fingerprint changes.
+
+    Each partition keeps its entries' embeddings in a matrix
+    (_PartitionIndex), so a semantic lookup is one matrix-vector product
+    rather than a loop over the entries. The embedding made for a lookup
+    comes from the same CachedEmbeddings the vector store uses, so on a
+    miss retrieval finds the question's vector in the memory tier instead
+    of calling Titan again.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                 corpus_check_interval=DEFAULT_CORPUS_CHECK_INTERVAL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.corpus_check_interval = corpus_check_interval
+        self._entries = OrderedDict()
+        self._partitions = {}
+        self._lock = threading.Lock()
+        self._corpus_version = None
+        self._corpus_checked_at = 0.0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _partition(question, prompt_type, retrieval_k, committee=None, language=None):
+        return (language or detect_language(question), prompt_type, int(retrieval_k), committee)
+
+    def _is_expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry.created_at > self.ttl_seconds
+
+    def _remove(self, key):
+        # Caller holds the lock
+        entry = self._entries.pop(key)
+        index = self._partitions.get(entry.partition)
+        if index is not None:
+            index.remove(key)
+            if not index:
+                del self._partitions[entry.partition]
+        return entry
+
+    def get(self, question, prompt_type="comprehensive", retrieval_k=5, embed_fn=None, committee=None,
+            language=None):
+        """Look up a cached answer
+
+        Returns (result, hit_type, query_embedding). hit_type is 'exact',
+        'semantic' or None. embed_fn is only called when there is no exact
+        hit, and the embedding it produced is returned so put() can reuse it.
+        """
+        normalized = normalize_question(question)
+        partition = self._partition(question, prompt_type, retrieval_k, committee, language)
+        key = (partition, normalized)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry, now):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return dict(entry.result), "exact", entry.embedding
+            if embed_fn is None:
+                self.misses += 1
+                return None, None, None
+
+        # Embed outside the lock, the upstream call can take a while
+        query_embedding = self._normalize_vector(embed_fn(question))
+
+        with self._lock:
+            index = self._partitions.get(partition)
+            candidates = index.candidates(query_embedding, self.similarity_threshold) if index is not None else []
+            for entry_key, score in candidates:
+                entry = self._entries[entry_key]
+                if self._is_expired(entry, now):
+                    self._remove(entry_key)
+                    continue
+                self._entries.move_to_end(entry_key)
+                self.semantic_hits += 1
+                result = dict(entry.result)
+                result["cache_similarity"] = score
+                return result, "semantic", query_embedding
+
+            self.misses += 1
+            return None, None, query_embedding
+
+    def put(self, question, prompt_type, retrieval_k, result, query_embedding=None, committee=None, language=None):
+        """Store an answer and its source documents"""
+        partition = self._partition(question, prompt_type, retrieval_k, committee, language)
+        key = (partition, normalize_question(question))
+        cached_result = {
+            "result": result["result"],
+            "source_documents": list(result.get("source_documents", [])),
+        }
+        if query_embedding is not None:
+            query_embedding = self._normalize_vector(query_embedding)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(question, partition, query_embedding, cached_result, time.time())
+            if query_embedding is not None:
+                index = self._partitions.get(partition)
+                if index is None:
+                    index = self._partitions[partition] = _PartitionIndex(len(query_embedding))
+                index.add(key, query_embedding)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._partitions.clear()
+            self.invalidations += 1
+
+    def check_corpus_version(self, fetch_version):
+        """Invalidate the cache if the corpus fingerprint changed
+
+        fetch_version is called at most once per corpus_check_interval seconds,
+        so this can be called on every query.
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._corpus_checked_at < self.corpus_check_interval:
+                return False
+            self._corpus_checked_at = now
+
+        try:
+            version = fetch_version()
+        except Exception as e:
+            print(f"Could not check corpus version: {e}")
+            return False
+
+        with self._lock:
+            changed = self._corpus_version is not None and version != self._corpus_version
+            self._corpus_version = version
+        if changed:
+            self.invalidate()
+        return changed
+
+    def stats(self):
+        """Return hit/miss counters for display"""
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+    @staticmethod
+    def _normalize_vector(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
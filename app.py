@@ -3,64 +3,80 @@ import os
 import sys
 from datetime import datetime
 import time
-from dotenv import load_dotenv
-import boto3
+import uuid
 from botocore.exceptions import ClientError
 
-# Import your RAG system components
-from pinecone import Pinecone
-from langchain_pinecone import PineconeVectorStore
-from langchain_aws import BedrockEmbeddings, ChatBedrock
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
+# Shared resources (clients, caches, chains, query engine), built once per process
+from app_resources import (
+    get_answer_cache,
+    get_document_store,
+    get_example_answers,
+    get_presigned_url_cache,
+    get_query_engine,
+    get_warmup,
+    initialize_rag_system,
+)
+from example_answers import EXAMPLE_QUESTIONS
+from history import ChatHistory, HistoryEntry
+from presign_cache import parse_s3_uri
+from query_scope import COMMITTEES, COMMITTEES_BY_KEY, scoping_enabled
+from tracing import TimedCall
 
-# Load environment variables
-load_dotenv()
+def format_pdf_link(s3_uri, page_number, presigned_url):
+    """Format a markdown link to the PDF, opening at the page reference if available"""
+    filename = s3_uri.split("/")[-1]
+    if page_number:
+        # The fragment is not signed, so all pages of a PDF share one presigned URL
+        return f"[📄 {filename} (Page {page_number})]({presigned_url}#page={page_number})"
+    else:
+        return f"[📄 {filename}]({presigned_url})"
 
+def format_link_error(s3_uri, error):
+    if isinstance(error, ClientError):
+        print(f"Error generating presigned URL: {error}")
+        return f"📄 {s3_uri} (Link unavailable)"
+    print(f"Unexpected error: {error}")
+    return f"📄 {s3_uri}"
 
 def create_presigned_pdf_link(s3_uri, page_number=None, expiration=3600):
     """Create a presigned URL for the PDF document"""
     try:
-        # Initialize S3 client using your AWS credentials
-        s3_client = boto3.client(
-            's3', 
-            region_name=st.secrets["AWS_REGION"],
-            aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-            aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"]
-        )
-        
-        # Extract bucket and key from S3 URI
-        s3_parts = s3_uri.replace("s3://", "").split("/", 1)
-        bucket_name = s3_parts[0]
-        object_key = s3_parts[1]
-        
-        # Generate presigned URL (valid for 1 hour)
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-             Params={
-                 'Bucket': bucket_name, 
-                 'Key': object_key,
-                 'ResponseContentDisposition': 'inline',
-                 'ResponseContentType': 'application/pdf'
-            },
-            ExpiresIn=expiration
-        )
-        
-        # Extract filename for display
-        filename = object_key.split("/")[-1]
-        
-        # Create link with page reference if available
-        if page_number:
-            return f"[📄 {filename} (Page {page_number})]({presigned_url})"
-        else:
-            return f"[📄 {filename}]({presigned_url})"
-            
-    except ClientError as e:
-        print(f"Error generating presigned URL: {e}")
-        return f"📄 {s3_uri} (Link unavailable)"
+        bucket_name, object_key = parse_s3_uri(s3_uri)
+        if not object_key:
+            raise ValueError(f"No object key in {s3_uri}")
+        presigned_url = get_presigned_url_cache().get(bucket_name, object_key, expiration)
+        return format_pdf_link(s3_uri, page_number, presigned_url)
     except Exception as e:
-        print(f"Unexpected error: {e}")
-        return f"📄 {s3_uri}"
+        return format_link_error(s3_uri, e)
+
+def create_presigned_pdf_links(documents, expiration=3600):
+    """Create PDF links for all source documents of an answer at once
+    
+    Returns one entry per document: the markdown link, or None when the
+    document has no S3 source. A source URI without an object key gets a
+    plain-text entry instead of failing the whole answer.
+    """
+    to_sign = {}
+    links = [None] * len(documents)
+    for i, doc in enumerate(documents):
+        metadata = doc.metadata if hasattr(doc, 'metadata') else {}
+        s3_uri = metadata.get('x-amz-bedrock-kb-source-uri', metadata.get('source', ''))
+        if s3_uri and s3_uri.startswith("s3://"):
+            bucket_name, object_key = parse_s3_uri(s3_uri)
+            if not object_key:
+                links[i] = format_link_error(s3_uri, ValueError(f"No object key in {s3_uri}"))
+                continue
+            to_sign[i] = (s3_uri, (bucket_name, object_key), metadata.get('x-amz-bedrock-kb-page-number'))
+    
+    urls = get_presigned_url_cache().get_many([item for _, item, _ in to_sign.values()], expiration)
+    
+    for i, (s3_uri, item, page_number) in to_sign.items():
+        url = urls[item]
+        if isinstance(url, Exception):
+            links[i] = format_link_error(s3_uri, url)
+        else:
+            links[i] = format_pdf_link(s3_uri, page_number, url)
+    return links
 
 # Language configurations
 LANGUAGES = {
@@ -70,6 +86,9 @@ LANGUAGES = {
         "config_header": "🎛️ Configuration",
         "response_style": "Select Response Style:",
         "documents_retrieve": "Documents to Retrieve:",
+        "committee_filter": "Search Committee:",
+        "all_committees": "All committees",
+        "committee_filter_help": "Search only this committee's documents. Committees and meeting numbers named in the question are detected automatically",
         "committee_coverage": "📋 Committee Coverage",
         "language_support": "🌐 Language Support",
         "language_support_text": "Ask questions in English or Japanese (日本語) - the system will respond in the same language!",
@@ -80,6 +99,7 @@ LANGUAGES = {
         "system_status": "📊 System Status",
         "system_online": "🟢 System Online",
         "system_operational": "RAG system operational",
+        "warming_up": "⏳ Warming up shared resources…",
         "total_queries": "Total Queries",
         "last_query": "Last Query",
         "query_results": "📋 Query Results",
@@ -107,7 +127,31 @@ LANGUAGES = {
         "coming_soon": "(Coming Soon: 2023, 2024)",
         "theme_mode": "🎨 Theme Mode",
         "dark_mode": "🌙 Dark Mode",
-        "light_mode": "☀️ Light Mode"
+        "light_mode": "☀️ Light Mode",
+        "retrieved_sources": "📚 Retrieved sources (generating answer...):",
+        "retrieval_time": "Retrieval Time:",
+        "time_to_first_token": "Time to First Token:",
+        "generation_time": "Generation Time:",
+        "cached_answer": "⚡ Answered from cache",
+        "precomputed_answer": "⚡ Precomputed answer for an example question",
+        "cache_hit_rate": "Answer Cache Hit Rate",
+        "embedding_cache_hit_rate": "Embedding Cache Hit Rate",
+        "shared_documents": "Shared Source Chunks",
+        "shared_documents_help": "Chunks held once for all sessions: {size:.0f} KB in memory, {saved:.0f} KB of copies avoided",
+        "show_timing_panel": "Show stage timings",
+        "timing_panel_help": "Show a per-stage timing breakdown in Query Details",
+        "stage_timings": "Stage Timings",
+        "stage": "Stage",
+        "start_ms": "Start (ms)",
+        "duration_ms": "Duration (ms)",
+        "prompt_tokens": "Prompt tokens:",
+        "completion_tokens": "Completion tokens:",
+        "cache_read_tokens": "Cached prompt tokens:",
+        "previous_page": "◀ Newer",
+        "next_page": "Older ▶",
+        "history_page": "Page",
+        "history_of": "of",
+        "tokens_estimated": "(estimated)"
     },
     "ja": {
         "title": "METI委員会情報エージェント",
@@ -115,6 +159,9 @@ LANGUAGES = {
         "config_header": "🎛️ 設定",
         "response_style": "応答スタイルを選択:",
         "documents_retrieve": "取得する文書数:",
+        "committee_filter": "検索対象の委員会:",
+        "all_committees": "すべての委員会",
+        "committee_filter_help": "選択した委員会の文書のみを検索します。質問中の委員会名や会議回数は自動的に検出されます",
         "committee_coverage": "📋 委員会カバレッジ",
         "language_support": "🌐 言語サポート",
         "language_support_text": "英語または日本語で質問してください - システムは同じ言語で回答します！",
@@ -125,6 +172,7 @@ LANGUAGES = {
         "system_status": "📊 システム状況",
         "system_online": "🟢 システム稼働中",
         "system_operational": "RAGシステム動作中",
+        "warming_up": "⏳ 共有リソースをウォームアップ中…",
         "total_queries": "総クエリ数",
         "last_query": "最終クエリ",
         "query_results": "📋 クエリ結果",
@@ -152,7 +200,31 @@ LANGUAGES = {
         "coming_soon": "（近日公開: 2023年、2024年）",
         "theme_mode": "🎨 テーマモード",
         "dark_mode": "🌙 ダークモード",
-        "light_mode": "☀️ ライトモード"
+        "light_mode": "☀️ ライトモード",
+        "retrieved_sources": "📚 取得した文書（回答を生成中...）:",
+        "retrieval_time": "検索時間:",
+        "time_to_first_token": "最初のトークンまでの時間:",
+        "generation_time": "生成時間:",
+        "cached_answer": "⚡ キャッシュから回答しました",
+        "precomputed_answer": "⚡ 質問例の事前計算済みの回答です",
+        "cache_hit_rate": "回答キャッシュヒット率",
+        "embedding_cache_hit_rate": "埋め込みキャッシュヒット率",
+        "shared_documents": "共有ソースチャンク数",
+        "shared_documents_help": "全セッションで共有しているチャンク: メモリ使用量 {size:.0f} KB、重複回避 {saved:.0f} KB",
+        "show_timing_panel": "ステージ別の処理時間を表示",
+        "timing_panel_help": "クエリ詳細にステージ別の処理時間を表示します",
+        "stage_timings": "ステージ別処理時間",
+        "stage": "ステージ",
+        "start_ms": "開始 (ms)",
+        "duration_ms": "所要時間 (ms)",
+        "prompt_tokens": "プロンプトトークン数:",
+        "completion_tokens": "生成トークン数:",
+        "cache_read_tokens": "キャッシュ済みプロンプトトークン数:",
+        "previous_page": "◀ 新しい履歴",
+        "next_page": "古い履歴 ▶",
+        "history_page": "ページ",
+        "history_of": "/",
+        "tokens_estimated": "（推定）"
     }
 }
 
@@ -180,23 +252,6 @@ COMMITTEES_INFO = {
     ]
 }
 
-EXAMPLE_QUESTIONS = {
-    "en": [
-        "What external changes are impacting Japan's electricity system?",
-        "What are the main challenges in grid modernization?",
-        "How is Japan addressing carbon management?",
-        "What are the key renewable energy deployment strategies?",
-        "How does the distributed power system work?"
-    ],
-    "ja": [
-        "日本の電力システムに影響を与える外部変化は何ですか？",
-        "電力市場の改革について教えてください",
-        "日本の再生可能エネルギーの現状は？",
-        "分散型電力システムの課題は何ですか？",
-        "カーボンマネジメントの具体的な取り組みは？"
-    ]
-}
-
 # Page configuration
 st.set_page_config(
     page_title="METI Committee Information Agent",
@@ -211,11 +266,16 @@ if 'language' not in st.session_state:
 if 'theme_mode' not in st.session_state:
     st.session_state.theme_mode = 'dark'
 if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
+    # Bounded and compact: sources are references into the shared document store
+    st.session_state.chat_history = ChatHistory(max_entries=int(os.getenv("HISTORY_MAX_ENTRIES", "50")))
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
 if 'rag_system' not in st.session_state:
     st.session_state.rag_system = None
 if 'system_initialized' not in st.session_state:
     st.session_state.system_initialized = False
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 def get_css_for_theme(theme_mode):
     """Return CSS based on theme mode"""
@@ -741,178 +801,107 @@ def get_text(key):
     """Get text in current language"""
     return LANGUAGES[st.session_state.language].get(key, key)
 
-# Define prompt templates (same as in your RAG system)
-COMPREHENSIVE_PROMPT = """You are an expert assistant specializing in Japan's electricity and energy policy, with access to detailed information from 8 key METI (Ministry of Economy, Trade and Industry) committee meetings held in 2025.
-
-## Your Knowledge Base
-Your knowledge base contains official meeting documents from these committees:
-
-1. **Subcommittee on Basic Electricity and Gas Policy** (電力・ガス基本政策小委員会)
-   - Meetings: 85th-87th committee meetings
-   - Focus: Fundamental electricity and gas policy frameworks, regulatory reforms, market mechanisms
-
-2. **Subcommittee on Large-Scale Introduction of Renewable Energy and Next-Generation Electricity Networks** (再生可能エネルギー大量導入・次世代電力ネットワーク小委員会)
-   - Meetings: 72nd-74th committee meetings
-   - Focus: Large-scale renewable energy deployment, grid modernization, network infrastructure
-
-3. **Next Generation Power System Working Group** (次世代電力系統ワーキンググループ)
-   - Meetings: 1st-2nd sessions in 2025
-   - Focus: Advanced power system technologies, grid flexibility, smart grid implementation
-
-4. **Study Group on Next-Generation Distributed Power Systems** (次世代の分散型電力システムに関する検討会)
-   - Meetings: 12th study group meeting
-   - Focus: Distributed energy resources, microgrids, decentralized power systems
-
-5. **Watt Bit Collaboration Public-Private Forum** (ワット・ビット連携官民懇談会)
-   - Meetings: 1st-3rd sessions in 2025
-   - Focus: Digital transformation in energy sector, data utilization, public-private partnerships
-
-6. **Carbon Management Subcommittee** (カーボンマネジメント小委員会)
-   - Meetings: 9th meeting
-   - Focus: Carbon management strategies, decarbonization policies, emission reduction measures
-
-7. **Study Group on the Status of Simultaneous Markets** (同時市場の在り方等に関する検討会)
-   - Meetings: 13th-17th meetings
-   - Focus: Electricity market design, market coupling, simultaneous market operations
-
-8. **Committee on Adjustment Capacity and Supply-Demand Balance Evaluation** (調整力及び需給バランス評価等に関する委員会)
-   - Focus: Grid balancing services, supply-demand management, adjustment capacity mechanisms
-
-## Response Requirements
-- ✅ Cite specific committee meetings and sources
-- ✅ Provide context about which committee discussed the topic
-- ✅ Use official METI terminology and policy language
-- ✅ Include Japanese terms when appropriate for authenticity
-- ✅ Be accurate and precise, avoiding speculation beyond documented information
-- ✅ If information is not available in the documents, clearly state this limitation
-- ✅ Maintain professional and authoritative tone appropriate for government policy discussions
-## Context Information
-Based on the following retrieved documents from METI committee meetings:
-
-{context}
-
-## User Question
-{question}
-
-## Response
-Please provide a comprehensive answer following the guidelines above
-
-**IMPORTANT: If the {question} is written in English, answer the {question} in English. If the {question} is written in Japanese, answer it in Japanese as from the documents."""
-
-SIMPLE_PROMPT = """
-You are a METI energy policy expert with access to official 2025 committee meeting documents.
-You will answer questions based only on the provided context.
-
-=== CONTEXT ===
-{context}
-
-=== USER QUESTION ===
-{question}
-
-=== INSTRUCTIONS ===
-- Answer using only the above context
-- Cite specific committee names and meeting numbers where possible
-- Include Japanese terminology for technical terms when appropriate
-- Maintain a formal, policy-expert tone
-- ⚠️ VERY IMPORTANT: If the user question is written in **English**, respond in **English**.  
-  If the user question is written in **Japanese**, respond in **Japanese** based on the documents.
-- If no information is found in the context, explicitly say: "The provided documents do not contain information related to this question."
-
-=== ANSWER ===
-"""
-
-@st.cache_resource
-def initialize_rag_system():
-    """Initialize the RAG system with caching"""
-    try:
-        
-        # AWS + Pinecone Configs
-        AWS_REGION = st.secrets["AWS_REGION"]
-        PINECONE_API_KEY = st.secrets["PINECONE_API_KEY"]
-        PINECONE_INDEX_NAME = st.secrets["PINECONE_INDEX_NAME"]
-        PINECONE_NAMESPACE = st.secrets["PINECONE_NAMESPACE"]
-        
-        # Validate environment variables
-        if not all([AWS_REGION, PINECONE_API_KEY, PINECONE_INDEX_NAME]):
-            st.error("Missing required environment variables. Please check your .env file.")
-            return None
-        
-        # Initialize Pinecone
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-        index = pc.Index(PINECONE_INDEX_NAME)
-        
-        # Initialize embeddings
-        embedding = BedrockEmbeddings(
-            model_id="amazon.titan-embed-text-v2:0",
-            region_name=AWS_REGION
-        )
-        
-        # Initialize vector store
-        vectorstore = PineconeVectorStore(
-            index=index,
-            embedding=embedding,
-            text_key="text",
-            namespace=os.getenv("PINECONE_NAMESPACE")
-        )
-        
-        # Initialize LLM
-        llm = ChatBedrock(
-            model_id="anthropic.claude-3-haiku-20240307-v1:0",
-            region_name=AWS_REGION
-        )
-        
-        return {
-            'vectorstore': vectorstore,
-            'llm': llm,
-            'pc': pc,
-            'index': index
-        }
-        
-    except Exception as e:
-        st.error(f"Error initializing RAG system: {str(e)}")
-        return None
-
-def create_qa_chain(rag_system, prompt_type="comprehensive", retrieval_k=5):
-    """Create QA chain with specified prompt type"""
+def create_qa_chain(rag_system, prompt_type="comprehensive", retrieval_k=5, committee=None, question=None):
+    """Get the shared QA chain for the specified prompt type (and the language variant for question)"""
     try:
-        if prompt_type == "comprehensive":
-            template = COMPREHENSIVE_PROMPT
-        else:
-            template = SIMPLE_PROMPT
-        
-        prompt = PromptTemplate(
-            template=template,
-            input_variables=["context", "question"]
-        )
-        
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=rag_system['llm'],
-            chain_type="stuff",
-            retriever=rag_system['vectorstore'].as_retriever(search_kwargs={"k": retrieval_k}),
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": prompt}
-        )
-        
-        return qa_chain
+        options = rag_system['router'].route(question).chain_options() if question else {}
+        if committee:
+            options['committee'] = committee
+        return rag_system['chains'].get(prompt_type, retrieval_k, **options)
     
     except Exception as e:
         st.error(f"Error creating QA chain: {str(e)}")
         return None
 
-def query_system(question, prompt_type="comprehensive", retrieval_k=5):
-    """Query the RAG system"""
+class StreamingAnswerRenderer:
+    """Render retrieved sources and answer tokens as the query engine produces them"""
+    
+    def __init__(self, sources_placeholder, answer_placeholder):
+        self.sources_placeholder = sources_placeholder
+        self.answer_placeholder = answer_placeholder
+        self.answer = ""
+    
+    def show_sources(self, documents):
+        # Show sources before generation starts
+        lines = [f"**{get_text('retrieved_sources')}**"]
+        for i, doc in enumerate(documents):
+            metadata = doc.metadata or {}
+            s3_uri = metadata.get('x-amz-bedrock-kb-source-uri', metadata.get('source', ''))
+            filename = s3_uri.split("/")[-1] if s3_uri else f"Document {i+1}"
+            page_number = metadata.get('x-amz-bedrock-kb-page-number')
+            lines.append(f"- 📄 {filename}" + (f" (Page {page_number})" if page_number else ""))
+        self.sources_placeholder.markdown("\n".join(lines))
+    
+    def add_token(self, token):
+        self.answer += token
+        self.answer_placeholder.markdown(self.answer + "▌")
+    
+    def finish(self):
+        self.answer_placeholder.markdown(self.answer)
+
+def query_system(question, prompt_type="comprehensive", retrieval_k=5, committee=None):
+    """Query the RAG system, streaming the answer as it is generated"""
     try:
         if not st.session_state.rag_system:
             st.error("RAG system not initialized. Please check your configuration.")
             return None
         
-        qa_chain = create_qa_chain(st.session_state.rag_system, prompt_type, retrieval_k)
-        if not qa_chain:
+        rag_system = st.session_state.rag_system
+        start_time = time.perf_counter()
+        
+        # Example questions are answered from the precomputed artifact
+        precomputed = get_example_answers().get(question, prompt_type, retrieval_k, committee)
+        if precomputed:
+            st.info(get_text("precomputed_answer"))
+            precomputed['cache_hit'] = 'precomputed'
+            precomputed['timings'] = {'total': time.perf_counter() - start_time}
+            precomputed['trace'] = None
+            return precomputed
+        
+        # Serve repeated and near-duplicate questions from the answer cache (partitioned by the routed language)
+        language = rag_system['router'].route(question).language
+        answer_cache = get_answer_cache()
+        answer_cache.check_corpus_version(rag_system['corpus_version'])
+        # Timed, so the query trace's embedding span is this call rather than the retriever's cache hit
+        embed_question = TimedCall(rag_system['embedding'].embed_query)
+        cached, hit_type, query_embedding = answer_cache.get(
+            question, prompt_type, retrieval_k, embed_fn=embed_question, committee=committee,
+            language=language
+        )
+        if cached:
+            st.info(get_text("cached_answer"))
+            cached['cache_hit'] = hit_type
+            cached['timings'] = {'total': time.perf_counter() - start_time}
+            cached['trace'] = None
+            return cached
+        
+        # Make sure the chain builds before queueing (surfaces errors in the UI)
+        if not create_qa_chain(rag_system, prompt_type, retrieval_k, committee, question):
             return None
         
+        sources_placeholder = st.empty()
+        answer_placeholder = st.empty()
+        renderer = StreamingAnswerRenderer(sources_placeholder, answer_placeholder)
+        
+        result = None
         with st.spinner(get_text("searching")):
-            result = qa_chain.invoke({"query": question})
+            events = get_query_engine().stream(
+                question, prompt_type, retrieval_k, session_id=st.session_state.session_id, committee=committee,
+                embedded=embed_question.interval
+            )
+            for event, payload in events:
+                if event == "sources":
+                    renderer.show_sources(payload)
+                elif event == "token":
+                    renderer.add_token(payload)
+                elif event == "done":
+                    result = payload
+        renderer.finish()
         
+        # A stream that ends without "done" leaves nothing to cache
+        if result is not None:
+            answer_cache.put(question, prompt_type, retrieval_k, result, query_embedding, committee=committee,
+                             language=language)
         return result
     
     except Exception as e:
@@ -934,16 +923,21 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
+    # Shared resources are warmed up once per process (serve.py starts it before the first session)
+    warmup = get_warmup()
+    
     # Initialize system
     if not st.session_state.system_initialized:
         with st.spinner(get_text("initializing")):
-            st.session_state.rag_system = initialize_rag_system()
-            if st.session_state.rag_system:
-                st.session_state.system_initialized = True
-                st.success(get_text("system_initialized"))
-            else:
+            try:
+                st.session_state.rag_system = initialize_rag_system()
+            except Exception as e:
+                # Not cached, so the next run tries again
+                st.error(f"Error initializing RAG system: {str(e)}")
                 st.error(get_text("system_failed"))
                 st.stop()
+            st.session_state.system_initialized = True
+            st.success(get_text("system_initialized"))
     
     # Sidebar
     with st.sidebar:
@@ -966,6 +960,25 @@ def main():
             help=get_text("retrieval_help")
         )
         
+        # Optional committee filter (otherwise detected from the question), only when the corpus is tagged
+        committee = None
+        if scoping_enabled(st.session_state.rag_system['vectorstore']):
+            committee = st.selectbox(
+                get_text("committee_filter"),
+                [None] + [committee.key for committee in COMMITTEES],
+                format_func=lambda key: get_text("all_committees") if key is None else (
+                    COMMITTEES_BY_KEY[key].name_en if st.session_state.language == "en" else COMMITTEES_BY_KEY[key].name_ja
+                ),
+                help=get_text("committee_filter_help")
+            )
+        
+        # Optional per-stage timing breakdown in Query Details
+        st.checkbox(
+            get_text("show_timing_panel"),
+            key="show_timing_panel",
+            help=get_text("timing_panel_help")
+        )
+        
         st.markdown("---")
         
         # Committee information
@@ -1023,33 +1036,39 @@ def main():
         # Query button
         col_btn1, col_btn2, col_btn3 = st.columns([1, 2, 1])
         with col_btn2:
-            if st.button(get_text("search_button"), type="primary", use_container_width=True):
-                if question.strip():
-                    # Record query time
-                    query_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # Query the system
-                    result = query_system(question, prompt_type, retrieval_k)
+            search_clicked = st.button(get_text("search_button"), type="primary", use_container_width=True)
+        
+        # Run the query outside the button column so the streamed answer uses the full width
+        if search_clicked:
+            if question.strip():
+                # Record query time
+                query_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                
+                # Query the system
+                result = query_system(question, prompt_type, retrieval_k, committee)
+                
+                if result:
+                    # Add to chat history
+                    st.session_state.chat_history.append(HistoryEntry.from_result(
+                        result,
+                        get_document_store(),
+                        question=question,
+                        timestamp=query_time,
+                        prompt_type=prompt_type,
+                        retrieval_k=retrieval_k,
+                        language=st.session_state.language
+                    ))
+                    st.session_state.history_page = 0
                     
-                    if result:
-                        # Add to chat history
-                        st.session_state.chat_history.append({
-                            'question': question,
-                            'answer': result['result'],
-                            'source_documents': result['source_documents'],
-                            'timestamp': query_time,
-                            'prompt_type': prompt_type,
-                            'retrieval_k': retrieval_k,
-                            'language': st.session_state.language
-                        })
-                        
-                        st.success(get_text("query_success"))
+                    st.success(get_text("query_success"))
+                    # Cached and precomputed answers are shown right away
+                    if not result.get('cache_hit'):
                         time.sleep(0.5)
-                        st.rerun()
-                    else:
-                        st.error(get_text("query_failed"))
+                    st.rerun()
                 else:
-                    st.warning(get_text("enter_question"))
+                    st.error(get_text("query_failed"))
+            else:
+                st.warning(get_text("enter_question"))
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -1065,15 +1084,29 @@ def main():
                 <p>{get_text("system_operational")}</p>
             </div>
             """, unsafe_allow_html=True)
+        if not warmup.ready:
+            st.caption(get_text("warming_up"))
         
         # Query statistics
-        total_queries = len(st.session_state.chat_history)
+        total_queries = st.session_state.chat_history.total_queries
         st.metric(get_text("total_queries"), total_queries)
         
         if st.session_state.chat_history:
-            latest_query = st.session_state.chat_history[-1]['timestamp']
+            latest_query = st.session_state.chat_history.latest().timestamp
             st.metric(get_text("last_query"), latest_query)
         
+        cache_stats = get_answer_cache().stats()
+        st.metric(get_text("cache_hit_rate"), f"{cache_stats['hit_rate']:.0%}")
+        
+        if st.session_state.rag_system:
+            embedding_stats = st.session_state.rag_system['embedding'].stats()
+            st.metric(get_text("embedding_cache_hit_rate"), f"{embedding_stats['hit_rate']:.0%}")
+        
+        store_stats = get_document_store().stats()
+        st.metric(get_text("shared_documents"), store_stats['documents'],
+                  help=get_text("shared_documents_help").format(
+                      size=store_stats['bytes'] / 1024, saved=store_stats['bytes_saved'] / 1024))
+        
         st.markdown('</div>', unsafe_allow_html=True)
     
     # Display results
@@ -1083,13 +1116,14 @@ def main():
         st.header(get_text("query_results"))
         
         # Display latest result
-        latest = st.session_state.chat_history[-1]
+        latest = st.session_state.chat_history.latest()
+        source_documents = latest.source_documents()
         
         # Question
         st.subheader(get_text("question_label"))
         st.markdown(f"""
         <div class="question-box">
-            {latest['question']}
+            {latest.question}
         </div>
         """, unsafe_allow_html=True)
         
@@ -1097,24 +1131,26 @@ def main():
         st.subheader(get_text("answer_label"))
         st.markdown(f"""
         <div class="answer-box">
-            {latest['answer']}
+            {latest.answer}
         </div>
         """, unsafe_allow_html=True)
         
         # Source documents
-        if latest['source_documents']:
+        if source_documents:
             st.subheader(get_text("source_documents"))
             
-            for i, doc in enumerate(latest['source_documents']):
+            # Presign every source of this answer in one batch
+            pdf_links = create_presigned_pdf_links(source_documents)
+            
+            for i, doc in enumerate(source_documents):
                 
                 #Extract metadata for link creation
                 metadata = doc.metadata if hasattr(doc, 'metadata') else {}
                 s3_uri = metadata.get('x-amz-bedrock-kb-source-uri', metadata.get('source', ''))
-                page_number = metadata.get('x-amz-bedrock-kb-page-number')
                 
                 #Create PDF link
                 if s3_uri and s3_uri.startswith("s3://"):
-                    pdf_link = create_presigned_pdf_link(s3_uri, page_number)
+                    pdf_link = pdf_links[i]
                     filename = s3_uri.split("/")[-1]
                 else:
                     pdf_link = "📄 Source document"
@@ -1143,43 +1179,96 @@ def main():
         with st.expander(f"🔍 {get_text('query_details')}", expanded=False):
             col_detail1, col_detail2, col_detail3 = st.columns(3)
             with col_detail1:
-                st.write(f"**{get_text('prompt_type')}** {latest['prompt_type']}")
+                st.write(f"**{get_text('prompt_type')}** {latest.prompt_type}")
             with col_detail2:
-                st.write(f"**{get_text('documents_retrieved')}** {latest['retrieval_k']}")
+                st.write(f"**{get_text('documents_retrieved')}** {latest.retrieval_k}")
             with col_detail3:
-                st.write(f"**{get_text('timestamp')}** {latest['timestamp']}")
+                st.write(f"**{get_text('timestamp')}** {latest.timestamp}")
+            
+            timings = latest.timings
+            if timings:
+                col_time1, col_time2, col_time3 = st.columns(3)
+                with col_time1:
+                    if 'retrieval' in timings:
+                        st.write(f"**{get_text('retrieval_time')}** {timings['retrieval']:.2f}s")
+                with col_time2:
+                    if 'ttft' in timings:
+                        st.write(f"**{get_text('time_to_first_token')}** {timings['ttft']:.2f}s")
+                with col_time3:
+                    if 'generation' in timings:
+                        st.write(f"**{get_text('generation_time')}** {timings['generation']:.2f}s")
+            
+            trace = latest.trace
+            if trace and st.session_state.get('show_timing_panel'):
+                st.markdown(f"**{get_text('stage_timings')}**")
+                st.table([
+                    {
+                        get_text('stage'): span['name'],
+                        get_text('start_ms'): round(span['offset'] * 1000, 1),
+                        get_text('duration_ms'): round(span['duration'] * 1000, 1)
+                    }
+                    for span in trace['spans']
+                ])
+                estimated = f" {get_text('tokens_estimated')}" if trace['tokens_estimated'] else ""
+                st.write(f"**{get_text('prompt_tokens')}** {trace['prompt_tokens']}{estimated} · "
+                         f"**{get_text('completion_tokens')}** {trace['completion_tokens']}{estimated}")
+                if trace.get('cache_read_tokens'):
+                    st.write(f"**{get_text('cache_read_tokens')}** {trace['cache_read_tokens']}")
         
         st.markdown('</div>', unsafe_allow_html=True)
     
     # Chat history
-    if len(st.session_state.chat_history) > 1:
+    history = st.session_state.chat_history
+    if len(history) > 1:
         st.markdown("---")
         st.markdown(f'<div class="fade-in">', unsafe_allow_html=True)
         st.header(get_text("query_history"))
         
+        # Render one page of older queries at a time
+        page_size = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+        entries, pages = history.page(st.session_state.history_page, page_size)
+        st.session_state.history_page = min(st.session_state.history_page, pages - 1)
+        
         # Create tabs for better organization
-        if len(st.session_state.chat_history) > 3:
+        if len(history) > 3:
             # Show recent queries in a more compact format
-            for i, entry in enumerate(reversed(st.session_state.chat_history[:-1])):
-                query_num = len(st.session_state.chat_history) - i - 1
-                with st.expander(f"🔍 Query {query_num}: {entry['question'][:60]}...", expanded=False):
+            for query_num, entry in entries:
+                with st.expander(f"🔍 Query {query_num}: {entry.question[:60]}...", expanded=False):
                     col_hist1, col_hist2 = st.columns([3, 1])
                     with col_hist1:
-                        st.write(f"**{get_text('question_label')}** {entry['question']}")
+                        st.write(f"**{get_text('question_label')}** {entry.question}")
                         st.write(f"**{get_text('answer_label')}**")
-                        st.write(entry['answer'][:300] + "..." if len(entry['answer']) > 300 else entry['answer'])
+                        st.write(entry.answer[:300] + "..." if len(entry.answer) > 300 else entry.answer)
                     with col_hist2:
                         st.write(f"**{get_text('timestamp')}**")
-                        st.write(entry['timestamp'])
-                        st.write(f"**Language:** {'🇺🇸 EN' if entry.get('language', 'en') == 'en' else '🇯🇵 JA'}")
+                        st.write(entry.timestamp)
+                        st.write(f"**Language:** {'🇺🇸 EN' if entry.language == 'en' else '🇯🇵 JA'}")
         else:
             # Show all queries in detail
-            for i, entry in enumerate(reversed(st.session_state.chat_history[:-1])):
-                query_num = len(st.session_state.chat_history) - i - 1
-                with st.expander(f"Query {query_num}: {entry['question'][:50]}...", expanded=False):
-                    st.write(f"**{get_text('question_label')}** {entry['question']}")
-                    st.write(f"**{get_text('answer_label')}** {entry['answer']}")
-                    st.write(f"**{get_text('timestamp')}** {entry['timestamp']}")
+            for query_num, entry in entries:
+                with st.expander(f"Query {query_num}: {entry.question[:50]}...", expanded=False):
+                    st.write(f"**{get_text('question_label')}** {entry.question}")
+                    st.write(f"**{get_text('answer_label')}** {entry.answer}")
+                    st.write(f"**{get_text('timestamp')}** {entry.timestamp}")
+        
+        if pages > 1:
+            col_page1, col_page2, col_page3 = st.columns([1, 2, 1])
+            with col_page1:
+                if st.button(get_text("previous_page"), disabled=st.session_state.history_page == 0,
+                             use_container_width=True):
+                    st.session_state.history_page -= 1
+                    st.rerun()
+            with col_page2:
+                st.markdown(
+                    f"<div style='text-align: center'>{get_text('history_page')} "
+                    f"{st.session_state.history_page + 1} {get_text('history_of')} {pages}</div>",
+                    unsafe_allow_html=True
+                )
+            with col_page3:
+                if st.button(get_text("next_page"), disabled=st.session_state.history_page >= pages - 1,
+                             use_container_width=True):
+                    st.session_state.history_page += 1
+                    st.rerun()
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -1189,7 +1278,8 @@ def main():
         col_clear1, col_clear2, col_clear3 = st.columns([1, 1, 1])
         with col_clear2:
             if st.button(get_text("clear_history"), use_container_width=True):
-                st.session_state.chat_history = []
+                st.session_state.chat_history.clear()
+                st.session_state.history_page = 0
                 st.success("✅ History cleared!" if st.session_state.language == "en" else "✅ 履歴をクリアしました！")
                 time.sleep(1)
                 st.rerun()
@@ -0,0 +1,226 @@
+"""Process-wide resources of the Streamlit app, shared by every session
+
+The clients, caches, chain registry and query engine are st.cache_resource
+functions, built once per server process. They live in this module rather
+than in app.py because st.cache_resource keys a function by its module:
+serve.py imports this module and warms the resources up before Streamlit
+serves the first session, and app.py then gets the same instances.
+"""
+import os
+from functools import partial
+
+import boto3
+import streamlit as st
+from dotenv import load_dotenv
+from langchain_aws import ChatBedrock
+from langchain_pinecone import PineconeVectorStore
+from pinecone import Pinecone
+
+from answer_cache import SemanticAnswerCache, namespace_fingerprint
+from chain_registry import ChainRegistry, build_qa_chain
+from context_packing import DEFAULT_TOKEN_BUDGET
+from document_store import DocumentStore
+from example_answers import DEFAULT_PATH as EXAMPLE_ANSWERS_PATH, EXAMPLE_QUESTIONS, ExampleAnswers
+from language_routing import router_from_env
+from lexical_index import with_lexical_search
+from local_index import LocalVectorStore
+from meti_retrieval_2 import build_embedding
+from presign_cache import PresignedUrlCache
+from prompts import build_prompt
+from query_engine import QueryEngine
+from query_scope import committee_filter, scoping_enabled, with_query_scope
+from rerank import with_reranking
+from tracing import tracer_from_env
+from warmup import query_path_steps, warmup_from_env
+
+# Load environment variables
+load_dotenv()
+
+
+@st.cache_resource
+def get_s3_client():
+    """Single S3 client shared by all sessions (boto3 clients are thread-safe)"""
+    return boto3.client(
+        's3', 
+        region_name=st.secrets["AWS_REGION"],
+        aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
+        aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"]
+    )
+
+def presign_pdf(bucket_name, object_key, expiration):
+    """Generate a presigned URL that opens the PDF inline"""
+    return get_s3_client().generate_presigned_url(
+        'get_object',
+         Params={
+             'Bucket': bucket_name, 
+             'Key': object_key,
+             'ResponseContentDisposition': 'inline',
+             'ResponseContentType': 'application/pdf'
+        },
+        ExpiresIn=expiration
+    )
+
+@st.cache_resource
+def get_presigned_url_cache():
+    """Presigned URLs shared across reruns and sessions, refreshed well before they expire"""
+    return PresignedUrlCache(presign_pdf)
+
+@st.cache_resource
+def initialize_rag_system():
+    """Initialize the RAG system with caching
+
+    Errors are raised rather than reported here: this also runs on the
+    warm-up thread, where st.error would be dropped, and st.cache_resource
+    does not cache an exception, so the next session tries again.
+    """
+    # AWS + Pinecone Configs
+    AWS_REGION = st.secrets["AWS_REGION"]
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+    
+    # Titan embeddings behind the adaptive request limit and the query-embedding cache
+    embedding = build_embedding(AWS_REGION)
+    
+    if VECTOR_BACKEND == "local":
+        # In-process index loaded from a Pinecone namespace snapshot
+        pc, index, namespace = None, None, None
+        vectorstore = LocalVectorStore.from_snapshot(
+            os.getenv("LOCAL_INDEX_PATH"),
+            embedding,
+            mode=os.getenv("LOCAL_INDEX_MODE", "exact")
+        )
+        corpus_version = vectorstore.fingerprint
+    else:
+        PINECONE_API_KEY = st.secrets["PINECONE_API_KEY"]
+        PINECONE_INDEX_NAME = st.secrets["PINECONE_INDEX_NAME"]
+        PINECONE_NAMESPACE = st.secrets["PINECONE_NAMESPACE"]
+        
+        # Validate environment variables
+        if not all([AWS_REGION, PINECONE_API_KEY, PINECONE_INDEX_NAME]):
+            raise RuntimeError("Missing required environment variables. Please check your .env file.")
+        
+        # Initialize Pinecone
+        pc = Pinecone(api_key=PINECONE_API_KEY)
+        index = pc.Index(PINECONE_INDEX_NAME)
+        
+        # Initialize vector store
+        namespace = os.getenv("PINECONE_NAMESPACE")
+        vectorstore = PineconeVectorStore(
+            index=index,
+            embedding=embedding,
+            text_key="text",
+            namespace=namespace
+        )
+        corpus_version = partial(namespace_fingerprint, index, namespace)
+    
+    dense_vectorstore = vectorstore
+    
+    # Fuse dense results with a BM25 index of the snapshot (exact committee names, meeting numbers)
+    lexical_path = os.getenv("LEXICAL_INDEX_PATH", os.getenv("LOCAL_INDEX_PATH", "") if VECTOR_BACKEND == "local" else "")
+    if lexical_path and os.getenv("HYBRID_SEARCH", "1").lower() in ("1", "true", "yes"):
+        vectorstore = with_lexical_search(vectorstore, lexical_path)
+    
+    # Fetch RERANK_FETCH_K candidates and keep the reranker's top k (RERANKER=none to disable)
+    vectorstore = with_reranking(vectorstore)
+    
+    # Restrict searches to the committees and meetings named in the question (tagged corpora only)
+    vectorstore = with_query_scope(vectorstore, probe=dense_vectorstore)
+    
+    # Initialize LLM
+    llm = ChatBedrock(
+        model_id=os.getenv("BEDROCK_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0"),
+        region_name=AWS_REGION,
+        streaming=True
+    )
+    
+    rag_system = {
+        'vectorstore': vectorstore,
+        'embedding': embedding,
+        'llm': llm,
+        'pc': pc,
+        'index': index,
+        'namespace': namespace,
+        'corpus_version': corpus_version
+    }
+    
+    # Route each question to a single-language prompt (LANGUAGE_ROUTING=0 keeps the bilingual one)
+    rag_system['router'] = router_from_env()
+    
+    # QA chains are compiled once per (prompt_type, k, language, committee) and shared by all sessions
+    rag_system['chains'] = ChainRegistry(partial(build_chain, rag_system))
+    
+    return rag_system
+
+@st.cache_resource
+def get_answer_cache():
+    """Process-wide answer cache shared by all sessions"""
+    return SemanticAnswerCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256")),
+        ttl_seconds=int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+    )
+
+def build_chain(rag_system, prompt_type="comprehensive", retrieval_k=5, language=None, committee=None):
+    """Build the QA chain for a prompt type, language variant and committee filter (called once per registry key)"""
+    prompt = build_prompt(prompt_type, language=language)
+    
+    return build_qa_chain(
+        rag_system['llm'], rag_system['vectorstore'], prompt, retrieval_k,
+        token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", str(DEFAULT_TOKEN_BUDGET))),
+        # Committee filters need a tagged corpus (untagged chunks would match nothing)
+        metadata_filter=committee_filter(committee) if scoping_enabled(rag_system['vectorstore']) else None
+    )
+
+@st.cache_resource
+def get_example_answers():
+    """Precomputed example answers, optionally rebuilt in the background when the corpus or prompts change"""
+    return ExampleAnswers(
+        os.getenv("EXAMPLE_ANSWERS_PATH", EXAMPLE_ANSWERS_PATH),
+        initialize_rag_system(),
+        refresh=os.getenv("EXAMPLE_ANSWERS_REFRESH", "").lower() in ("1", "true", "yes")
+    )
+
+@st.cache_resource
+def get_document_store():
+    """Interned retrieved chunks referenced by every session's history"""
+    return DocumentStore()
+
+@st.cache_resource
+def get_tracer():
+    """Per-stage tracer shared by all sessions (exporters and /metrics endpoint configured by env)"""
+    return tracer_from_env()
+
+@st.cache_resource
+def get_query_engine():
+    """Query engine shared by all sessions, so concurrent questions share upstream capacity"""
+    return QueryEngine(
+        initialize_rag_system(),
+        max_concurrent_queries=int(os.getenv("ENGINE_MAX_CONCURRENT_QUERIES", "16")),
+        stage_limits={
+            'embedding': int(os.getenv("ENGINE_EMBEDDING_LIMIT", "8")),
+            'retrieval': int(os.getenv("ENGINE_RETRIEVAL_LIMIT", "8")),
+            'generation': int(os.getenv("ENGINE_GENERATION_LIMIT", "4"))
+        },
+        tracer=get_tracer()
+    ).start()
+
+def _open_s3():
+    # Creating the client loads botocore's S3 service model, which takes a noticeable fraction of a second
+    get_s3_client()
+    return get_presigned_url_cache().stats()
+
+@st.cache_resource
+def get_warmup():
+    """Warm-up of the shared resources, started once per process (serve.py starts it before the first session)"""
+    questions = [question for language_questions in EXAMPLE_QUESTIONS.values() for question in language_questions]
+    return warmup_from_env(query_path_steps(
+        initialize_rag_system,
+        questions,
+        get_answer_cache=get_answer_cache,
+        get_example_answers=get_example_answers,
+        generate=os.getenv("WARMUP_LLM", "1").lower() in ("1", "true", "yes"),
+        extra_steps=[
+            ("query_engine", lambda results: get_query_engine().stats()),
+            ("s3", lambda results: _open_s3()),
+            ("document_store", lambda results: get_document_store().stats()),
+        ]
+    )).start()
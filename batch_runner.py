@@ -0,0 +1,257 @@
+"""Headless, parallel batch runner for regression-testing policy questions
+
+Reads questions from JSONL ({"id", "question", "prompt_type", "retrieval_k"},
+only "question" required) or CSV (a "question" column, the other columns
+optional), runs them concurrently and appends one JSON line per question to
+the output file with the answer, sources and per-stage latencies.
+
+Re-running with the same output file resumes: questions that already have a
+successful result are skipped.
+
+    python batch_runner.py questions.jsonl --out results.jsonl --workers 8
+    python batch_runner.py questions.csv --out results.jsonl --mode threads --workers 4
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from language_routing import router_of
+from query_engine import QueryEngine
+from retry import backoff_delay, is_throttling_error
+
+DEFAULT_MAX_RETRIES = 5
+
+
+def question_id(question, prompt_type, retrieval_k):
+    return hashlib.sha1(f"{prompt_type}\x00{retrieval_k}\x00{question}".encode("utf-8")).hexdigest()[:12]
+
+
+def load_questions(path, prompt_type="comprehensive", retrieval_k=5):
+    """Read questions from a JSONL or CSV file"""
+    if path.endswith(".csv"):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    items = []
+    for row in rows:
+        question = (row.get("question") or "").strip()
+        if not question:
+            continue
+        item_prompt_type = row.get("prompt_type") or prompt_type
+        item_k = int(row.get("retrieval_k") or retrieval_k)
+        items.append({
+            "id": str(row.get("id") or question_id(question, item_prompt_type, item_k)),
+            "question": question,
+            "prompt_type": item_prompt_type,
+            "retrieval_k": item_k,
+        })
+    return items
+
+
+def load_completed_ids(output_path):
+    """Ids that already have a successful result in the output file"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut off by an interruption
+                continue
+            if not record.get("error"):
+                completed.add(record["id"])
+    return completed
+
+
+def summarize_sources(documents, preview_chars=200):
+    sources = []
+    for doc in documents:
+        metadata = doc.metadata or {}
+        sources.append({
+            "source_uri": metadata.get("x-amz-bedrock-kb-source-uri", metadata.get("source")),
+            "page": metadata.get("x-amz-bedrock-kb-page-number"),
+            "preview": doc.page_content[:preview_chars],
+        })
+    return sources
+
+
+class _StageTimer(BaseCallbackHandler):
+    """Record retrieval and generation timings of a synchronous chain run"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+
+    def on_retriever_start(self, serialized, query, **kwargs):
+        self.marks.setdefault("retrieval_start", time.perf_counter())
+
+    def on_retriever_end(self, documents, **kwargs):
+        self.marks["retrieval_end"] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.marks.setdefault("generation_start", time.perf_counter())
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.marks.setdefault("first_token", time.perf_counter())
+
+    def on_llm_end(self, response, **kwargs):
+        self.marks["generation_end"] = time.perf_counter()
+
+    def timings(self):
+        marks = self.marks
+        timings = {"total": time.perf_counter() - self.start}
+        if "retrieval_end" in marks:
+            timings["retrieval"] = marks["retrieval_end"] - marks["retrieval_start"]
+        if "generation_end" in marks:
+            timings["generation"] = marks["generation_end"] - marks["generation_start"]
+        if "first_token" in marks:
+            timings["ttft"] = marks["first_token"] - self.start
+        return timings
+
+
+class _ResultWriter:
+    """Append results to the JSONL output, one flushed line per question"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _record(item, result=None, error=None, attempts=1):
+    record = dict(item)
+    record["attempts"] = attempts
+    if result is not None:
+        record["answer"] = result["result"]
+        record["sources"] = summarize_sources(result["source_documents"])
+        record["timings"] = result.get("timings", {})
+        record["error"] = None
+    else:
+        record["error"] = f"{type(error).__name__}: {error}"
+    return record
+
+
+def _run_threaded(rag_system, items, writer, workers, max_retries):
+    def run_one(item):
+        route = router_of(rag_system).route(item["question"])
+        chain = rag_system["chains"].get(item["prompt_type"], item["retrieval_k"], **route.chain_options())
+        for attempt in range(max_retries + 1):
+            timer = _StageTimer()
+            try:
+                result = chain.invoke({"query": item["question"]}, config={"callbacks": [timer]})
+                result["timings"] = timer.timings()
+                return _record(item, result, attempts=attempt + 1)
+            except Exception as e:
+                if attempt == max_retries or not is_throttling_error(e):
+                    return _record(item, error=e, attempts=attempt + 1)
+                time.sleep(backoff_delay(attempt))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_one, item) for item in items]
+        for future in as_completed(futures):
+            record = future.result()
+            writer.write(record)
+            yield record
+
+
+def _run_async(rag_system, items, writer, workers, max_retries):
+    engine = QueryEngine(rag_system, max_concurrent_queries=workers, tracer=rag_system.get('tracer'))
+
+    async def run_one(item):
+        for attempt in range(max_retries + 1):
+            try:
+                result = await engine.aquery(item["question"], item["prompt_type"], item["retrieval_k"],
+                                             session_id="batch")
+                return _record(item, result, attempts=attempt + 1)
+            except Exception as e:
+                if attempt == max_retries or not is_throttling_error(e):
+                    return _record(item, error=e, attempts=attempt + 1)
+                await asyncio.sleep(backoff_delay(attempt))
+
+    futures = [engine.schedule(run_one(item)) for item in items]
+    try:
+        for future in as_completed(futures):
+            record = future.result()
+            writer.write(record)
+            yield record
+    finally:
+        engine.stop()
+
+
+def run_batch(rag_system, items, output_path, mode="async", workers=4, max_retries=DEFAULT_MAX_RETRIES,
+              resume=True):
+    """Run questions concurrently and append results to output_path
+
+    Returns a summary dict. With resume=True, items whose id already has a
+    successful record in output_path are skipped.
+    """
+    completed = load_completed_ids(output_path) if resume else set()
+    pending = [item for item in items if item["id"] not in completed]
+    print(f"🧪 Running {len(pending)} questions ({len(items) - len(pending)} already done) "
+          f"with {workers} {mode} workers")
+
+    runner = _run_async if mode == "async" else _run_threaded
+    writer = _ResultWriter(output_path)
+    start = time.perf_counter()
+    succeeded = failed = 0
+    try:
+        for record in runner(rag_system, pending, writer, workers, max_retries):
+            if record["error"]:
+                failed += 1
+                print(f"❌ [{record['id']}] {record['error']}")
+            else:
+                succeeded += 1
+                print(f"✅ [{record['id']}] {record['timings'].get('total', 0):.2f}s "
+                      f"{record['question'][:60]}")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\n✅ Batch completed: {succeeded} succeeded, {failed} failed in {elapsed:.1f}s")
+    return {"succeeded": succeeded, "failed": failed, "skipped": len(items) - len(pending), "elapsed": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="JSONL or CSV file with questions")
+    parser.add_argument("--out", required=True, help="JSONL results file (appended to, used for resume)")
+    parser.add_argument("--mode", choices=("async", "threads"), default="async")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--prompt-type", choices=("comprehensive", "simple"), default="comprehensive")
+    parser.add_argument("--retrieval-k", type=int, default=5)
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument("--no-resume", action="store_true", help="Run every question even if already done")
+    args = parser.parse_args()
+
+    from meti_retrieval_2 import get_rag_system
+
+    rag_system = get_rag_system()
+
+    items = load_questions(args.questions, args.prompt_type, args.retrieval_k)
+    run_batch(rag_system, items, args.out, mode=args.mode, workers=args.workers,
+              max_retries=args.max_retries, resume=not args.no_resume)
+
+
+if __name__ == "__main__":
+    main()
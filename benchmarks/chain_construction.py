@@ -0,0 +1,65 @@
+"""Micro-benchmark: per-query QA chain construction vs. the shared ChainRegistry
+
+Runs entirely offline with LangChain's fake LLM, fake embeddings and the
+in-memory vector store, so only chain construction overhead is measured.
+
+    python benchmarks/chain_construction.py --iterations 2000
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListLLM
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from chain_registry import ChainRegistry, build_qa_chain
+from prompts import PROMPT_TYPES, build_prompt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    llm = FakeListLLM(responses=["ok"])
+    vectorstore = InMemoryVectorStore(DeterministicFakeEmbedding(size=1024))
+
+    def build(prompt_type, retrieval_k):
+        return build_qa_chain(llm, vectorstore, build_prompt(prompt_type), retrieval_k)
+
+    registry = ChainRegistry(build)
+    settings = [(prompt_type, k) for prompt_type in PROMPT_TYPES for k in range(1, 11)]
+
+    def per_query(i):
+        return build(*settings[i % len(settings)])
+
+    def shared(i):
+        return registry.get(*settings[i % len(settings)])
+
+    print(f"🧪 Chain construction benchmark ({args.iterations} queries, {len(settings)} settings)")
+    print("=" * 60)
+    for label, fn in (("per-query build", per_query), ("chain registry", shared)):
+        start = time.perf_counter()
+        for i in range(args.iterations):
+            fn(i)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(fn, range(args.iterations)))
+        threaded = time.perf_counter() - start
+
+        print(f"{label:>16}: {serial / args.iterations * 1e6:9.1f} µs/query serial, "
+              f"{threaded / args.iterations * 1e6:9.1f} µs/query with {args.threads} threads")
+
+    print(f"\n✅ Registry holds {len(registry)} chains")
+
+
+if __name__ == "__main__":
+    main()
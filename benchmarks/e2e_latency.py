@@ -0,0 +1,272 @@
+"""End-to-end latency benchmark for the app.py and meti_retrieval_2.py query paths
+
+Bedrock, Pinecone and S3 are replaced by the local stand-ins in
+stand_ins.py, each with a configurable latency, so runs are offline and
+repeatable. For every (path, concurrency, k) cell the benchmark reports
+p50/p95/p99 latency, mean time to first token (app path) and throughput,
+and writes them to a JSON file that can be compared between commits:
+
+    python benchmarks/e2e_latency.py --out results/head.json
+    python benchmarks/e2e_latency.py --out results/branch.json --compare results/head.json
+
+Paths:
+    app   answer cache lookup -> QueryEngine.stream (one Streamlit session per
+          worker thread) -> batched presigned PDF links, as in query_system
+    meti  answer cache lookup -> registry chain invoke, as in query_meti_committees
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from context_packing import DEFAULT_TOKEN_BUDGET
+from language_routing import router_of
+from presign_cache import parse_s3_uri
+from query_engine import QueryEngine
+from stand_ins import build_answer_cache, build_presigned_url_cache, build_rag_system, make_questions
+from tracing import TimedCall
+
+PATHS = ("app", "meti")
+
+
+def parse_int_list(value):
+    """Parse "1,4,16" or a range "1-10" into a list of ints"""
+    if "-" in value:
+        low, high = value.split("-")
+        return list(range(int(low), int(high) + 1))
+    return [int(part) for part in value.split(",")]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def source_links(url_cache, documents):
+    """Same batching as the app's create_presigned_pdf_links"""
+    items = []
+    for doc in documents:
+        s3_uri = doc.metadata.get('x-amz-bedrock-kb-source-uri', '')
+        if s3_uri.startswith("s3://"):
+            bucket_name, object_key = parse_s3_uri(s3_uri)
+            if object_key:
+                items.append((bucket_name, object_key))
+    return url_cache.get_many(items)
+
+
+class AppPath:
+    """query_system without Streamlit: answer cache, streamed engine query, source links"""
+
+    def __init__(self, rag_system, engine, answer_cache, url_cache):
+        self.rag_system = rag_system
+        self.engine = engine
+        self.answer_cache = answer_cache
+        self.url_cache = url_cache
+        self._sessions = threading.local()
+
+    def __call__(self, question, prompt_type, retrieval_k):
+        # One session per worker thread, like one browser tab per concurrent user
+        if not hasattr(self._sessions, "id"):
+            self._sessions.id = uuid.uuid4().hex
+        start = time.perf_counter()
+        language = router_of(self.rag_system).route(question).language
+        embed_question = TimedCall(self.rag_system['embedding'].embed_query)
+        cached, _, query_embedding = self.answer_cache.get(
+            question, prompt_type, retrieval_k, embed_fn=embed_question, language=language
+        )
+        if cached:
+            return {"latency": time.perf_counter() - start, "ttft": time.perf_counter() - start, "cached": True}
+
+        ttft = None
+        events = self.engine.stream(question, prompt_type, retrieval_k, session_id=self._sessions.id,
+                                    embedded=embed_question.interval)
+        for event, payload in events:
+            if event == "token" and ttft is None:
+                ttft = time.perf_counter() - start
+            elif event == "sources":
+                source_links(self.url_cache, payload)
+            elif event == "done":
+                result = payload
+        self.answer_cache.put(question, prompt_type, retrieval_k, result, query_embedding, language=language)
+        return {"latency": time.perf_counter() - start, "ttft": ttft, "cached": False}
+
+
+class MetiPath:
+    """query_meti_committees without the printing"""
+
+    def __init__(self, rag_system, answer_cache):
+        self.rag_system = rag_system
+        self.answer_cache = answer_cache
+
+    def __call__(self, question, prompt_type, retrieval_k):
+        start = time.perf_counter()
+        language = router_of(self.rag_system).route(question).language
+        cached, _, query_embedding = self.answer_cache.get(
+            question, prompt_type, retrieval_k, embed_fn=self.rag_system['embedding'].embed_query, language=language
+        )
+        if cached:
+            return {"latency": time.perf_counter() - start, "ttft": None, "cached": True}
+        result = self.rag_system['chains'].get(prompt_type, retrieval_k).invoke({"query": question})
+        self.answer_cache.put(question, prompt_type, retrieval_k, result, query_embedding, language=language)
+        return {"latency": time.perf_counter() - start, "ttft": None, "cached": False}
+
+
+def summarize(samples, elapsed):
+    latencies = np.array([sample["latency"] for sample in samples])
+    ttfts = [sample["ttft"] for sample in samples if sample["ttft"] is not None]
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "queries": len(samples),
+        "cache_hits": sum(sample["cached"] for sample in samples),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "mean": float(latencies.mean()),
+        "ttft_mean": float(np.mean(ttfts)) if ttfts else None,
+        "throughput_qps": len(samples) / elapsed,
+    }
+
+
+def run_cell(query_fn, questions, prompt_type, retrieval_k, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda q: query_fn(q, prompt_type, retrieval_k), questions))
+    return summarize(samples, time.perf_counter() - start)
+
+
+def compare(results, baseline_path):
+    """Print p50/p95 changes against a previous results file"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["path"], r["concurrency"], r["k"]): r for r in baseline["results"]}
+
+    print(f"\n📊 Compared with {baseline_path} ({baseline['meta'].get('git_revision') or 'unknown revision'})")
+    print(f"{'path':>5} {'conc':>5} {'k':>3} {'p50':>10} {'p95':>10} {'qps':>10}")
+    for r in results:
+        old = previous.get((r["path"], r["concurrency"], r["k"]))
+        if old is None:
+            continue
+        change = lambda key: (r[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print(f"{r['path']:>5} {r['concurrency']:>5} {r['k']:>3} {change('p50'):>+9.1f}% {change('p95'):>+9.1f}% "
+              f"{change('throughput_qps'):>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paths", default=",".join(PATHS), help="Comma-separated query paths (app, meti)")
+    parser.add_argument("--concurrency", type=parse_int_list, default=[1, 4, 16])
+    parser.add_argument("--k", type=parse_int_list, default=list(range(1, 11)), help='e.g. "1-10" or "1,5,10"')
+    parser.add_argument("--queries", type=int, default=16, help="Queries per cell")
+    parser.add_argument("--repeat-fraction", type=float, default=0.0,
+                        help="Fraction of queries that repeat an earlier question (answer cache hits)")
+    parser.add_argument("--prompt-type", choices=("comprehensive", "simple"), default="comprehensive")
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--retrieval-latency", type=float, default=0.03)
+    parser.add_argument("--ttft", type=float, default=0.3, help="LLM time to first token (s), before prefill")
+    parser.add_argument("--prefill-per-1k-tokens", type=float, default=0.1,
+                        help="Extra time to first token per 1000 prompt tokens (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--presign-latency", type=float, default=0.005)
+    parser.add_argument("--documents", type=int, default=2000, help="Corpus size")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help="Context token budget (0 stuffs all k chunks)")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    paths = [path.strip() for path in args.paths.split(",")]
+    stand_in_settings = {
+        "embedding_latency": args.embedding_latency,
+        "retrieval_latency": args.retrieval_latency,
+        "ttft": args.ttft,
+        "prefill_per_1k_tokens": args.prefill_per_1k_tokens,
+        "tokens_per_second": args.tokens_per_second,
+        "answer_tokens": args.answer_tokens,
+        "num_documents": args.documents,
+        "token_budget": args.token_budget,
+    }
+
+    print(f"🧪 End-to-end latency benchmark: paths={paths} concurrency={args.concurrency} k={args.k}")
+    print("=" * 60)
+
+    results = []
+    question_offset = 0
+    for path in paths:
+        if path == "app":
+            rag_system = build_rag_system(**stand_in_settings)
+            # Same limits and env variables as the app's get_query_engine
+            engine = QueryEngine(
+                rag_system,
+                max_concurrent_queries=int(os.getenv("ENGINE_MAX_CONCURRENT_QUERIES", "16")),
+                stage_limits={
+                    'embedding': int(os.getenv("ENGINE_EMBEDDING_LIMIT", "8")),
+                    'retrieval': int(os.getenv("ENGINE_RETRIEVAL_LIMIT", "8")),
+                    'generation': int(os.getenv("ENGINE_GENERATION_LIMIT", "4")),
+                }
+            ).start()
+            query_fn = AppPath(rag_system, engine, build_answer_cache(),
+                               build_presigned_url_cache(args.presign_latency))
+        elif path == "meti":
+            engine = None
+            rag_system = build_rag_system(**stand_in_settings)
+            query_fn = MetiPath(rag_system, build_answer_cache())
+        else:
+            parser.error(f"Unknown path: {path}")
+
+        try:
+            for concurrency in args.concurrency:
+                for retrieval_k in args.k:
+                    distinct = max(1, int(round(args.queries * (1 - args.repeat_fraction))))
+                    questions = make_questions(distinct, offset=question_offset)
+                    questions += questions[:args.queries - distinct]
+                    question_offset += distinct
+
+                    summary = run_cell(query_fn, questions, args.prompt_type, retrieval_k, concurrency)
+                    summary.update(path=path, concurrency=concurrency, k=retrieval_k)
+                    results.append(summary)
+                    print(f"{path:>5} conc={concurrency:<3} k={retrieval_k:<3} "
+                          f"p50={summary['p50'] * 1000:7.1f}ms p95={summary['p95'] * 1000:7.1f}ms "
+                          f"p99={summary['p99'] * 1000:7.1f}ms {summary['throughput_qps']:6.2f} q/s")
+        finally:
+            if engine is not None:
+                engine.stop()
+
+    output = {
+        "meta": {
+            "git_revision": git_revision(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "prompt_type": args.prompt_type,
+            "queries_per_cell": args.queries,
+            "repeat_fraction": args.repeat_fraction,
+            "presign_latency": args.presign_latency,
+            **stand_in_settings,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"\n✅ Wrote {len(results)} results to {args.out}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
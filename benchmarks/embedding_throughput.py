@@ -0,0 +1,87 @@
+"""Embedding throughput benchmark: sequential vs fixed vs adaptive concurrency
+
+Embeds a corpus of stand-in chunks through ThrottlingEmbeddings, a Titan
+stand-in that throttles above --capacity requests in flight. For each
+client the benchmark reports throughput, requests made, throttled
+requests and the concurrency limit it settled on:
+
+    sequential  BedrockEmbeddings as is: one request per text, in order
+    fixed       BatchedEmbeddings pinned at --concurrency (no adaptation)
+    adaptive    BatchedEmbeddings with AIMD up to --concurrency
+
+All three embed the same distinct texts, so the rows compare concurrency
+alone. With --duplicates, a last row feeds the adaptive client the corpus
+with its repeated texts (like boilerplate slide footers) to show what
+deduplication saves.
+
+    python benchmarks/embedding_throughput.py
+    python benchmarks/embedding_throughput.py --texts 2000 --capacity 6 --concurrency 32
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_batcher import AdaptiveConcurrency, BatchedEmbeddings
+from stand_ins import ThrottlingEmbeddings, make_corpus
+
+
+def make_texts(count, duplicate_fraction, seed=0):
+    """count texts of which about duplicate_fraction repeat another; every client embeds this same list"""
+    texts = [doc.page_content for doc in make_corpus(count)]
+    rng = random.Random(seed)
+    for i in rng.sample(range(count), int(count * duplicate_fraction)):
+        texts[i] = texts[rng.randrange(count)]
+    return texts
+
+
+def run(label, client, fake, texts):
+    start = time.perf_counter()
+    vectors = client.embed_documents(texts)
+    elapsed = time.perf_counter() - start
+    assert len(vectors) == len(texts)
+    stats = client.stats() if isinstance(client, BatchedEmbeddings) else {}
+    print(f"{label:>10} {len(texts):>6} {len(texts) / elapsed:>10.1f} {elapsed:>8.2f}s {fake.requests:>9} "
+          f"{fake.throttled:>10} {stats.get('concurrency_limit', 1):>7} {stats.get('peak_in_flight', 1):>6}")
+
+
+def batched(args, fixed=False):
+    fake = ThrottlingEmbeddings(latency=args.latency, capacity=args.capacity)
+    client = BatchedEmbeddings(fake, max_concurrency=args.concurrency, base_delay=0.05, max_delay=1.0)
+    if fixed:
+        client.concurrency = AdaptiveConcurrency(args.concurrency, minimum=args.concurrency, maximum=args.concurrency)
+    return client, fake
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Fraction of texts that repeat another")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per request")
+    parser.add_argument("--capacity", type=int, default=8, help="Requests in flight before the fake throttles")
+    parser.add_argument("--concurrency", type=int, default=24, help="Most requests in flight for batched clients")
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts, args.duplicates)
+    distinct = list(dict.fromkeys(texts))
+    print(f"🧪 Embedding throughput ({len(distinct)} distinct texts, {len(texts)} with repeats, "
+          f"{args.latency * 1000:.0f}ms/request, throttled above {args.capacity} in flight)")
+    print("=" * 77)
+    print(f"{'client':>10} {'texts':>6} {'texts/s':>10} {'elapsed':>9} {'requests':>9} {'throttled':>10} "
+          f"{'limit':>7} {'peak':>6}")
+
+    if not args.skip_sequential:
+        fake = ThrottlingEmbeddings(latency=args.latency, capacity=args.capacity)
+        run("sequential", fake, fake, distinct)
+
+    run("fixed", *batched(args, fixed=True), distinct)
+    run("adaptive", *batched(args), distinct)
+    if len(distinct) < len(texts):
+        run("repeats", *batched(args), texts)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Latency and quality benchmark: k-only retrieval vs. retrieve-many/rerank-few
+
+The corpus is the stand-in committee corpus. Each question asks about one
+(committee, topic) pair in paraphrase (a short committee name and a
+description of the topic rather than the words the chunks use), and a
+chunk is relevant when the (committee, topic) it was generated from
+matches, a label recorded in its metadata, not derived from its text or
+the question's words. Embeddings are
+hashed bags of lexical tokens mixed with per-text noise (--noise), so
+dense retrieval is informative but imperfect, like Titan on short
+questions. For each configuration the benchmark reports:
+
+    precision   fraction of the chunks passed to the chain that are relevant
+    mrr         reciprocal rank of the first relevant chunk
+    tokens      estimated tokens of the chunks passed to the chain
+    latency     retrieval (and reranking) time per query
+
+    python benchmarks/reranking.py
+    python benchmarks/reranking.py --fetch-k 50 --rerank-k 3,4 --noise 4
+    python benchmarks/reranking.py --reranker cross-encoder   # requires sentence-transformers
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from e2e_latency import parse_int_list
+from lexical_index import tokenize
+from local_index import LocalVectorStore
+from rerank import DEFAULT_FETCH_K, RerankedVectorStore, build_reranker
+from stand_ins import COMMITTEES, TOPICS, make_corpus
+from tracing import estimate_tokens
+
+
+class HashingEmbeddings(Embeddings):
+    """Feature-hashed token counts plus a deterministic noise vector of relative weight noise"""
+
+    def __init__(self, size=512, noise=2.5):
+        self.size = size
+        self.noise = noise
+
+    def _vector(self, text):
+        vector = np.zeros(self.size)
+        for token in tokenize(text):
+            vector[int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:4], "little") % self.size] += 1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        noise = np.random.default_rng(seed).standard_normal(self.size)
+        vector += self.noise * noise / np.linalg.norm(noise)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+# How a user might ask about each committee and topic without quoting the materials
+COMMITTEE_PARAPHRASES = {
+    "Subcommittee on Basic Electricity and Gas Policy": "the basic policy panel",
+    "Subcommittee on Large-Scale Introduction of Renewable Energy": "the renewables subcommittee",
+    "Next Generation Power System Working Group": "the future grid working group",
+    "Study Group on Next-Generation Distributed Power Systems": "the distributed resources study group",
+    "Watt Bit Collaboration Public-Private Forum": "the Watt Bit forum",
+    "Carbon Management Subcommittee": "the carbon management panel",
+    "Study Group on the Status of Simultaneous Markets": "the simultaneous markets study group",
+    "Committee on Adjustment Capacity and Supply-Demand Balance Evaluation": "the committee evaluating adjustment capacity",
+}
+TOPIC_PARAPHRASES = {
+    "capacity market": "the auction that secures future generation capacity",
+    "grid congestion": "transmission bottlenecks",
+    "offshore wind": "wind farms at sea",
+    "battery storage": "storing power in batteries",
+    "hydrogen co-firing": "burning hydrogen alongside fossil fuels",
+    "demand response": "consumers shifting their use at peak times",
+    "balancing market": "procuring reserves to balance supply and demand",
+    "data center demand": "the electricity needs of data centres",
+    "CCS": "capturing and storing CO2 underground",
+    "nuclear restart": "bringing reactors back online",
+}
+
+
+def make_labelled_corpus(num_documents):
+    """The stand-in corpus with each chunk's (committee, topic) label added to its metadata"""
+    corpus = make_corpus(num_documents)
+    for i, doc in enumerate(corpus):
+        # make_corpus assigns committee and topic round-robin by chunk number
+        doc.metadata = dict(doc.metadata, committee_label=COMMITTEES[i % len(COMMITTEES)],
+                            topic_label=TOPICS[i % len(TOPICS)])
+    return corpus
+
+
+def make_labelled_questions(corpus, count):
+    """(paraphrased question, committee, topic) for pairs that have at least one chunk in the corpus"""
+    present = {(doc.metadata["committee_label"], doc.metadata["topic_label"]) for doc in corpus}
+    pairs = [(committee, topic) for topic in TOPICS for committee in COMMITTEES if (committee, topic) in present]
+    return [(f"What did {COMMITTEE_PARAPHRASES[committee]} say about {TOPIC_PARAPHRASES[topic]}?", committee, topic)
+            for committee, topic in (pairs[i % len(pairs)] for i in range(count))]
+
+
+def is_relevant(doc, committee, topic):
+    return doc.metadata.get("committee_label") == committee and doc.metadata.get("topic_label") == topic
+
+
+def evaluate(search, questions):
+    precisions, reciprocal_ranks, tokens, latencies = [], [], [], []
+    for question, committee, topic in questions:
+        start = time.perf_counter()
+        documents = [doc for doc, _ in search(question)]
+        latencies.append(time.perf_counter() - start)
+
+        relevant = [is_relevant(doc, committee, topic) for doc in documents]
+        precisions.append(sum(relevant) / len(documents) if documents else 0.0)
+        first = next((i for i, hit in enumerate(relevant) if hit), None)
+        reciprocal_ranks.append(1.0 / (first + 1) if first is not None else 0.0)
+        tokens.append(sum(estimate_tokens(doc.page_content) for doc in documents))
+    return {
+        "precision": float(np.mean(precisions)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "tokens": float(np.mean(tokens)),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=2000, help="Corpus size")
+    parser.add_argument("--queries", type=int, default=80)
+    parser.add_argument("--k", type=parse_int_list, default=[5, 10], help="k values for k-only retrieval")
+    parser.add_argument("--rerank-k", type=parse_int_list, default=[3, 5], help="Chunks kept after reranking")
+    parser.add_argument("--fetch-k", type=int, default=DEFAULT_FETCH_K, help="Candidates fetched for reranking")
+    parser.add_argument("--noise", type=float, default=2.5, help="Embedding noise (higher = weaker dense retrieval)")
+    parser.add_argument("--reranker", choices=("lexical", "cross-encoder"), default="lexical")
+    args = parser.parse_args()
+
+    corpus = make_labelled_corpus(args.documents)
+    vectorstore = LocalVectorStore.from_texts([doc.page_content for doc in corpus], HashingEmbeddings(noise=args.noise),
+                                              metadatas=[doc.metadata for doc in corpus])
+    questions = make_labelled_questions(corpus, args.queries)
+    reranked = RerankedVectorStore(vectorstore, build_reranker(args.reranker), fetch_k=args.fetch_k)
+
+    configurations = [(f"k-only k={k}", lambda q, k=k: vectorstore.similarity_search_with_score(q, k=k))
+                      for k in args.k]
+    configurations += [(f"rerank {args.fetch_k}->{k}", lambda q, k=k: reranked.similarity_search_with_score(q, k=k))
+                       for k in args.rerank_k]
+
+    print(f"🧪 Reranking benchmark ({len(corpus)} chunks, {len(questions)} questions, {args.reranker} reranker)")
+    print("=" * 76)
+    print(f"{'configuration':>18} {'precision':>10} {'mrr':>7} {'tokens':>8} {'p50':>10} {'p95':>10}")
+    for label, search in configurations:
+        # One untimed pass warms the token cache, as in a running app
+        search(questions[0][0])
+        result = evaluate(search, questions)
+        print(f"{label:>18} {result['precision']:>10.2f} {result['mrr']:>7.2f} {result['tokens']:>8.0f} "
+              f"{result['p50_ms']:>8.2f}ms {result['p95_ms']:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
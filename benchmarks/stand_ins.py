@@ -0,0 +1,280 @@
+"""Local stand-ins for Bedrock, Pinecone and S3 used by the benchmarks
+
+Each stand-in sleeps for a configurable latency instead of calling AWS or
+Pinecone, so the benchmarks measure the app's own overhead (chains,
+caches, query engine, link building) under realistic upstream delays.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+
+import numpy as np
+from botocore.exceptions import ClientError
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from answer_cache import SemanticAnswerCache
+from chain_registry import ChainRegistry, build_qa_chain
+from context_packing import DEFAULT_TOKEN_BUDGET
+from embedding_cache import CachedEmbeddings
+from presign_cache import PresignedUrlCache
+from prompts import build_prompt
+from tracing import estimate_tokens
+
+COMMITTEES = [
+    "Subcommittee on Basic Electricity and Gas Policy",
+    "Subcommittee on Large-Scale Introduction of Renewable Energy",
+    "Next Generation Power System Working Group",
+    "Study Group on Next-Generation Distributed Power Systems",
+    "Watt Bit Collaboration Public-Private Forum",
+    "Carbon Management Subcommittee",
+    "Study Group on the Status of Simultaneous Markets",
+    "Committee on Adjustment Capacity and Supply-Demand Balance Evaluation",
+]
+TOPICS = [
+    "capacity market", "grid congestion", "offshore wind", "battery storage", "hydrogen co-firing",
+    "demand response", "balancing market", "data center demand", "CCS", "nuclear restart",
+]
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hash-seeded unit vectors with a fixed per-call latency (Titan v2 stand-in)"""
+
+    def __init__(self, size=1024, latency=0.02):
+        self.size = size
+        self.latency = latency
+        self.calls = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+class ThrottlingEmbeddings(FakeEmbeddings):
+    """FakeEmbeddings behind a service quota: one request per text, throttled above capacity requests in flight
+
+    Like BedrockEmbeddings with Titan, embed_documents makes its requests
+    one after the other. A request that arrives while capacity requests
+    are running fails with the ThrottlingException Bedrock returns.
+    """
+
+    def __init__(self, size=1024, latency=0.02, capacity=8):
+        super().__init__(size, latency)
+        self.capacity = capacity
+        self.requests = 0
+        self.throttled = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _invoke(self, text):
+        with self._lock:
+            self.requests += 1
+            if self._in_flight >= self.capacity:
+                self.throttled += 1
+                raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}},
+                                  "InvokeModel")
+            self._in_flight += 1
+        try:
+            time.sleep(self.latency)
+            return self._vector(text)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._invoke(text) for text in texts]
+
+
+class FakeVectorStore(InMemoryVectorStore):
+    """In-memory vector store with a fixed per-query latency (Pinecone stand-in)"""
+
+    def __init__(self, embedding, latency=0.03):
+        super().__init__(embedding)
+        self.latency = latency
+
+    # similarity_search and asimilarity_search go through these as well
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        time.sleep(self.latency)
+        return super().similarity_search_with_score(query, k=k, **kwargs)
+
+    async def asimilarity_search_with_score(self, query, k=4, **kwargs):
+        await asyncio.sleep(self.latency)
+        return await super().asimilarity_search_with_score(query, k=k, **kwargs)
+
+
+def _content_text(content):
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Chat model that answers after time-to-first-token latency and then streams at a fixed token rate
+
+    The time to first token grows with the prompt (prefill_per_1k_tokens
+    seconds per 1000 estimated prompt tokens), so prompt size changes show
+    up in the benchmarks.
+    """
+
+    ttft: float = 0.3
+    prefill_per_1k_tokens: float = 0.1
+    tokens_per_second: float = 80.0
+    answer_tokens: int = 60
+
+    @property
+    def _llm_type(self):
+        return "fake-streaming-chat"
+
+    def _prefill(self, messages):
+        """Return (delay before the first token, usage metadata)"""
+        input_tokens = sum(estimate_tokens(_content_text(message.content)) for message in messages)
+        delay = self.ttft + input_tokens / 1000 * self.prefill_per_1k_tokens
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": self.answer_tokens,
+            "total_tokens": input_tokens + self.answer_tokens,
+        }
+        return delay, usage
+
+    def _tokens(self, messages):
+        # Vary the answer a little with the prompt so answers are not all identical
+        seed = len(_content_text(messages[-1].content)) % len(TOPICS)
+        words = [TOPICS[(seed + i) % len(TOPICS)].split()[0] for i in range(self.answer_tokens)]
+        return [word + " " for word in words]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        delay, usage = self._prefill(messages)
+        time.sleep(delay + (len(tokens) - 1) / self.tokens_per_second)
+        message = AIMessage(content="".join(tokens), usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, usage = self._prefill(messages)
+        time.sleep(delay)
+        tokens = self._tokens(messages)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=token, usage_metadata=usage if i == len(tokens) - 1 else None
+            ))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, usage = self._prefill(messages)
+        await asyncio.sleep(delay)
+        tokens = self._tokens(messages)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=token, usage_metadata=usage if i == len(tokens) - 1 else None
+            ))
+
+
+class FakePresigner:
+    """Stand-in for boto3's generate_presigned_url with a fixed per-call latency"""
+
+    def __init__(self, latency=0.005):
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, bucket, key, expiration):
+        self.calls += 1
+        time.sleep(self.latency)
+        return f"https://{bucket}.s3.amazonaws.com/{key}?X-Amz-Expires={expiration}&X-Amz-Signature=fake"
+
+
+def make_corpus(num_documents=2000, num_files=40):
+    """Synthetic committee chunks carrying the Bedrock KB metadata the app reads"""
+    documents = []
+    for i in range(num_documents):
+        committee = COMMITTEES[i % len(COMMITTEES)]
+        topic = TOPICS[i % len(TOPICS)]
+        file_number = i % num_files
+        documents.append(Document(
+            page_content=(f"{committee} discussed {topic} (chunk {i}). "
+                          f"The secretariat presented materials on {topic} and members commented on "
+                          f"the schedule, cost allocation and the impact on the electricity system. ") * 3,
+            metadata={
+                "x-amz-bedrock-kb-source-uri": f"s3://meti-committee-docs/{committee.replace(' ', '_')}/"
+                                               f"material_{file_number}.pdf",
+                "x-amz-bedrock-kb-page-number": i % 30 + 1,
+            },
+        ))
+    return documents
+
+
+def make_questions(count, offset=0):
+    """Distinct benchmark questions, so nothing is served from the answer cache unless repeated on purpose"""
+    return [
+        f"What did the {COMMITTEES[i % len(COMMITTEES)]} say about {TOPICS[(i // len(COMMITTEES)) % len(TOPICS)]}? "
+        f"(#{i + offset})"
+        for i in range(count)
+    ]
+
+
+def build_rag_system(embedding_latency=0.02, retrieval_latency=0.03, ttft=0.3, prefill_per_1k_tokens=0.1,
+                     tokens_per_second=80.0, answer_tokens=60, num_documents=2000,
+                     token_budget=DEFAULT_TOKEN_BUDGET):
+    """A rag_system dict in the shape of the app's initialize_rag_system, backed by the stand-ins"""
+    raw_embedding = FakeEmbeddings(latency=0)
+    vectorstore = FakeVectorStore(raw_embedding, latency=retrieval_latency)
+    # Index the corpus without paying the per-call latency
+    vectorstore.add_documents(make_corpus(num_documents))
+    raw_embedding.latency = embedding_latency
+
+    embedding = CachedEmbeddings(raw_embedding, model_id="fake-embedding")
+    vectorstore.embedding = embedding
+    llm = FakeStreamingChatModel(ttft=ttft, prefill_per_1k_tokens=prefill_per_1k_tokens,
+                                 tokens_per_second=tokens_per_second, answer_tokens=answer_tokens)
+
+    def build_chain(prompt_type, retrieval_k, language=None):
+        prompt = build_prompt(prompt_type, language=language)
+        return build_qa_chain(llm, vectorstore, prompt, retrieval_k, token_budget=token_budget)
+
+    return {
+        'vectorstore': vectorstore,
+        'embedding': embedding,
+        'llm': llm,
+        'pc': None,
+        'index': None,
+        'namespace': None,
+        'corpus_version': lambda: "benchmark",
+        'chains': ChainRegistry(build_chain),
+    }
+
+
+def build_answer_cache():
+    return SemanticAnswerCache(max_entries=256, ttl_seconds=3600, similarity_threshold=0.95)
+
+
+def build_presigned_url_cache(latency=0.005):
+    return PresignedUrlCache(FakePresigner(latency))
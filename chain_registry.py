@@ -0,0 +1,77 @@
+import threading
+
+from langchain.chains import RetrievalQA
+
+from context_packing import PackedRetriever
+
+
+def build_qa_chain(llm, vectorstore, prompt, retrieval_k=5, token_budget=None, metadata_filter=None):
+    """Build a RetrievalQA "stuff" chain for a prompt and retrieval depth
+
+    With a token_budget the k retrieved chunks are deduplicated, trimmed and
+    packed into that many prompt tokens (see context_packing). A
+    metadata_filter (e.g. one committee, see query_scope) restricts every
+    search of the chain.
+    """
+    if token_budget:
+        retriever = PackedRetriever(vectorstore=vectorstore, k=retrieval_k, token_budget=token_budget,
+                                    metadata_filter=metadata_filter)
+    else:
+        search_kwargs = {"k": retrieval_k}
+        if metadata_filter:
+            search_kwargs["filter"] = metadata_filter
+        retriever = vectorstore.as_retriever(search_kwargs=search_kwargs)
+    return RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=retriever,
+        return_source_documents=True,
+        chain_type_kwargs={"prompt": prompt}
+    )
+
+
+class ChainRegistry:
+    """Compile each QA chain once per (prompt_type, retrieval_k) and reuse it
+
+    The chains hold no per-query state (callbacks are passed per call through
+    the invoke config), so a single instance can be shared by every Streamlit
+    session and thread. build_chain is called at most once per key.
+    """
+
+    def __init__(self, build_chain):
+        self._build_chain = build_chain
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(prompt_type, retrieval_k, options):
+        return (prompt_type, int(retrieval_k), tuple(sorted(options.items())))
+
+    def get(self, prompt_type="comprehensive", retrieval_k=5, **options):
+        """Return the chain for these settings, building it on first use"""
+        key = self._key(prompt_type, retrieval_k, options)
+        chain = self._chains.get(key)
+        if chain is not None:
+            return chain
+
+        with self._lock:
+            # Another thread may have built it while we waited for the lock
+            chain = self._chains.get(key)
+            if chain is None:
+                chain = self._build_chain(prompt_type, int(retrieval_k), **options)
+                self._chains[key] = chain
+        return chain
+
+    def preload(self, prompt_types, retrieval_ks, option_sets=({},)):
+        """Build every combination up front (option_sets: the **options of each variant, e.g. languages)"""
+        for prompt_type in prompt_types:
+            for retrieval_k in retrieval_ks:
+                for options in option_sets:
+                    self.get(prompt_type, retrieval_k, **options)
+
+    def clear(self):
+        with self._lock:
+            self._chains.clear()
+
+    def __len__(self):
+        return len(self._chains)
@@ -0,0 +1,305 @@
+"""Streaming, memory-bounded chunking of meeting PDFs for ingestion
+
+Each PDF goes through a pipeline of generators, one page at a time:
+
+    iter_pages -> normalize_text -> split_text -> iter_chunks -> batched
+
+so a several-hundred-page slide deck is never held in memory whole. The
+PDF reader is reopened every PAGES_PER_READER pages, which drops the
+parsed objects it caches. Chunks never span pages, so each chunk's
+x-amz-bedrock-kb-page-number is the page its text is on.
+
+ChunkingPool runs the pipeline for many PDFs on a process pool. Workers
+put finished batches on a bounded queue and block while it is full, so
+when embedding falls behind, chunking waits instead of piling up chunks:
+peak memory is about (max_pending_batches + batches being embedded) x
+batch_size chunks, whatever the size of the documents. Workers download
+S3 PDFs to temporary files themselves.
+
+    python chunking.py deck.pdf --uri s3://bucket/meti/deck.pdf   # print the chunks of one PDF
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import queue
+import re
+import tempfile
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from query_scope import tag_metadata
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+SOURCE_URI_FIELD = "x-amz-bedrock-kb-source-uri"
+PAGE_NUMBER_FIELD = "x-amz-bedrock-kb-page-number"
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 100
+DEFAULT_BATCH_SIZE = 64
+PAGES_PER_READER = 50
+# A line at least this fraction of the page's longest line is taken to be wrapped
+WRAP_WIDTH_RATIO = 0.8
+
+# Preferred chunk ends, best first: paragraph, line, Japanese or English sentence
+_BREAKS = ("\n\n", "\n", "。", ". ", "、", " ")
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff"
+# Extraction puts spaces between CJK characters of justified or spaced-out text
+_CJK_SPACE = re.compile(f"(?<=[{_CJK}]) +(?=[{_CJK}])")
+_SPACES = re.compile(r"[ \t]+")
+# A line that starts a bullet, a numbered item or a heading is kept on its own line
+_LINE_START = re.compile(
+    r"^(?:[\u30fb\uff65\u25cb\u25cf\u25ef\u25a0\u25a1\u25c6\u25c7\u25b6\u25b7\u25ba\u203b\uff0a*\-\u2013\u2014\u2192]"
+    r"|\(?\d+[\.\)]|[\u2460-\u2473]|\u7b2c\d+)"
+)
+_SENTENCE_END = ("。", "：", ":", "」", "）", ")")
+
+
+def iter_pages(path, pages_per_reader=PAGES_PER_READER):
+    """Yield (page_number, text) for every page of a PDF file, numbered from 1"""
+    if PdfReader is None:
+        raise ImportError("pypdf is required for PDF ingestion (pip install pypdf)")
+    start = 0
+    while True:
+        # A fresh reader per slice of pages, so its object cache does not grow with the document
+        with open(path, "rb") as f:
+            reader = PdfReader(f)
+            count = len(reader.pages)
+            for number in range(start, min(start + pages_per_reader, count)):
+                yield number + 1, reader.pages[number].extract_text() or ""
+        start += pages_per_reader
+        if start >= count:
+            return
+
+
+def _joins_previous(previous, line):
+    # CJK on both sides of the break, and the next line is not a bullet and the previous one did not end a sentence
+    return (re.match(f"[{_CJK}]", previous[-1]) and re.match(f"[{_CJK}]", line[0])
+            and not previous.endswith(_SENTENCE_END) and not _LINE_START.match(line))
+
+
+def normalize_text(text):
+    """Clean up extracted Japanese text
+
+    NFKC (full-width digits and letters, half-width katakana, ideographic
+    spaces), no spaces between CJK characters and no blank or padded lines.
+    A line that runs to the page's text width and breaks mid-sentence was
+    wrapped, and is joined with the next one; headings and bullets are
+    shorter or start a line, so they stay on their own lines.
+    """
+    lines = [_CJK_SPACE.sub("", _SPACES.sub(" ", line).strip())
+             for line in unicodedata.normalize("NFKC", text).splitlines()]
+    lines = [line for line in lines if line]
+    if not lines:
+        return ""
+    wrap_width = WRAP_WIDTH_RATIO * max(len(line) for line in lines)
+
+    joined = [lines[0]]
+    for previous, line in zip(lines, lines[1:]):
+        if len(previous) >= wrap_width and _joins_previous(previous, line):
+            joined[-1] += line
+        else:
+            joined.append(line)
+    return "\n".join(joined)
+
+
+def split_text(text, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP):
+    """Yield chunks of at most chunk_size characters, ending at a natural break where possible"""
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Only look for a break in the last fifth, so chunks stay close to chunk_size
+            floor = start + chunk_size * 4 // 5
+            for separator in _BREAKS:
+                position = text.rfind(separator, floor, end)
+                if position != -1:
+                    end = position + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            yield chunk
+        if end >= len(text):
+            return
+        start = max(end - overlap, start + 1)
+
+
+def source_hash(uri):
+    return hashlib.sha256(uri.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id(uri, page_number, text):
+    content = hashlib.sha256(f"{page_number}\x00{text}".encode("utf-8")).hexdigest()[:32]
+    return f"{source_hash(uri)}#{content}"
+
+
+def iter_chunks(uri, pages, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP, text_key="text"):
+    """Yield page-aligned {"id", "text", "metadata"} records, skipping duplicates within the document"""
+    seen = set()
+    for page_number, text in pages:
+        for chunk in split_text(normalize_text(text), chunk_size, overlap):
+            record_id = chunk_id(uri, page_number, chunk)
+            if record_id in seen:
+                continue
+            seen.add(record_id)
+            metadata = {SOURCE_URI_FIELD: uri, PAGE_NUMBER_FIELD: page_number}
+            metadata.update(tag_metadata(metadata, chunk))
+            metadata[text_key] = chunk
+            yield {"id": record_id, "text": chunk, "metadata": metadata}
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+_s3_client = None
+
+
+def _get_s3_client():
+    # One client per worker process, created on its first S3 document
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        _s3_client = boto3.client("s3", region_name=os.getenv("AWS_REGION"))
+    return _s3_client
+
+
+@contextmanager
+def local_copy(location):
+    """Path of a ("file", path) or ("s3", bucket, key) location, downloading S3 objects to a temporary file"""
+    if location[0] == "file":
+        yield location[1]
+        return
+    _, bucket, key = location
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        _get_s3_client().download_file(bucket, key, path)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def document_batches(uri, location, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                     batch_size=DEFAULT_BATCH_SIZE):
+    """Yield batches of chunk records for one PDF, reading it a page at a time"""
+    with local_copy(location) as path:
+        yield from batched(iter_chunks(uri, iter_pages(path), chunk_size, overlap), batch_size)
+
+
+_events = None
+
+
+def _init_worker(events):
+    global _events
+    _events = events
+
+
+def _chunk_to_queue(uri, location, options):
+    # Runs in a worker: put() blocks while the queue is full, which is the back-pressure
+    try:
+        batches = 0
+        for batch in document_batches(uri, location, **options):
+            _events.put(("batch", uri, batch))
+            batches += 1
+        _events.put(("done", uri, batches))
+    except Exception as e:
+        _events.put(("error", uri, f"{type(e).__name__}: {e}"))
+
+
+class ChunkingPool:
+    """Chunk many PDFs on a process pool and yield their batches as they are produced
+
+    run() yields ("batch", uri, records), then ("done", uri, batch_count)
+    or ("error", uri, message) once per document; a document's batches
+    arrive in order. With processes=0 documents are chunked one after the
+    other in the calling process.
+    """
+
+    def __init__(self, processes=None, max_pending_batches=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 overlap=DEFAULT_CHUNK_OVERLAP, batch_size=DEFAULT_BATCH_SIZE):
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.max_pending_batches = max_pending_batches or 2 * max(1, self.processes)
+        self.options = {"chunk_size": chunk_size, "overlap": overlap, "batch_size": batch_size}
+
+    def run(self, documents):
+        """documents: (uri, location) pairs"""
+        documents = list(documents)
+        if not self.processes:
+            yield from self._run_inline(documents)
+            return
+
+        context = multiprocessing.get_context()
+        events = context.Queue(maxsize=self.max_pending_batches)
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=context,
+                                 initializer=_init_worker, initargs=(events,)) as pool:
+            futures = [pool.submit(_chunk_to_queue, uri, location, self.options) for uri, location in documents]
+            remaining = len(documents)
+            try:
+                while remaining:
+                    try:
+                        event = events.get(timeout=1.0)
+                    except queue.Empty:
+                        # A worker that died cannot report its document; surface the pool error
+                        for future in futures:
+                            if future.done() and future.exception() is not None:
+                                raise future.exception()
+                        continue
+                    if event[0] != "batch":
+                        remaining -= 1
+                    yield event
+            finally:
+                if remaining:
+                    # Stopped early: cancel what has not started and unblock workers waiting on put()
+                    for future in futures:
+                        future.cancel()
+                    while not all(future.done() for future in futures):
+                        try:
+                            events.get(timeout=0.1)
+                        except queue.Empty:
+                            pass
+
+    def _run_inline(self, documents):
+        for uri, location in documents:
+            batches = 0
+            try:
+                for batch in document_batches(uri, location, **self.options):
+                    yield "batch", uri, batch
+                    batches += 1
+            except Exception as e:
+                yield "error", uri, f"{type(e).__name__}: {e}"
+                continue
+            yield "done", uri, batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the chunks the ingestion pipeline makes from a PDF")
+    parser.add_argument("path")
+    parser.add_argument("--uri", help="Source URI recorded in the metadata (default: the path)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    args = parser.parse_args()
+
+    uri = args.uri or os.path.abspath(args.path)
+    count = 0
+    for record in iter_chunks(uri, iter_pages(args.path), args.chunk_size, args.chunk_overlap):
+        count += 1
+        tags = {k: v for k, v in record["metadata"].items() if k in ("committee", "meeting")}
+        print(f"--- page {record['metadata'][PAGE_NUMBER_FIELD]} {record['id']} {tags}")
+        print(record["text"])
+    print(f"\n✅ {count} chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Token-budgeted context packing for the "stuff" QA chain
+
+Instead of stuffing all k retrieved chunks into the prompt, the packer:
+
+1. orders chunks by retrieval score (best first)
+2. drops chunks that are near-duplicates of a chunk already kept
+   (character shingle overlap, which works for Japanese and English alike)
+3. trims chunks longer than max_chunk_tokens to their sentences most
+   relevant to the question, keeping the sentences in document order
+4. stops adding chunks once the token budget is full
+
+Each packed chunk keeps its original metadata (S3 source URI and page
+number), so source attribution and PDF links are unchanged.
+"""
+import re
+from typing import Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+from tracing import estimate_tokens
+
+DEFAULT_TOKEN_BUDGET = 3000
+DEFAULT_MAX_CHUNK_TOKENS = 600
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+# Don't bother adding a chunk that would have to be cut below this size
+MIN_CHUNK_TOKENS = 60
+
+_SENTENCE_END = re.compile(r"(?<=[。！？!?])|(?<=\.)\s+|\n+")
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff66-\uff9f]+")
+_STOPWORDS = {
+    "the", "a", "an", "of", "in", "on", "for", "to", "and", "or", "is", "are", "was", "were", "what", "which",
+    "how", "why", "when", "who", "does", "do", "did", "be", "by", "with", "about", "at", "from", "this", "that",
+}
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence and sentence.strip()]
+
+
+def query_terms(text):
+    """Lowercased English words plus CJK character bigrams"""
+    terms = {word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS}
+    for run in _CJK_RUN.findall(text):
+        terms.update(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+    return terms
+
+
+def shingles(text, size=5):
+    text = " ".join(text.split())
+    return {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+
+def overlap(a, b):
+    """Overlap of two shingle sets, relative to the smaller one (catches contained chunks)"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def trim_to_relevant(text, terms, max_tokens):
+    """Keep the sentences most relevant to the question, in their original order, within max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    sentences = split_sentences(text)
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(query_terms(sentences[i]) & terms), i)
+    )
+    kept, used = set(), 0
+    for i in ranked:
+        tokens = estimate_tokens(sentences[i])
+        if used + tokens > max_tokens:
+            continue
+        kept.add(i)
+        used += tokens
+    if not kept:
+        # A single sentence longer than the cap: cut it by characters
+        ratio = max_tokens / max(1, estimate_tokens(text))
+        return text[:max(1, int(len(text) * ratio))]
+    return " ".join(sentences[i] for i in sorted(kept))
+
+
+def pack_documents(question, scored_documents, token_budget=DEFAULT_TOKEN_BUDGET,
+                   max_chunk_tokens=DEFAULT_MAX_CHUNK_TOKENS, duplicate_threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """Select and trim (document, score) pairs to fit token_budget
+
+    Returns new Documents (best score first) with the original metadata plus
+    the retrieval "score".
+    """
+    terms = query_terms(question)
+    packed, kept_shingles = [], []
+    remaining = token_budget
+    for doc, score in sorted(scored_documents, key=lambda pair: pair[1], reverse=True):
+        doc_shingles = shingles(doc.page_content)
+        if any(overlap(doc_shingles, other) >= duplicate_threshold for other in kept_shingles):
+            continue
+
+        limit = min(max_chunk_tokens, remaining)
+        if limit < MIN_CHUNK_TOKENS:
+            break
+        text = trim_to_relevant(doc.page_content, terms, limit)
+        tokens = estimate_tokens(text)
+        if tokens > remaining:
+            break
+
+        packed.append(Document(page_content=text, metadata=dict(doc.metadata or {}, score=float(score)), id=doc.id))
+        kept_shingles.append(doc_shingles)
+        remaining -= tokens
+    return packed
+
+
+class PackedRetriever(BaseRetriever):
+    """Retrieve k scored chunks from a vector store and pack them into a token budget"""
+
+    vectorstore: VectorStore
+    k: int = 5
+    token_budget: int = DEFAULT_TOKEN_BUDGET
+    max_chunk_tokens: int = DEFAULT_MAX_CHUNK_TOKENS
+    duplicate_threshold: float = DEFAULT_DUPLICATE_THRESHOLD
+    metadata_filter: Optional[dict] = None
+
+    def _pack(self, query, scored_documents):
+        return pack_documents(query, scored_documents, self.token_budget, self.max_chunk_tokens,
+                              self.duplicate_threshold)
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        return self._pack(query, self.vectorstore.similarity_search_with_score(query, k=self.k,
+                                                                               filter=self.metadata_filter))
+
+    async def _aget_relevant_documents(self, query, *, run_manager: AsyncCallbackManagerForRetrieverRun):
+        return self._pack(query, await self.vectorstore.asimilarity_search_with_score(query, k=self.k,
+                                                                                      filter=self.metadata_filter))
@@ -0,0 +1,111 @@
+"""Process-wide interned store of retrieved chunks
+
+The same few hundred METI chunks come back for most questions, across
+every session. DocumentStore keeps one SharedChunk per vector id and
+text (the packing retriever trims a chunk differently for each question,
+so one id can come back with several excerpts) and hands that same object
+to every session that retrieved it, instead of each history entry holding
+its own copy of the text and metadata.
+
+Entries are held through weak references: a chunk stays in the store
+while at least one history entry references it and is freed by normal
+reference counting once none do, including when a Streamlit session
+expires. Metadata keys and string values are interned, so repeated
+source URIs are stored once.
+"""
+import hashlib
+import sys
+import threading
+import weakref
+
+from langchain_core.documents import Document
+
+
+def document_key(doc):
+    """Vector id and a hash of the text, or a hash of source, page and text when there is no id"""
+    if doc.id:
+        return doc.id + ":" + hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16]
+    metadata = doc.metadata or {}
+    raw = "\x00".join((
+        str(metadata.get('x-amz-bedrock-kb-source-uri', metadata.get('source', ''))),
+        str(metadata.get('x-amz-bedrock-kb-page-number', '')),
+        doc.page_content,
+    ))
+    return "sha1:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _intern_metadata(metadata):
+    return {
+        sys.intern(key): sys.intern(value) if isinstance(value, str) else value
+        for key, value in metadata.items()
+    }
+
+
+class SharedChunk:
+    """One retrieved chunk, shared by every session that references it"""
+
+    __slots__ = ("key", "id", "text", "metadata", "__weakref__")
+
+    def __init__(self, key, id, text, metadata):
+        self.key = key
+        self.id = id
+        self.text = text
+        self.metadata = metadata
+
+    def to_document(self):
+        # The Document shares the chunk's text and metadata objects, nothing is copied
+        return Document(page_content=self.text, metadata=self.metadata, id=self.id)
+
+    def size_bytes(self):
+        size = sys.getsizeof(self) + sys.getsizeof(self.text) + sys.getsizeof(self.metadata)
+        for key, value in self.metadata.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+        return size
+
+
+class DocumentStore:
+    """Intern retrieved chunks by vector id and text, or content hash"""
+
+    def __init__(self):
+        self._chunks = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self.interned = 0
+        self.reused = 0
+        self.bytes_saved = 0
+
+    def intern(self, doc, exclude_metadata=()):
+        """Return the shared chunk for doc, creating it on first sight
+
+        Metadata keys in exclude_metadata (per-query values such as the
+        retrieval score) are left out so the chunk is the same for every query.
+        """
+        key = document_key(doc)
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is not None:
+                self.reused += 1
+                self.bytes_saved += chunk.size_bytes()
+                return chunk
+            metadata = {k: v for k, v in (doc.metadata or {}).items() if k not in exclude_metadata}
+            chunk = SharedChunk(key, doc.id, doc.page_content, _intern_metadata(metadata))
+            self._chunks[key] = chunk
+            self.interned += 1
+            return chunk
+
+    def get(self, key):
+        return self._chunks.get(key)
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def stats(self):
+        """Live chunk count and their approximate memory footprint"""
+        with self._lock:
+            chunks = list(self._chunks.values())
+            return {
+                "documents": len(chunks),
+                "bytes": sum(chunk.size_bytes() for chunk in chunks),
+                "interned": self.interned,
+                "reused": self.reused,
+                "bytes_saved": self.bytes_saved,
+            }
@@ -0,0 +1,251 @@
+"""Batched, adaptively concurrent embedding requests
+
+BedrockEmbeddings sends one InvokeModel request per text, one after the
+other, so embedding a corpus runs at a single request's round trip per
+chunk. BatchedEmbeddings wraps any LangChain Embeddings and:
+
+- reads texts in windows of batch_size and embeds each distinct text of a
+  window once
+- splits the distinct texts into requests of texts_per_request (1 for
+  Titan v2, which embeds one text per request) and runs them on a shared
+  thread pool
+- limits the requests in flight with AIMD: the limit grows by about one
+  per round of successful requests and halves when Bedrock throttles; a
+  throttled request is retried after a jittered backoff
+- streams vectors back in input order (map()), with the next window
+  already running while the current one is yielded
+
+The limit is shared by every caller of one instance, so ingestion batches
+and query embeddings together stay under the account's quota. Wrap it in
+CachedEmbeddings to skip texts that are already cached.
+
+    EMBEDDING_CONCURRENCY=16    # most requests in flight (0 calls the model directly)
+
+    python embedding_batcher.py texts.txt --concurrency 16
+"""
+import argparse
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from retry import backoff_delay, is_throttling_error
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_TEXTS_PER_REQUEST = 1
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 8
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 20.0
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on the requests in flight
+
+    A successful request raises the limit by 1/limit, about +1 per round of
+    limit requests; a throttled one multiplies it by decrease_factor. Only
+    the first throttle of a round decreases it: requests that started
+    before the last decrease were sent at the old rate and say nothing
+    about the new one.
+    """
+
+    def __init__(self, initial=DEFAULT_INITIAL_CONCURRENCY, minimum=1, maximum=DEFAULT_MAX_CONCURRENCY,
+                 decrease_factor=0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.decreases = 0
+        self._epoch = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot; returns the epoch to pass back to release()"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return self._epoch
+
+    def release(self, epoch, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if not throttled:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            elif epoch == self._epoch:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                self._epoch += 1
+                self.decreases += 1
+            self._condition.notify_all()
+
+
+class BatchedEmbeddings(Embeddings):
+    """Embeddings wrapper that embeds many texts with parallel, throttling-aware requests
+
+    embed_documents() and map() go through the thread pool; embed_query()
+    calls the wrapped model's embed_query on the calling thread but still
+    takes a slot under the shared limit. Errors other than throttling, and throttling that
+    persists past max_retries, are raised to the caller.
+    """
+
+    def __init__(self, embeddings, batch_size=DEFAULT_BATCH_SIZE, texts_per_request=DEFAULT_TEXTS_PER_REQUEST,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, initial_concurrency=DEFAULT_INITIAL_CONCURRENCY,
+                 max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.texts_per_request = texts_per_request
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, maximum=max_concurrency)
+        self._pool = None
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.duplicates = 0
+        self.requests = 0
+        self.throttled = 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.concurrency.maximum,
+                                                thread_name_prefix="embedding")
+            return self._pool
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _request(self, texts, embed=None):
+        """One model request under the concurrency limit, retried while it is throttled
+
+        embed(texts) makes the request, embed_documents of the wrapped model by default.
+        """
+        embed = embed or self.embeddings.embed_documents
+        for attempt in range(self.max_retries + 1):
+            epoch = self.concurrency.acquire()
+            try:
+                vectors = embed(texts)
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                self.concurrency.release(epoch, throttled=throttled)
+                self._count(requests=1, throttled=int(throttled))
+                if attempt == self.max_retries or not throttled:
+                    raise
+                time.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+                continue
+            self.concurrency.release(epoch)
+            self._count(requests=1)
+            return vectors
+
+    def _submit(self, pool, window):
+        # Each distinct text of the window is embedded once
+        distinct = list(dict.fromkeys(window))
+        self._count(texts=len(window), duplicates=len(window) - len(distinct))
+        size = self.texts_per_request
+        futures = [pool.submit(self._request, distinct[i:i + size]) for i in range(0, len(distinct), size)]
+        return window, {text: i for i, text in enumerate(distinct)}, futures
+
+    def _collect(self, window, positions, futures):
+        size = self.texts_per_request
+        for text in window:
+            position = positions[text]
+            yield futures[position // size].result()[position % size]
+
+    def map(self, texts):
+        """Yield the vector of each text in input order, as soon as it and the ones before it are ready"""
+        pool = self._get_pool()
+        pending = deque()
+        window = []
+        try:
+            for text in texts:
+                window.append(text)
+                if len(window) == self.batch_size:
+                    pending.append(self._submit(pool, window))
+                    window = []
+                    # One window runs ahead while the previous one is yielded
+                    if len(pending) > 1:
+                        yield from self._collect(*pending.popleft())
+            if window:
+                pending.append(self._submit(pool, window))
+            while pending:
+                yield from self._collect(*pending.popleft())
+        finally:
+            # An error or an abandoned generator: drop requests that have not started
+            for _, _, futures in pending:
+                for future in futures:
+                    future.cancel()
+
+    def embed_documents(self, texts):
+        return list(self.map(texts))
+
+    def embed_query(self, text):
+        # The wrapped model's query path: asymmetric models embed queries differently from documents
+        return self._request([text], lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    def stats(self):
+        """Request, deduplication and throttling counters and the current concurrency limit"""
+        with self._lock:
+            return {
+                "texts": self.texts,
+                "duplicates": self.duplicates,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "concurrency_limit": round(self.concurrency.limit, 2),
+                "peak_in_flight": self.concurrency.peak_in_flight,
+                "decreases": self.concurrency.decreases,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def batched_embeddings_from_env(embeddings):
+    """Wrap embeddings in BatchedEmbeddings unless EMBEDDING_CONCURRENCY is 0"""
+    max_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", str(DEFAULT_MAX_CONCURRENCY)))
+    if max_concurrency <= 0:
+        return embeddings
+    return BatchedEmbeddings(
+        embeddings,
+        max_concurrency=max_concurrency,
+        initial_concurrency=min(DEFAULT_INITIAL_CONCURRENCY, max_concurrency)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed the lines of a text file with Titan and report throughput")
+    parser.add_argument("path", help="One text per line")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY, help="Most requests in flight")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from langchain_aws import BedrockEmbeddings
+
+    load_dotenv()
+    with open(args.path, encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+    embeddings = BatchedEmbeddings(
+        BedrockEmbeddings(model_id="amazon.titan-embed-text-v2:0", region_name=os.getenv("AWS_REGION")),
+        batch_size=args.batch_size,
+        max_concurrency=args.concurrency
+    )
+    start = time.perf_counter()
+    count = sum(1 for _ in embeddings.map(texts))
+    elapsed = time.perf_counter() - start
+    print(f"✅ {count} texts in {elapsed:.1f}s ({count / elapsed:.1f} texts/s) {embeddings.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MEMORY_ENTRIES = 4096
+
+
+def normalize_text(text):
+    """Normalize text before hashing (Unicode NFKC, collapsed whitespace)"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(text, model_id):
+    """Cache key for a text under a given embedding model"""
+    return hashlib.sha256(f"{model_id}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class SQLiteEmbeddingStore:
+    """Persistent embedding tier shared by every process on the host
+
+    Vectors are stored as raw float32 blobs. WAL mode lets several Streamlit
+    workers read while one writes.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Return {key: float32 array} for the keys that are stored"""
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        """Store (key, vector) pairs"""
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with an in-memory LRU tier and an optional SQLite tier
+
+    Wraps any LangChain Embeddings (BedrockEmbeddings in production, a fake in
+    tests). Keys are a hash of the normalized text and the model id, so
+    switching models never returns stale vectors.
+    """
+
+    def __init__(self, embeddings, model_id, max_entries=DEFAULT_MEMORY_ENTRIES, persist_path=None):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.store = SQLiteEmbeddingStore(persist_path) if persist_path else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, keys):
+        """Resolve keys from the memory tier, then the disk tier"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self.memory_hits += len(found)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing and self.store is not None:
+            from_disk = self.store.get_many(missing)
+            for key, vector in from_disk.items():
+                self._remember(key, vector)
+            found.update(from_disk)
+            with self._lock:
+                self.disk_hits += len(from_disk)
+        return found
+
+    def _store(self, keys, vectors):
+        arrays = [np.asarray(vector, dtype=np.float32) for vector in vectors]
+        for key, vector in zip(keys, arrays):
+            self._remember(key, vector)
+        if self.store is not None:
+            self.store.put_many(zip(keys, arrays))
+        with self._lock:
+            self.misses += len(keys)
+
+    def _plan(self, texts):
+        keys = [cache_key(text, self.model_id) for text in texts]
+        found = self._lookup(keys)
+        # Embed each distinct missing text once
+        pending = {}
+        for text, key in zip(texts, keys):
+            if key not in found and key not in pending:
+                pending[key] = text
+        return keys, found, pending
+
+    def embed_documents(self, texts):
+        keys, found, pending = self._plan(texts)
+        if pending:
+            vectors = self.embeddings.embed_documents(list(pending.values()))
+            self._store(list(pending), vectors)
+            found.update(zip(pending, (np.asarray(v, dtype=np.float32) for v in vectors)))
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        key = cache_key(text, self.model_id)
+        found = self._lookup([key])
+        if key not in found:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            self._store([key], [vector])
+            return vector.tolist()
+        return found[key].tolist()
+
+    async def aembed_documents(self, texts):
+        keys, found, pending = self._plan(texts)
+        if pending:
+            vectors = await self.embeddings.aembed_documents(list(pending.values()))
+            self._store(list(pending), vectors)
+            found.update(zip(pending, (np.asarray(v, dtype=np.float32) for v in vectors)))
+        return [found[key].tolist() for key in keys]
+
+    async def aembed_query(self, text):
+        key = cache_key(text, self.model_id)
+        found = self._lookup([key])
+        if key not in found:
+            vector = np.asarray(await self.embeddings.aembed_query(text), dtype=np.float32)
+            self._store([key], [vector])
+            return vector.tolist()
+        return found[key].tolist()
+
+    def stats(self):
+        """Return hit-rate metrics for both tiers"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
@@ -0,0 +1,279 @@
+"""Precomputed answers for the app's example questions
+
+The example buttons are clicked far more than anything else, and their
+answers only change when the corpus, the prompts or the model change. An
+offline job runs every example question (both languages, each prompt
+type) through the normal chains and saves the answers and sources to a
+versioned JSON artifact:
+
+    python example_answers.py --out precomputed/example_answers.json
+    python example_answers.py --out precomputed/example_answers.json --k 3,5 --workers 4
+
+The artifact records the corpus fingerprint, prompt_version() and model
+id it was built with. ExampleAnswers serves it with a dictionary lookup
+while all three still match, and otherwise falls through to the normal
+pipeline; with refresh=True it rebuilds the artifact on a background
+thread and swaps it in when done.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+from answer_cache import normalize_question
+from language_routing import router_of
+from prompts import PROMPT_TYPES, prompt_version
+from retry import backoff_delay, is_throttling_error
+
+FORMAT_VERSION = 1
+DEFAULT_PATH = "precomputed/example_answers.json"
+DEFAULT_RETRIEVAL_KS = (5,)
+DEFAULT_CHECK_INTERVAL = 60
+DEFAULT_MAX_RETRIES = 5
+
+EXAMPLE_QUESTIONS = {
+    "en": [
+        "What external changes are impacting Japan's electricity system?",
+        "What are the main challenges in grid modernization?",
+        "How is Japan addressing carbon management?",
+        "What are the key renewable energy deployment strategies?",
+        "How does the distributed power system work?"
+    ],
+    "ja": [
+        "日本の電力システムに影響を与える外部変化は何ですか？",
+        "電力市場の改革について教えてください",
+        "日本の再生可能エネルギーの現状は？",
+        "分散型電力システムの課題は何ですか？",
+        "カーボンマネジメントの具体的な取り組みは？"
+    ]
+}
+
+
+def example_items(prompt_types=PROMPT_TYPES, retrieval_ks=DEFAULT_RETRIEVAL_KS):
+    """Every (question, prompt_type, retrieval_k) combination to precompute"""
+    return [
+        {"question": question, "language": language, "prompt_type": prompt_type, "retrieval_k": int(retrieval_k)}
+        for language, questions in EXAMPLE_QUESTIONS.items()
+        for question in questions
+        for prompt_type in prompt_types
+        for retrieval_k in retrieval_ks
+    ]
+
+
+def model_id_of(llm):
+    return getattr(llm, "model_id", None) or type(llm).__name__
+
+
+class ExampleAnswerIndex:
+    """Answers keyed by (normalized question, prompt_type, retrieval_k), with the versions they were built from"""
+
+    def __init__(self, answers, corpus_version, prompt_version, model_id, created_at=None):
+        self.corpus_version = corpus_version
+        self.prompt_version = prompt_version
+        self.model_id = model_id
+        self.created_at = created_at or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        self._answers = {}
+        for answer in answers:
+            # Documents are built once here so a lookup does no work
+            result = {
+                "result": answer["result"],
+                "source_documents": [
+                    Document(page_content=doc["page_content"], metadata=doc.get("metadata") or {}, id=doc.get("id"))
+                    for doc in answer["source_documents"]
+                ],
+            }
+            self._answers[self._key(answer["question"], answer["prompt_type"], answer["retrieval_k"])] = (
+                answer, result
+            )
+
+    @staticmethod
+    def _key(question, prompt_type, retrieval_k):
+        return (normalize_question(question), prompt_type, int(retrieval_k))
+
+    def __len__(self):
+        return len(self._answers)
+
+    def get(self, question, prompt_type="comprehensive", retrieval_k=5):
+        entry = self._answers.get(self._key(question, prompt_type, retrieval_k))
+        if entry is None:
+            return None
+        result = entry[1]
+        return {"result": result["result"], "source_documents": list(result["source_documents"])}
+
+    def results(self):
+        """Yield (question, prompt_type, retrieval_k, result) for every answer"""
+        for answer, _ in self._answers.values():
+            yield (answer["question"], answer["prompt_type"], answer["retrieval_k"],
+                   self.get(answer["question"], answer["prompt_type"], answer["retrieval_k"]))
+
+    def matches(self, corpus_version, prompt_version, model_id):
+        return (self.corpus_version, self.prompt_version, self.model_id) == (corpus_version, prompt_version, model_id)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            artifact = json.load(f)
+        if artifact.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported example answers version: {artifact.get('version')}")
+        return cls(artifact["answers"], artifact["corpus_version"], artifact["prompt_version"],
+                   artifact["model_id"], created_at=artifact.get("created_at"))
+
+    def save(self, path):
+        """Write the artifact atomically, so a running app never reads half a file"""
+        artifact = {
+            "version": FORMAT_VERSION,
+            "created_at": self.created_at,
+            "corpus_version": self.corpus_version,
+            "prompt_version": self.prompt_version,
+            "model_id": self.model_id,
+            "answers": [answer for answer, _ in self._answers.values()],
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(artifact, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+
+def _answer_record(item, result):
+    return dict(item, result=result["result"], source_documents=[
+        {"page_content": doc.page_content, "metadata": dict(doc.metadata or {}), "id": doc.id}
+        for doc in result["source_documents"]
+    ])
+
+
+def precompute(rag_system, items, workers=4, max_retries=DEFAULT_MAX_RETRIES):
+    """Answer every item through the shared chains and return an ExampleAnswerIndex
+
+    The corpus version is read before the first query, so an artifact built
+    while the corpus changes is marked stale rather than current.
+    """
+    corpus_version = rag_system['corpus_version']()
+
+    def run_one(item):
+        # Built with the prompt variant the engine routes the question to
+        route = router_of(rag_system).route(item["question"])
+        chain = rag_system['chains'].get(item["prompt_type"], item["retrieval_k"], **route.chain_options())
+        for attempt in range(max_retries + 1):
+            try:
+                return _answer_record(item, chain.invoke({"query": item["question"]}))
+            except Exception as e:
+                if attempt == max_retries or not is_throttling_error(e):
+                    raise
+                time.sleep(backoff_delay(attempt))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        answers = list(pool.map(run_one, items))
+    return ExampleAnswerIndex(answers, corpus_version, prompt_version(), model_id_of(rag_system['llm']))
+
+
+class ExampleAnswers:
+    """Serve precomputed example answers while they match the current corpus, prompts and model
+
+    Versions are checked at most once per check_interval seconds. With
+    refresh=True a stale or missing artifact is rebuilt on a background
+    thread (one at a time); until then get() returns None and the caller
+    answers through the normal pipeline.
+    """
+
+    def __init__(self, path, rag_system, refresh=False, check_interval=DEFAULT_CHECK_INTERVAL,
+                 items=None, workers=2):
+        self.path = path
+        self.rag_system = rag_system
+        self.refresh_enabled = refresh
+        self.check_interval = check_interval
+        self.items = items
+        self.workers = workers
+        self.index = None
+        self.current = False
+        self.hits = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = None
+        if path and os.path.exists(path):
+            try:
+                self.index = ExampleAnswerIndex.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not load example answers from {path}: {e}")
+
+    def get(self, question, prompt_type="comprehensive", retrieval_k=5, committee=None):
+        """The precomputed answer, or None (answers were built without a committee filter)"""
+        if committee or (self.index is None and not self.refresh_enabled):
+            return None
+        self.check()
+        if not self.current:
+            return None
+        result = self.index.get(question, prompt_type, retrieval_k)
+        if result is not None:
+            self.hits += 1
+        return result
+
+    def check(self, force=False):
+        """Re-check the versions (throttled) and start a refresh if the artifact is stale"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._checked_at < self.check_interval:
+                return self.current
+            self._checked_at = now
+
+        try:
+            versions = (self.rag_system['corpus_version'](), prompt_version(), model_id_of(self.rag_system['llm']))
+        except Exception as e:
+            print(f"Could not check example answer versions: {e}")
+            return self.current
+
+        self.current = self.index is not None and self.index.matches(*versions)
+        if not self.current and self.refresh_enabled:
+            self.refresh_in_background()
+        return self.current
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return self._refreshing
+            self._refreshing = threading.Thread(target=self._refresh, name="example-answers-refresh", daemon=True)
+            self._refreshing.start()
+            return self._refreshing
+
+    def _refresh(self):
+        start = time.perf_counter()
+        try:
+            index = precompute(self.rag_system, self.items or example_items(), workers=self.workers)
+            if self.path:
+                index.save(self.path)
+        except Exception as e:
+            print(f"Refreshing example answers failed: {e}")
+            return
+        self.index = index
+        self.check(force=True)
+        print(f"Refreshed {len(index)} example answers in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=DEFAULT_PATH, help="Artifact path")
+    parser.add_argument("--k", default=",".join(str(k) for k in DEFAULT_RETRIEVAL_KS),
+                        help="Comma-separated retrieval k values to precompute")
+    parser.add_argument("--prompt-types", default=",".join(PROMPT_TYPES))
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    from meti_retrieval_2 import get_rag_system
+
+    rag_system = get_rag_system()
+
+    items = example_items(args.prompt_types.split(","), [int(k) for k in args.k.split(",")])
+    print(f"🧪 Precomputing {len(items)} example answers with {args.workers} workers")
+    start = time.perf_counter()
+    index = precompute(rag_system, items, workers=args.workers)
+    index.save(args.out)
+    print(f"✅ Wrote {len(index)} answers to {args.out} in {time.perf_counter() - start:.1f}s "
+          f"(corpus {index.corpus_version}, prompts {index.prompt_version}, model {index.model_id})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Compact, bounded per-session query history
+
+History entries keep only what the page shows after the fact: the
+question, answer, settings, timings and, per source, a SourceRef holding
+the retrieval score and a reference to the chunk in the process-wide
+DocumentStore (document_store.py). Sessions that retrieved the same chunk
+share one copy of it, so memory per concurrent user stays roughly
+constant; evicting or clearing history drops the references and lets
+unreferenced chunks be freed.
+"""
+
+DEFAULT_MAX_ENTRIES = 50
+
+
+class SourceRef:
+    """One source of a history entry: a shared chunk and this query's score"""
+
+    __slots__ = ("chunk", "score")
+
+    def __init__(self, chunk, score):
+        self.chunk = chunk
+        self.score = score
+
+    @classmethod
+    def from_document(cls, doc, store):
+        """Intern the document and keep a reference to the shared chunk
+
+        The packing retriever reports the retrieval score in metadata; it
+        stays on the ref so the shared chunk is the same for every query.
+        """
+        return cls(store.intern(doc, exclude_metadata=("score",)), (doc.metadata or {}).get("score"))
+
+    @property
+    def key(self):
+        return self.chunk.key
+
+    def resolve(self):
+        return self.chunk.to_document()
+
+
+class HistoryEntry:
+    __slots__ = ("question", "answer", "timestamp", "prompt_type", "retrieval_k", "language", "timings",
+                 "trace", "sources")
+
+    def __init__(self, question, answer, timestamp, prompt_type, retrieval_k, language, timings=None,
+                 trace=None, sources=()):
+        self.question = question
+        self.answer = answer
+        self.timestamp = timestamp
+        self.prompt_type = prompt_type
+        self.retrieval_k = retrieval_k
+        self.language = language
+        self.timings = timings or {}
+        self.trace = trace
+        self.sources = tuple(sources)
+
+    @classmethod
+    def from_result(cls, result, store, **fields):
+        sources = [SourceRef.from_document(doc, store) for doc in result.get('source_documents') or []]
+        return cls(answer=result['result'], timings=result.get('timings'), trace=result.get('trace'),
+                   sources=sources, **fields)
+
+    def source_documents(self):
+        return [source.resolve() for source in self.sources]
+
+
+class ChatHistory:
+    """Most recent max_entries entries of a session; older ones are evicted"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = []
+        # Entries dropped from the front, so query numbers stay stable after eviction
+        self.evicted = 0
+
+    def append(self, entry):
+        self._entries.append(entry)
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            del self._entries[:overflow]
+            self.evicted += overflow
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    @property
+    def total_queries(self):
+        return self.evicted + len(self._entries)
+
+    def latest(self):
+        return self._entries[-1] if self._entries else None
+
+    def page(self, page, page_size, skip_latest=True):
+        """Entries for one page, newest first, as (query_number, entry) pairs, plus the page count"""
+        entries = self._entries[:-1] if skip_latest else self._entries
+        numbered = [(self.evicted + i + 1, entry) for i, entry in enumerate(entries)][::-1]
+        pages = max(1, -(-len(numbered) // page_size))
+        page = min(max(page, 0), pages - 1)
+        return numbered[page * page_size:(page + 1) * page_size], pages
+
+    def clear(self):
+        self._entries.clear()
+        self.evicted = 0
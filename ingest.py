@@ -0,0 +1,373 @@
+"""Incremental ingestion of METI meeting PDFs into the Pinecone namespace
+
+Reads the PDFs in a local directory or under an S3 prefix, splits each
+page into chunks and upserts the chunks to the namespace the app queries,
+with the metadata the app already reads:
+
+    text                            the chunk text
+    x-amz-bedrock-kb-source-uri     s3:// URI of the PDF (presigned source links)
+    x-amz-bedrock-kb-page-number    1-based page the chunk comes from
+    committee, meeting              query_scope tags for committee filters
+
+A chunk id is <source hash>#<content hash>, so an unchanged chunk keeps
+its id and is never embedded twice. A manifest file records each PDF's
+version (S3 ETag, or size and mtime) and chunk ids:
+
+- unchanged PDFs are skipped without being downloaded
+- for a changed PDF only new chunks are embedded, and chunks it no longer
+  produces are deleted
+- for a PDF without a manifest entry, ids already in the namespace are
+  looked up first, so re-ingesting an unchanged corpus makes no embedding
+  calls even without the manifest
+
+A run that upserts or deletes anything ends by writing a hash of the
+manifest as the namespace's corpus version marker (see
+answer_cache.namespace_fingerprint). Chunks replaced in place keep the
+vector count, and the marker is what tells the app's caches the corpus
+changed.
+
+PDFs are chunked page by page on a process pool (see chunking), and the
+batches are embedded and upserted on a bounded thread pool, retried with
+backoff when Bedrock or Pinecone throttle. Embedding requests go through
+BatchedEmbeddings, which runs up to --embedding-concurrency Titan requests
+at once across all batches and backs off when Bedrock throttles.
+Requires pypdf.
+
+    python ingest.py --source s3://bucket/meti/2025/
+    python ingest.py --source ./pdfs --source-uri-prefix s3://bucket/meti/2025/
+    python ingest.py --source s3://bucket/meti/2025/ --prune --dry-run
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from answer_cache import mark_corpus_version
+from chunking import DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, ChunkingPool
+from embedding_batcher import DEFAULT_MAX_CONCURRENCY, BatchedEmbeddings
+from retry import backoff_delay, is_throttling_error
+
+DEFAULT_MANIFEST_PATH = "ingest_manifest.json"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 5
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+
+
+class SourceDocument:
+    """A PDF to ingest: its source URI, a version that changes with its content, and where to read it
+
+    location is ("file", path) or ("s3", bucket, key), see chunking.local_copy.
+    """
+
+    __slots__ = ("uri", "version", "location")
+
+    def __init__(self, uri, version, location):
+        self.uri = uri
+        self.version = version
+        self.location = location
+
+
+def list_local_pdfs(directory, uri_prefix=None):
+    """PDFs under directory; their URI is uri_prefix + relative path (an s3:// prefix keeps source links working)"""
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if not name.lower().endswith(".pdf"):
+                continue
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, directory).replace(os.sep, "/")
+            uri = uri_prefix.rstrip("/") + "/" + relative if uri_prefix else os.path.abspath(path)
+            stat = os.stat(path)
+            yield SourceDocument(uri, f"{stat.st_size}:{stat.st_mtime_ns}", ("file", path))
+
+
+def list_s3_pdfs(s3_client, bucket, prefix=""):
+    """PDFs under an S3 prefix, versioned by ETag"""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get("Contents", []):
+            key = item["Key"]
+            if not key.lower().endswith(".pdf"):
+                continue
+            yield SourceDocument(f"s3://{bucket}/{key}", item["ETag"].strip('"'), ("s3", bucket, key))
+
+
+class IngestManifest:
+    """Version and chunk ids of every ingested PDF, saved as JSON"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.documents = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.documents = json.load(f).get("documents", {})
+
+    def get(self, uri):
+        return self.documents.get(uri)
+
+    def set(self, uri, version, ids):
+        with self._lock:
+            self.documents[uri] = {"version": version, "ids": sorted(ids)}
+
+    def remove(self, uri):
+        with self._lock:
+            self.documents.pop(uri, None)
+
+    def digest(self):
+        """Hash of every document's version and chunk ids"""
+        with self._lock:
+            content = json.dumps(self.documents, sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+    def save(self):
+        """Write the manifest atomically"""
+        if not self.path:
+            return
+        with self._lock:
+            content = json.dumps({"documents": self.documents}, ensure_ascii=False, indent=1)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, self.path)
+
+
+class PineconeTarget:
+    """Upserts, deletes and id lookups against one Pinecone namespace"""
+
+    def __init__(self, index, namespace, fetch_batch_size=100):
+        self.index = index
+        self.namespace = namespace
+        self.fetch_batch_size = fetch_batch_size
+
+    def existing_ids(self, ids):
+        found = set()
+        for i in range(0, len(ids), self.fetch_batch_size):
+            batch = ids[i:i + self.fetch_batch_size]
+            found.update(self.index.fetch(ids=batch, namespace=self.namespace).vectors.keys())
+        return found
+
+    def upsert(self, records):
+        self.index.upsert(
+            vectors=[{"id": record["id"], "values": record["values"], "metadata": record["metadata"]}
+                     for record in records],
+            namespace=self.namespace
+        )
+
+    def delete(self, ids):
+        for i in range(0, len(ids), 1000):
+            self.index.delete(ids=ids[i:i + 1000], namespace=self.namespace)
+
+    def mark_version(self, version):
+        mark_corpus_version(self.index, self.namespace, version)
+
+
+def _with_retries(call, max_retries):
+    for attempt in range(max_retries + 1):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == max_retries or not is_throttling_error(e):
+                raise
+            time.sleep(backoff_delay(attempt))
+
+
+class _DocumentState:
+    __slots__ = ("source", "known_ids", "ids", "futures")
+
+    def __init__(self, source, entry):
+        self.source = source
+        # Ids the manifest says are already in the namespace
+        self.known_ids = set(entry["ids"]) if entry else set()
+        self.ids = set()
+        self.futures = []
+
+
+class Ingestor:
+    """Embed and upsert the new chunks of each changed PDF, and delete the chunks it no longer has
+
+    Changed PDFs are chunked page by page on a ChunkingPool of processes
+    worker processes, and their batches are embedded and upserted on
+    concurrency threads. At most 2 x concurrency batches are in flight;
+    beyond that the ingestor stops taking batches from the pool, whose
+    queue fills up and makes the chunking workers wait.
+    """
+
+    def __init__(self, embeddings, target, manifest=None, batch_size=DEFAULT_BATCH_SIZE,
+                 concurrency=DEFAULT_CONCURRENCY, processes=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 overlap=DEFAULT_CHUNK_OVERLAP, max_retries=DEFAULT_MAX_RETRIES, dry_run=False):
+        self.embeddings = embeddings
+        self.target = target
+        self.manifest = manifest or IngestManifest()
+        self.concurrency = concurrency
+        self.pool = ChunkingPool(processes, chunk_size=chunk_size, overlap=overlap, batch_size=batch_size)
+        self.max_retries = max_retries
+        self.dry_run = dry_run
+        self.stats = {"documents": 0, "unchanged_documents": 0, "failed_documents": 0, "chunks": 0,
+                      "new_chunks": 0, "embedded": 0, "embedding_calls": 0, "deleted": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **counts):
+        with self._stats_lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    def _process_batch(self, state, records):
+        """Embed and upsert the records of a batch that are not in the namespace yet"""
+        # Ids the manifest does not know (first run, lost manifest, interrupted run) may still be in the namespace
+        unknown = [record["id"] for record in records if record["id"] not in state.known_ids]
+        present = self.target.existing_ids(unknown) if unknown else set()
+        new = [record for record in records if record["id"] not in state.known_ids and record["id"] not in present]
+        self._count(new_chunks=len(new))
+        if not new or self.dry_run:
+            return len(new)
+
+        vectors = _with_retries(lambda: self.embeddings.embed_documents([r["text"] for r in new]), self.max_retries)
+        self._count(embedding_calls=1, embedded=len(new))
+        for record, vector in zip(new, vectors):
+            record["values"] = vector
+        _with_retries(lambda: self.target.upsert(new), self.max_retries)
+        return len(new)
+
+    def _finish_document(self, state):
+        """Once all batches of a PDF are upserted, delete its stale chunks and record it in the manifest"""
+        new = sum(future.result() for future in state.futures)
+        stale = sorted(state.known_ids - state.ids)
+        if not self.dry_run:
+            # Stale chunks go only after their replacements are searchable
+            if stale:
+                _with_retries(lambda: self.target.delete(stale), self.max_retries)
+            self.manifest.set(state.source.uri, state.source.version, state.ids)
+        self._count(documents=1, chunks=len(state.ids), deleted=len(stale))
+        print(f"📄 {state.source.uri}: {len(state.ids)} chunks, {new} new, {len(stale)} removed")
+
+    def _fail_document(self, state, error):
+        # One bad PDF should not stop the rest; without a manifest update it is retried on the next run
+        self._count(documents=1, failed_documents=1)
+        print(f"❌ {state.source.uri}: {error}")
+
+    def prune(self, uris):
+        """Delete the chunks of manifest documents that are no longer in the source"""
+        removed = [uri for uri in list(self.manifest.documents) if uri not in uris]
+        for uri in removed:
+            ids = self.manifest.get(uri)["ids"]
+            if not self.dry_run:
+                _with_retries(lambda: self.target.delete(ids), self.max_retries)
+                self.manifest.remove(uri)
+            self._count(deleted=len(ids))
+            print(f"🗑️  {uri}: {len(ids)} chunks removed")
+        return removed
+
+    def ingest(self, sources, prune=False):
+        """Ingest every source document and return the stats"""
+        sources = list(sources)
+        start = time.perf_counter()
+
+        states = {}
+        for source in sources:
+            entry = self.manifest.get(source.uri)
+            if entry and entry["version"] == source.version:
+                self._count(documents=1, unchanged_documents=1)
+            else:
+                states[source.uri] = _DocumentState(source, entry)
+
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ingest") as batches:
+            events = self.pool.run((state.source.uri, state.source.location) for state in states.values())
+            for event, uri, payload in events:
+                state = states[uri]
+                if event == "batch":
+                    state.ids.update(record["id"] for record in payload)
+                    if len(in_flight) >= 2 * self.concurrency:
+                        # Back-pressure: wait for a batch to finish before taking the next one
+                        _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    future = batches.submit(self._process_batch, state, payload)
+                    state.futures.append(future)
+                    in_flight.add(future)
+                elif event == "done":
+                    try:
+                        self._finish_document(state)
+                    except Exception as e:
+                        self._fail_document(state, f"{type(e).__name__}: {e}")
+                else:
+                    self._fail_document(state, payload)
+
+        if prune:
+            self.prune({source.uri for source in sources})
+        if not self.dry_run:
+            self.manifest.save()
+            if self.stats["embedded"] or self.stats["deleted"]:
+                # The vector count alone misses chunks replaced in place
+                _with_retries(lambda: self.target.mark_version(self.manifest.digest()), self.max_retries)
+        self.stats["elapsed"] = time.perf_counter() - start
+        return dict(self.stats)
+
+
+def parse_s3_prefix(uri):
+    """(bucket, prefix) of an s3://bucket/prefix URI"""
+    bucket, _, prefix = uri[len("s3://"):].partition("/")
+    return bucket, prefix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True, help="Local directory or s3://bucket/prefix of PDFs")
+    parser.add_argument("--source-uri-prefix", help="s3:// URI the local directory is uploaded to (for source links)")
+    parser.add_argument("--namespace", help="Defaults to PINECONE_NAMESPACE")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Maximum characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per embedding/upsert batch")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Batches in flight")
+    parser.add_argument("--embedding-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help="Most Titan requests in flight (adapts down when throttled)")
+    parser.add_argument("--processes", type=int, help="Chunking worker processes (default: one per CPU, 0 inline)")
+    parser.add_argument("--prune", action="store_true", help="Delete chunks of PDFs no longer in the source")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    import boto3
+    from dotenv import load_dotenv
+    from langchain_aws import BedrockEmbeddings
+    from pinecone import Pinecone
+
+    load_dotenv()
+    region = os.getenv("AWS_REGION")
+    if args.source.startswith("s3://"):
+        bucket, prefix = parse_s3_prefix(args.source)
+        sources = list_s3_pdfs(boto3.client("s3", region_name=region), bucket, prefix)
+    else:
+        sources = list_local_pdfs(args.source, args.source_uri_prefix)
+
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    index = pc.Index(os.getenv("PINECONE_INDEX_NAME"))
+    namespace = args.namespace or os.getenv("PINECONE_NAMESPACE")
+    ingestor = Ingestor(
+        BatchedEmbeddings(BedrockEmbeddings(model_id=EMBEDDING_MODEL_ID, region_name=region),
+                          batch_size=args.batch_size, max_concurrency=args.embedding_concurrency),
+        PineconeTarget(index, namespace),
+        IngestManifest(args.manifest),
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        processes=args.processes,
+        chunk_size=args.chunk_size,
+        overlap=args.chunk_overlap,
+        dry_run=args.dry_run
+    )
+    stats = ingestor.ingest(sources, prune=args.prune)
+    print(f"\n✅ {stats['documents']} documents ({stats['unchanged_documents']} unchanged, "
+          f"{stats['failed_documents']} failed): {stats['chunks']} chunks, {stats['new_chunks']} new, "
+          f"{stats['embedded']} embedded "
+          f"in {stats['embedding_calls']} batches, {stats['deleted']} deleted, {stats['elapsed']:.1f}s"
+          + (" (dry run)" if args.dry_run else ""))
+    embedding_stats = ingestor.embeddings.stats()
+    print(f"   Titan: {embedding_stats['requests']} requests, {embedding_stats['throttled']} throttled, "
+          f"{embedding_stats['duplicates']} duplicate texts skipped, "
+          f"concurrency limit {embedding_stats['concurrency_limit']}")
+
+
+if __name__ == "__main__":
+    main()
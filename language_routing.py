@@ -0,0 +1,110 @@
+"""Route each question to a single-language prompt before the chain runs
+
+The bilingual prompts ask the model to work out the question's language
+itself, which costs instructions on every query and sometimes produces a
+hedged answer in both languages. detect_language decides locally from the
+script mix of the question (a few microseconds), and the route picks:
+
+- the prompt variant for that language (prompts.build_prompt(language=...))
+- the answer cache partition (SemanticAnswerCache partitions by language)
+- the chain, since the language is part of the ChainRegistry key
+
+Retrieval is shared by both languages: the corpus is one namespace of
+Japanese documents and the Titan embeddings are multilingual, so a
+language filter would only drop relevant chunks for English questions.
+
+The query engine runs routing as its own traced stage, and the tracer
+counts queries per language (rag_queries_by_language_total on /metrics).
+
+    LANGUAGE_ROUTING=1              # 0 keeps the bilingual prompts
+    LANGUAGE_ROUTING_THRESHOLD=0.5
+
+    python language_routing.py "Watt Bitについて教えて" "What is 同時市場?"
+"""
+import argparse
+import os
+import re
+import time
+
+LANGUAGES = ("en", "ja")
+DEFAULT_THRESHOLD = 0.5
+# Hiragana marks Japanese grammar (particles, verb endings) rather than a borrowed term
+HIRAGANA_WEIGHT = 3
+
+_HIRAGANA = re.compile(r"[\u3040-\u309f]")
+# Katakana, CJK ideographs and half-width katakana
+_OTHER_JAPANESE = re.compile(r"[\u30a0-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff66-\uff9f]")
+_LATIN = re.compile(r"[A-Za-z\uff21-\uff3a\uff41-\uff5a]")
+
+
+def japanese_ratio(text):
+    """Weighted share of Japanese characters among the letters of text (0.0 when it has none)"""
+    japanese = HIRAGANA_WEIGHT * len(_HIRAGANA.findall(text)) + len(_OTHER_JAPANESE.findall(text))
+    letters = japanese + len(_LATIN.findall(text))
+    return japanese / letters if letters else 0.0
+
+
+def detect_language(text, threshold=DEFAULT_THRESHOLD):
+    """Return 'ja' if Japanese script dominates the text, otherwise 'en'
+
+    An English question naming a Japanese committee or term stays English:
+    "What is 同時市場?" is 'en', "Watt Bitについて教えて" is 'ja'.
+    """
+    return "ja" if japanese_ratio(text) >= threshold else "en"
+
+
+class Route:
+    __slots__ = ("language", "japanese_ratio", "prompt_language")
+
+    def __init__(self, language, japanese_ratio, prompt_language):
+        self.language = language
+        self.japanese_ratio = japanese_ratio
+        # None selects the bilingual prompt (routing disabled)
+        self.prompt_language = prompt_language
+
+    def chain_options(self):
+        return {'language': self.prompt_language} if self.prompt_language else {}
+
+
+class QueryRouter:
+    """Detect the language of each question and choose its prompt variant"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, enabled=True):
+        self.threshold = threshold
+        self.enabled = enabled
+
+    def route(self, question):
+        ratio = japanese_ratio(question)
+        language = "ja" if ratio >= self.threshold else "en"
+        return Route(language, ratio, language if self.enabled else None)
+
+
+def router_of(rag_system):
+    """The rag_system's router, or a default one for systems built without it"""
+    return rag_system.get('router') or QueryRouter()
+
+
+def router_from_env():
+    """QueryRouter configured by LANGUAGE_ROUTING and LANGUAGE_ROUTING_THRESHOLD"""
+    return QueryRouter(
+        threshold=float(os.getenv("LANGUAGE_ROUTING_THRESHOLD", str(DEFAULT_THRESHOLD))),
+        enabled=os.getenv("LANGUAGE_ROUTING", "1").lower() in ("1", "true", "yes")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the language route of each question")
+    parser.add_argument("questions", nargs="+")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    router = QueryRouter(args.threshold)
+    for question in args.questions:
+        start = time.perf_counter()
+        route = router.route(question)
+        elapsed = time.perf_counter() - start
+        print(f"{route.language}  ratio={route.japanese_ratio:.2f}  {elapsed * 1e6:.1f}µs  {question}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""Prebuilt BM25 index over the corpus snapshot, fused with vector search
+
+Dense retrieval alone often misses exact committee names
+(同時市場の在り方等に関する検討会) and meeting numbers ("85th", 第85回).
+The lexical index tokenizes text into lowercased ASCII words (with
+ordinal suffixes stripped, so "85th" also matches "85") and overlapping
+CJK character bigrams, which needs no Japanese morphological analyzer.
+
+The index is stored next to the snapshot as flat numpy arrays in CSR
+layout: for every term, a slice of document positions and their
+precomputed BM25 weights. A lookup is a dictionary access and a
+vectorized add per query term, with no per-document work.
+
+    python lexical_index.py build --snapshot snapshots/meti
+    python lexical_index.py query --snapshot snapshots/meti "同時市場 第15回"
+
+HybridVectorStore wraps any vector store (Pinecone or local) and fuses
+its results with the lexical ones by reciprocal rank fusion, so the
+chains, packing retriever and query engine pick it up unchanged.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from local_index import LocalVectorStore, PartitionCache
+from snapshot import open_snapshot
+
+FORMAT_VERSION = 1
+LEXICAL_DIR = "lexical"
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+# Standard reciprocal rank fusion constant
+DEFAULT_RRF_K = 60
+
+_WORD = re.compile(r"[a-z0-9]+")
+_ORDINAL = re.compile(r"^(\d+)(st|nd|rd|th)$")
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff66-\uff9f]+")
+_STOPWORDS = {
+    "the", "a", "an", "of", "in", "on", "for", "to", "and", "or", "is", "are", "was", "were", "what", "which",
+    "how", "why", "when", "who", "does", "do", "did", "be", "by", "with", "about", "at", "from", "this", "that",
+}
+
+
+def tokenize(text):
+    """ASCII words and CJK character bigrams (single characters for one-character runs)"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for word in _WORD.findall(text):
+        if word in _STOPWORDS:
+            continue
+        tokens.append(word)
+        ordinal = _ORDINAL.match(word)
+        if ordinal:
+            tokens.append(ordinal.group(1))
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """Inverted index with precomputed BM25 weights per (term, document)"""
+
+    def __init__(self, vocabulary, offsets, positions, weights, count, fingerprint=None):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.positions = positions
+        self.weights = weights
+        self.count = count
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, texts, k1=DEFAULT_K1, b=DEFAULT_B, fingerprint=None):
+        term_counts = [Counter(tokenize(text)) for text in texts]
+        lengths = np.array([sum(counts.values()) for counts in term_counts], dtype=np.float32)
+        average_length = float(lengths.mean()) if len(lengths) else 0.0
+
+        postings = {}
+        for position, counts in enumerate(term_counts):
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((position, tf))
+
+        count = len(term_counts)
+        vocabulary, offsets, positions, weights = {}, [0], [], []
+        for term_id, (term, entries) in enumerate(sorted(postings.items())):
+            vocabulary[term] = term_id
+            idf = math.log(1 + (count - len(entries) + 0.5) / (len(entries) + 0.5))
+            for position, tf in entries:
+                norm = k1 * (1 - b + b * lengths[position] / average_length) if average_length else k1
+                positions.append(position)
+                weights.append(idf * tf * (k1 + 1) / (tf + norm))
+            offsets.append(len(positions))
+
+        return cls(vocabulary, np.array(offsets, dtype=np.int64), np.array(positions, dtype=np.int32),
+                   np.array(weights, dtype=np.float32), count, fingerprint=fingerprint)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "positions.npy"), self.positions)
+        np.save(os.path.join(path, "weights.npy"), self.weights)
+        with open(os.path.join(path, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocabulary, f, ensure_ascii=False, separators=(",", ":"))
+        with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "count": self.count, "terms": len(self.vocabulary),
+                       "postings": len(self.positions), "fingerprint": self.fingerprint}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported lexical index version: {manifest.get('version')}")
+        with open(os.path.join(path, "vocabulary.json"), encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        return cls(vocabulary, load("offsets.npy"), load("positions.npy"), load("weights.npy"),
+                   manifest["count"], fingerprint=manifest.get("fingerprint"))
+
+    def __len__(self):
+        return self.count
+
+    def search(self, query, k=10, allowed=None):
+        """Return [(position, bm25_score)] for the top-k documents containing any query term"""
+        scores = np.zeros(self.count, dtype=np.float32)
+        matched = False
+        for term, query_tf in Counter(tokenize(query)).items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # Positions are unique within a posting list, so fancy-index add is safe
+            scores[self.positions[start:end]] += query_tf * self.weights[start:end]
+            matched = True
+        if not matched:
+            return []
+        if allowed is not None:
+            mask = np.zeros(self.count, dtype=bool)
+            mask[allowed] = True
+            scores[~mask] = 0
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return []
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+def load_or_build(corpus, path=None, fingerprint=None):
+    """Load the index saved under path, or build it from corpus.texts (and save it if path is given)
+
+    A saved index whose fingerprint differs from the corpus fingerprint is
+    rebuilt, so a re-exported snapshot never serves a stale index.
+    """
+    if path and os.path.exists(os.path.join(path, "manifest.json")):
+        index = BM25Index.load(path)
+        if fingerprint is None or index.fingerprint == fingerprint:
+            return index
+    index = BM25Index.build(corpus.texts, fingerprint=fingerprint)
+    if path:
+        try:
+            index.save(path)
+        except OSError:
+            # Read-only snapshot directory: keep the in-memory index
+            pass
+    return index
+
+
+class LexicalSearcher:
+    """BM25 index plus the corpus rows (ids, texts, metadatas) it was built from"""
+
+    def __init__(self, corpus, index):
+        self.corpus = corpus
+        self.index = index
+        # Share the partitions of a LocalVectorIndex corpus instead of computing them twice
+        self.partitions = getattr(corpus, "partitions", None) or PartitionCache(corpus.metadatas)
+
+    @classmethod
+    def from_snapshot(cls, path):
+        snapshot = open_snapshot(path)
+        return cls(snapshot, load_or_build(snapshot, os.path.join(path, LEXICAL_DIR), snapshot.fingerprint))
+
+    @classmethod
+    def from_local_index(cls, local_index, path=None):
+        """Share the rows of an already loaded LocalVectorIndex"""
+        lexical_path = os.path.join(path, LEXICAL_DIR) if path and os.path.isdir(path) else None
+        return cls(local_index, load_or_build(local_index, lexical_path, local_index.fingerprint()))
+
+    def search(self, query, k=10, metadata_filter=None):
+        allowed = None
+        if metadata_filter:
+            allowed = self.partitions.positions(metadata_filter)
+            if not len(allowed):
+                return []
+        results = []
+        for position, score in self.index.search(query, k=k, allowed=allowed):
+            document = Document(page_content=self.corpus.texts[position],
+                                metadata=dict(self.corpus.metadatas[position] or {}),
+                                id=self.corpus.ids[position])
+            results.append((document, score))
+        return results
+
+
+def reciprocal_rank_fusion(result_lists, k, rrf_k=DEFAULT_RRF_K):
+    """Fuse ranked [(document, score)] lists into the top-k [(document, rrf_score)]
+
+    Documents are matched by chunk text, so a chunk found by both searches
+    is counted once even when only one side reports vector ids.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, (doc, _) in enumerate(results):
+            entry = fused.setdefault(doc.page_content, [doc, 0.0])
+            entry[1] += 1.0 / (rrf_k + rank + 1)
+    ranked = sorted(fused.values(), key=lambda entry: entry[1], reverse=True)
+    return [(doc, score) for doc, score in ranked[:k]]
+
+
+class HybridVectorStore(VectorStore):
+    """Vector store whose searches fuse dense results with BM25 results (read-only)"""
+
+    def __init__(self, vectorstore, lexical, lexical_k=None, rrf_k=DEFAULT_RRF_K):
+        self.vectorstore = vectorstore
+        self.lexical = lexical
+        self.lexical_k = lexical_k
+        self.rrf_k = rrf_k
+
+    @property
+    def embeddings(self):
+        return self.vectorstore.embeddings
+
+    def fingerprint(self):
+        return self.vectorstore.fingerprint()
+
+    def _fuse(self, query, k, dense, metadata_filter):
+        # Lexical lookups are cheap, so take a deeper list from that side
+        lexical = self.lexical.search(query, k=self.lexical_k or 2 * k, metadata_filter=metadata_filter)
+        return reciprocal_rank_fusion([dense, lexical], k, self.rrf_k)
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        dense = self.vectorstore.similarity_search_with_score(query, k=k, filter=filter, **kwargs)
+        return self._fuse(query, k, dense, filter)
+
+    async def asimilarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        dense = await self.vectorstore.asimilarity_search_with_score(query, k=k, filter=filter, **kwargs)
+        return self._fuse(query, k, dense, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    async def asimilarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, filter, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # A document ranked first by both searches scores 1.0
+        best = 2.0 / (self.rrf_k + 1)
+        return lambda score: score / best
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("HybridVectorStore is read-only")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Wrap an existing vector store with HybridVectorStore(vectorstore, lexical)")
+
+
+def with_lexical_search(vectorstore, path):
+    """Wrap vectorstore in a HybridVectorStore over the snapshot directory at path
+
+    A LocalVectorStore already holds the corpus rows, so its index is
+    shared instead of opening the snapshot a second time. A JSONL export
+    has to be converted to a snapshot first (python snapshot.py import).
+    """
+    if isinstance(vectorstore, LocalVectorStore):
+        lexical = LexicalSearcher.from_local_index(vectorstore.index, path)
+    else:
+        lexical = LexicalSearcher.from_snapshot(path)
+    return HybridVectorStore(vectorstore, lexical)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the BM25 index of a snapshot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build the index and save it in the snapshot directory")
+    build_parser.add_argument("--snapshot", required=True, help="Snapshot directory (see snapshot.py)")
+
+    query_parser = subparsers.add_parser("query", help="Show the top lexical matches for a query")
+    query_parser.add_argument("--snapshot", required=True)
+    query_parser.add_argument("--k", type=int, default=5)
+    query_parser.add_argument("query")
+
+    args = parser.parse_args()
+    snapshot = open_snapshot(args.snapshot)
+    path = os.path.join(args.snapshot, LEXICAL_DIR)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        index = BM25Index.build(snapshot.texts, fingerprint=snapshot.fingerprint)
+        index.save(path)
+        print(f"✅ Indexed {len(index)} chunks ({len(index.vocabulary)} terms, {len(index.positions)} postings) "
+              f"in {time.perf_counter() - start:.1f}s -> {path}")
+        return
+
+    searcher = LexicalSearcher(snapshot, load_or_build(snapshot, path, snapshot.fingerprint))
+    start = time.perf_counter()
+    results = searcher.search(args.query, k=args.k)
+    elapsed = time.perf_counter() - start
+    print(f"🔎 {len(results)} matches in {elapsed * 1e6:.0f}µs")
+    for i, (doc, score) in enumerate(results, 1):
+        print(f"{i}. [{score:.2f}] {doc.metadata.get('x-amz-bedrock-kb-source-uri', doc.id)}")
+        print(f"   {doc.page_content[:120]}...")
+
+
+if __name__ == "__main__":
+    main()
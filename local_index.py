@@ -0,0 +1,255 @@
+"""In-process vector index used as a drop-in replacement for Pinecone
+
+The corpus (eight committees' 2025 meeting documents) fits easily in RAM, so
+retrieval can be a single matrix-vector product over normalized vectors
+instead of a network round trip. An approximate HNSW mode is available when
+hnswlib is installed.
+
+Export a snapshot of the Pinecone namespace (see snapshot.py):
+
+    python snapshot.py export --out snapshots/meti
+
+and select the local backend with VECTOR_BACKEND=local and
+LOCAL_INDEX_PATH=snapshots/meti.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from snapshot import open_snapshot
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+INDEX_MODES = ("exact", "hnsw")
+# Distinct filters whose row positions are kept (committee/meeting scopes are few)
+MAX_PARTITIONS = 256
+
+
+def _matches_filter(metadata, metadata_filter):
+    """Evaluate a Pinecone-style equality filter ({"field": value}, $eq, $in, $and, $or)"""
+    for field, condition in metadata_filter.items():
+        if field == "$and":
+            if not all(_matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif field == "$or":
+            if not any(_matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(field)
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$ne" in condition and value == condition["$ne"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$nin" in condition and value in condition["$nin"]:
+                return False
+        elif metadata.get(field) != condition:
+            return False
+    return True
+
+
+class PartitionCache:
+    """Row positions per metadata filter, computed once per filter over a metadata column"""
+
+    def __init__(self, metadatas, max_partitions=MAX_PARTITIONS):
+        self._metadatas = metadatas
+        self._max_partitions = max_partitions
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    def positions(self, metadata_filter):
+        key = json.dumps(metadata_filter, sort_keys=True, ensure_ascii=False)
+        positions = self._partitions.get(key)
+        if positions is not None:
+            return positions
+        positions = np.array(
+            [i for i, metadata in enumerate(self._metadatas) if _matches_filter(metadata or {}, metadata_filter)],
+            dtype=np.int64,
+        )
+        with self._lock:
+            if len(self._partitions) >= self._max_partitions:
+                self._partitions.clear()
+            self._partitions[key] = positions
+        return positions
+
+
+class LocalVectorIndex:
+    """Matrix of L2-normalized vectors with exact (or HNSW) cosine top-k"""
+
+    def __init__(self, ids, vectors, texts, metadatas, mode="exact", normalized=False, fingerprint=None):
+        if mode not in INDEX_MODES:
+            raise ValueError(f"mode must be one of {INDEX_MODES}")
+        if normalized and getattr(vectors, "dtype", None) == np.float32:
+            # Already unit length (e.g. a memory-mapped snapshot): use without copying
+            self.vectors = vectors
+        else:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.vectors = vectors / norms
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.mode = mode
+        self._fingerprint = fingerprint
+        self.partitions = PartitionCache(metadatas)
+        self._hnsw = None
+        if mode == "hnsw":
+            self._build_hnsw()
+
+    def _build_hnsw(self, ef_construction=200, m=16, ef_search=64):
+        if hnswlib is None:
+            raise ImportError("hnswlib is required for mode='hnsw' (pip install hnswlib)")
+        count, dimension = self.vectors.shape
+        self._hnsw = hnswlib.Index(space="cosine", dim=dimension)
+        self._hnsw.init_index(max_elements=max(count, 1), ef_construction=ef_construction, M=m)
+        if count:
+            self._hnsw.add_items(self.vectors, np.arange(count))
+        self._hnsw.set_ef(ef_search)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dimension(self):
+        return self.vectors.shape[1] if self.vectors.ndim == 2 else 0
+
+    def _normalize_query(self, vector):
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def filter_positions(self, metadata_filter):
+        """Row positions whose metadata matches the filter (cached per filter)"""
+        return self.partitions.positions(metadata_filter)
+
+    def search(self, vector, k=5, metadata_filter=None):
+        """Return [(position, cosine_similarity)] for the top-k rows"""
+        if not len(self.ids):
+            return []
+        query = self._normalize_query(vector)
+
+        if self._hnsw is not None:
+            allowed = None
+            if metadata_filter:
+                allowed = set(self.filter_positions(metadata_filter).tolist())
+                if not allowed:
+                    return []
+            k = min(k, len(allowed) if allowed is not None else len(self.ids))
+            labels, distances = self._hnsw.knn_query(
+                query, k=k, filter=(lambda label: label in allowed) if allowed is not None else None
+            )
+            return [(int(label), 1.0 - float(distance)) for label, distance in zip(labels[0], distances[0])]
+
+        if metadata_filter:
+            positions = self.filter_positions(metadata_filter)
+            if not len(positions):
+                return []
+            scores = self.vectors[positions] @ query
+        else:
+            positions = None
+            scores = self.vectors @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if positions is not None:
+            return [(int(positions[i]), float(scores[i])) for i in top]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def fingerprint(self):
+        """Stable identifier of the index content, used to invalidate caches"""
+        if self._fingerprint:
+            return self._fingerprint
+        digest = hashlib.sha256()
+        for vector_id, text, metadata in zip(self.ids, self.texts, self.metadatas):
+            digest.update(str(vector_id).encode("utf-8") + b"\x00" + (text or "").encode("utf-8") + b"\x00"
+                          + json.dumps(metadata or {}, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        # The index is read-only, so the content hash is computed once
+        self._fingerprint = f"local:{len(self.ids)}:{digest.hexdigest()[:16]}"
+        return self._fingerprint
+
+
+def load_snapshot(path, mode="exact"):
+    """Load a snapshot directory (memory-mapped) or a JSONL export"""
+    if os.path.isdir(path):
+        snapshot = open_snapshot(path)
+        return LocalVectorIndex(snapshot.ids, snapshot.vectors, snapshot.texts, snapshot.metadatas,
+                                mode=mode, normalized=True, fingerprint=snapshot.fingerprint)
+
+    ids, vectors, texts, metadatas = [], [], [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            ids.append(record["id"])
+            vectors.append(record["values"])
+            texts.append(record.get("text", ""))
+            metadatas.append(record.get("metadata", {}))
+    return LocalVectorIndex(ids, vectors, texts, metadatas, mode=mode)
+
+
+class LocalVectorStore(VectorStore):
+    """LangChain VectorStore over a LocalVectorIndex (read-only)"""
+
+    def __init__(self, index, embedding):
+        self.index = index
+        self._embedding = embedding
+
+    @classmethod
+    def from_snapshot(cls, path, embedding, mode="exact"):
+        return cls(load_snapshot(path, mode=mode), embedding)
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def fingerprint(self):
+        return self.index.fingerprint()
+
+    def _to_documents(self, matches):
+        results = []
+        for position, score in matches:
+            metadata = dict(self.index.metadatas[position] or {})
+            document = Document(page_content=self.index.texts[position], metadata=metadata,
+                                id=self.index.ids[position])
+            results.append((document, score))
+        return results
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None, **kwargs):
+        return self._to_documents(self.index.search(embedding, k=k, metadata_filter=filter))
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("LocalVectorStore is loaded from a snapshot and is read-only")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        vectors = embedding.embed_documents(list(texts))
+        metadatas = metadatas or [{} for _ in texts]
+        ids = kwargs.get("ids") or [str(i) for i in range(len(texts))]
+        index = LocalVectorIndex(ids, vectors, list(texts), list(metadatas), mode=kwargs.get("mode", "exact"))
+        return cls(index, embedding)
+
@@ -1,59 +1,90 @@
+"""Minimal RetrievalQA over the METI committee index: Titan embeddings, Pinecone and Claude Haiku
+
+Importing the module connects to nothing; get_qa() builds the chain and
+its clients on the first call and reuses them afterwards. build_qa()
+takes injected backends instead. The Pinecone client and the Titan
+embeddings (with their request limit and cache) are the ones
+meti_retrieval_2 shares.
+
+    python meti_retrieval.py
+    python meti_retrieval.py "What is the capacity market?" --k 3
+"""
+import argparse
 import os
-from dotenv import load_dotenv
-from pinecone import Pinecone
-from langchain_pinecone import PineconeVectorStore
-from langchain_aws import BedrockEmbeddings
-from langchain.chains import RetrievalQA
-from langchain_aws import ChatBedrock
-
-# Load environment variables
-load_dotenv()
-
-# AWS + Pinecone Configs
-AWS_REGION = os.getenv("AWS_REGION")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
-
-# Initialize Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX_NAME)
-
-# Initialize embeddings
-embedding = BedrockEmbeddings(
-    model_id="amazon.titan-embed-text-v2:0",
-    region_name=AWS_REGION
-)
-
-# Initialize vector store
-vectorstore = PineconeVectorStore(
-    index=index,
-    embedding=embedding,
-    text_key="text",  # this should match what you used during upload
-    namespace=os.getenv("PINECONE_NAMESPACE")  # specify namespace
-)
-
-# Initialize LLM
-llm = ChatBedrock(
-    model_id="anthropic.claude-3-haiku-20240307-v1:0",
-    region_name=AWS_REGION
-)
-
-# Create RetrievalQA Chain
-qa = RetrievalQA.from_chain_type(
-    llm=llm,
-    retriever=vectorstore.as_retriever(search_kwargs={"k": 5}),
-    return_source_documents=True
-)
-
-# Run a test query
-query = "What external changes are impacting Japan's electricity system?"
-result = qa.invoke({"query": query})
-
-# Print the result
-print("\n📢 Answer:\n", result["result"])
-print("\n📚 Source Documents:")
-for i, doc in enumerate(result["source_documents"]):
-    print(f"\n--- Document {i+1} ---")
-    print(f"Content: {doc.page_content[:200]}...")
-    print(f"Metadata: {doc.metadata}")
\ No newline at end of file
+
+from meti_retrieval_2 import get_embedding, get_index, load_environment, once
+
+DEFAULT_QUERY = "What external changes are impacting Japan's electricity system?"
+
+
+@once
+def get_vectorstore():
+    load_environment()
+    if os.getenv("VECTOR_BACKEND", "pinecone") == "local":
+        # In-process index loaded from a Pinecone namespace snapshot
+        from local_index import LocalVectorStore
+
+        return LocalVectorStore.from_snapshot(
+            os.getenv("LOCAL_INDEX_PATH"),
+            get_embedding(),
+            mode=os.getenv("LOCAL_INDEX_MODE", "exact")
+        )
+
+    from langchain_pinecone import PineconeVectorStore
+
+    return PineconeVectorStore(
+        index=get_index(),
+        embedding=get_embedding(),
+        text_key="text",  # this should match what you used during upload
+        namespace=os.getenv("PINECONE_NAMESPACE")  # specify namespace
+    )
+
+
+@once
+def get_llm():
+    load_environment()
+    from langchain_aws import ChatBedrock
+
+    return ChatBedrock(
+        model_id="anthropic.claude-3-haiku-20240307-v1:0",
+        region_name=os.getenv("AWS_REGION")
+    )
+
+
+def build_qa(llm=None, vectorstore=None, k=5):
+    """RetrievalQA chain over vectorstore (default get_vectorstore()) answered by llm (default get_llm())"""
+    from langchain.chains import RetrievalQA
+
+    return RetrievalQA.from_chain_type(
+        llm=llm if llm is not None else get_llm(),
+        retriever=(vectorstore if vectorstore is not None else get_vectorstore()).as_retriever(search_kwargs={"k": k}),
+        return_source_documents=True
+    )
+
+
+@once
+def get_qa():
+    return build_qa()
+
+
+def print_result(result):
+    print("\n📢 Answer:\n", result["result"])
+    print("\n📚 Source Documents:")
+    for i, doc in enumerate(result["source_documents"]):
+        print(f"\n--- Document {i+1} ---")
+        print(f"Content: {doc.page_content[:200]}...")
+        print(f"Metadata: {doc.metadata}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a question with the minimal RetrievalQA chain")
+    parser.add_argument("query", nargs="?", default=DEFAULT_QUERY)
+    parser.add_argument("--k", type=int, default=5, help="Documents to retrieve")
+    args = parser.parse_args()
+
+    qa = get_qa() if args.k == 5 else build_qa(k=args.k)
+    print_result(qa.invoke({"query": args.query}))
+
+
+if __name__ == "__main__":
+    main()
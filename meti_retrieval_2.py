@@ -1,152 +1,276 @@
+"""METI committee RAG pipeline as an importable library, with a command-line entry point
+
+Importing this module reads no configuration and opens no connections.
+Clients are created on first use, once per process, and shared:
+
+    get_embedding()     Titan embeddings (adaptive request limit, query-embedding cache)
+    get_llm()           Claude on Bedrock
+    get_index()         Pinecone index (VECTOR_BACKEND=pinecone)
+    get_rag_system()    the rag_system dict the query engine and batch runner take
+    get_answer_cache()  process-wide answer cache
+
+build_rag_system() assembles a rag_system from injected backends (a fake
+LLM, a local vector store, a worker's own clients) and builds only what
+is not given. The old module attributes (rag_system, chains, llm, ...)
+still resolve, on first access.
+
+    python meti_retrieval_2.py                                # batch test of the example queries
+    python meti_retrieval_2.py --query "What is the capacity market?" --prompt-type simple --k 3
+    python meti_retrieval_2.py --interactive
+"""
+import argparse
+import functools
 import os
-from dotenv import load_dotenv
-from pinecone import Pinecone
-from langchain_pinecone import PineconeVectorStore
-from langchain_aws import BedrockEmbeddings, ChatBedrock
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-
-# Load environment variables
-load_dotenv()
-
-# AWS + Pinecone Configs
-AWS_REGION = os.getenv("AWS_REGION")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
-
-# Initialize Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX_NAME)
-
-# Initialize embeddings
-embedding = BedrockEmbeddings(
-    model_id="amazon.titan-embed-text-v2:0",
-    region_name=AWS_REGION
-)
-
-# Initialize vector store
-vectorstore = PineconeVectorStore(
-    index=index,
-    embedding=embedding,
-    text_key="text",
-    namespace=os.getenv("PINECONE_NAMESPACE")
-)
-
-# Initialize LLM
-llm = ChatBedrock(
-    model_id="anthropic.claude-3-haiku-20240307-v1:0",
-    region_name=AWS_REGION
-)
-
-# Define comprehensive custom prompt templates
-SYSTEM_PROMPT_TEMPLATE = """You are an expert assistant specializing in Japan's electricity and energy policy, with access to detailed information from 8 key METI (Ministry of Economy, Trade and Industry) committee meetings held in 2025.
-
-## Your Knowledge Base
-Your knowledge base contains official meeting documents from these committees:
-
-1. **Subcommittee on Basic Electricity and Gas Policy** (電力・ガス基本政策小委員会)
-   - Meetings: 85th-87th committee meetings
-   - Focus: Fundamental electricity and gas policy frameworks, regulatory reforms, market mechanisms
-
-2. **Subcommittee on Large-Scale Introduction of Renewable Energy and Next-Generation Electricity Networks** (再生可能エネルギー大量導入・次世代電力ネットワーク小委員会)
-   - Meetings: 72nd-74th committee meetings
-   - Focus: Large-scale renewable energy deployment, grid modernization, network infrastructure
-
-3. **Next Generation Power System Working Group** (次世代電力系統ワーキンググループ)
-   - Meetings: 1st-2nd sessions in 2025
-   - Focus: Advanced power system technologies, grid flexibility, smart grid implementation
-
-4. **Study Group on Next-Generation Distributed Power Systems** (次世代の分散型電力システムに関する検討会)
-   - Meetings: 12th study group meeting
-   - Focus: Distributed energy resources, microgrids, decentralized power systems
-
-5. **Watt Bit Collaboration Public-Private Forum** (ワット・ビット連携官民懇談会)
-   - Meetings: 1st-3rd sessions in 2025
-   - Focus: Digital transformation in energy sector, data utilization, public-private partnerships
-
-6. **Carbon Management Subcommittee** (カーボンマネジメント小委員会)
-   - Meetings: 9th meeting
-   - Focus: Carbon management strategies, decarbonization policies, emission reduction measures
-
-7. **Study Group on the Status of Simultaneous Markets** (同時市場の在り方等に関する検討会)
-   - Meetings: 13th-17th meetings
-   - Focus: Electricity market design, market coupling, simultaneous market operations
-
-8. **Committee on Adjustment Capacity and Supply-Demand Balance Evaluation** (調整力及び需給バランス評価等に関する委員会)
-   - Focus: Grid balancing services, supply-demand management, adjustment capacity mechanisms
-
-## Response Guidelines
-When answering questions, follow this structure:
-
-1. **Direct Answer**: Provide a clear, concise answer to the question
-2. **Supporting Details**: Include relevant details, data, or policy specifics from the meetings
-3. **Committee Context**: Explain which committee(s) discussed this topic and why it's relevant
-4. **Source Attribution**: Clearly cite the specific meeting(s) and documents used
-5. **Related Information**: Mention any related topics or cross-committee discussions when relevant
-
-## Response Requirements
-- ✅ Cite specific committee meetings and sources
-- ✅ Provide context about which committee discussed the topic
-- ✅ Use official METI terminology and policy language
-- ✅ Include Japanese terms when appropriate for authenticity
-- ✅ Be accurate and precise, avoiding speculation beyond documented information
-- ✅ If information is not available in the documents, clearly state this limitation
-- ✅ Maintain professional and authoritative tone appropriate for government policy discussions
-- ✅ **LANGUAGE MATCHING: If the user asks a question in Japanese, respond entirely in Japanese. If the user asks in English, respond in English. Match the user's language preference.**
-
-## Context Information
-Based on the following retrieved documents from METI committee meetings:
-
-{context}
-
-## User Question
-{question}
-
-## Response
-Please provide a comprehensive answer following the guidelines above:"""
-
-# Alternative shorter prompt for simple queries
-SIMPLE_PROMPT_TEMPLATE = """You are a METI energy policy expert with access to 2025 committee meeting documents from 8 key committees covering electricity, renewable energy, grid systems, and market reforms.
-
-Context from retrieved documents:
-{context}
-
-Question: {question}
-
-Instructions:
-- Answer based solely on the provided context
-- Cite specific committee meetings when possible
-- Include Japanese terms for key concepts
-- If information is not in the context, state this clearly
-- Maintain professional tone
-- **IMPORTANT: If the user's {question} is in Japanese, respond entirely in Japanese. If in English, respond in English.**
-Answer:"""
+import threading
 
-# Create multiple prompt options
-def create_prompt_template(template_type="comprehensive"):
-    """Create different types of prompt templates"""
-    
-    if template_type == "comprehensive":
-        template = SYSTEM_PROMPT_TEMPLATE
-    elif template_type == "simple":
-        template = SIMPLE_PROMPT_TEMPLATE
-    else:
-        raise ValueError("template_type must be 'comprehensive' or 'simple'")
-    
-    return PromptTemplate(
-        template=template,
-        input_variables=["context", "question"]
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+DEFAULT_BEDROCK_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+
+TEST_QUERIES = [
+    "What external changes are impacting Japan's electricity system?",
+    "What are the key challenges in renewable energy integration discussed in the committees?",
+    "What is the current status of electricity market reforms in Japan?",
+    "How is Japan addressing carbon management in the electricity sector?",
+    "What are the main focus areas of the Watt Bit Collaboration Forum?",
+    "What distributed power system technologies are being discussed?"
+]
+
+_build_lock = threading.RLock()
+
+
+def once(build):
+    """Memoize a zero-argument builder; concurrent first calls wait for a single build
+
+    The getter's reset() drops the value, so the next call builds it again.
+    """
+    values = []
+
+    @functools.wraps(build)
+    def get():
+        if not values:
+            # Reentrant: get_rag_system builds the other clients while holding it
+            with _build_lock:
+                if not values:
+                    values.append(build())
+        return values[0]
+
+    get.reset = values.clear
+    return get
+
+
+def _enabled(name, default="1"):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+@once
+def load_environment():
+    """Load .env into the environment, before the first client reads it"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    return True
+
+
+def build_embedding(region_name=None):
+    """Titan embeddings with the adaptive request limit and the query-embedding cache (region default AWS_REGION)"""
+    from langchain_aws import BedrockEmbeddings
+
+    from embedding_batcher import batched_embeddings_from_env
+    from embedding_cache import CachedEmbeddings
+
+    embedding = BedrockEmbeddings(
+        model_id=EMBEDDING_MODEL_ID,
+        region_name=region_name or os.getenv("AWS_REGION")
+    )
+
+    # Parallel Titan requests under an adaptive limit (EMBEDDING_CONCURRENCY, 0 disables)
+    embedding = batched_embeddings_from_env(embedding)
+
+    # Reuse query embeddings (memory LRU, plus a SQLite file shared by workers if configured)
+    return CachedEmbeddings(
+        embedding,
+        model_id=EMBEDDING_MODEL_ID,
+        persist_path=os.getenv("EMBEDDING_CACHE_PATH")
+    )
+
+
+@once
+def get_embedding():
+    load_environment()
+    return build_embedding()
+
+
+@once
+def get_llm():
+    load_environment()
+    from langchain_aws import ChatBedrock
+
+    return ChatBedrock(
+        model_id=os.getenv("BEDROCK_MODEL_ID", DEFAULT_BEDROCK_MODEL_ID),
+        region_name=os.getenv("AWS_REGION")
     )
 
-# Initialize with comprehensive prompt (default)
-prompt = create_prompt_template("comprehensive")
 
-# The QA chain will be created dynamically in the query functions
-# This allows for flexible prompt template selection
+@once
+def get_pinecone():
+    load_environment()
+    from pinecone import Pinecone
+
+    return Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+
+
+@once
+def get_index():
+    return get_pinecone().Index(os.getenv("PINECONE_INDEX_NAME"))
+
+
+@once
+def get_answer_cache():
+    """Process-wide answer cache for repeated and near-duplicate questions"""
+    load_environment()
+    from answer_cache import SemanticAnswerCache
+
+    return SemanticAnswerCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256")),
+        ttl_seconds=int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+    )
+
+
+def build_vectorstore(embedding, index=None, namespace=None):
+    """The configured vector store and its corpus_version callable
+
+    VECTOR_BACKEND=local loads a snapshot; otherwise the Pinecone namespace
+    of index (default get_index()). Hybrid search, reranking and committee
+    scoping are layered on as configured.
+    """
+    load_environment()
+    from lexical_index import with_lexical_search
+    from query_scope import with_query_scope
+    from rerank import with_reranking
+
+    backend = os.getenv("VECTOR_BACKEND", "pinecone")
+    if backend == "local":
+        # In-process index loaded from a Pinecone namespace snapshot
+        from local_index import LocalVectorStore
+
+        vectorstore = LocalVectorStore.from_snapshot(
+            os.getenv("LOCAL_INDEX_PATH"),
+            embedding,
+            mode=os.getenv("LOCAL_INDEX_MODE", "exact")
+        )
+        corpus_version = vectorstore.fingerprint
+    else:
+        from langchain_pinecone import PineconeVectorStore
+
+        from answer_cache import namespace_fingerprint
+
+        index = index if index is not None else get_index()
+        vectorstore = PineconeVectorStore(
+            index=index,
+            embedding=embedding,
+            text_key="text",
+            namespace=namespace
+        )
+        corpus_version = lambda: namespace_fingerprint(index, namespace)
+
+    dense_vectorstore = vectorstore
+
+    # Fuse dense results with a BM25 index of the snapshot (exact committee names, meeting numbers)
+    lexical_path = os.getenv("LEXICAL_INDEX_PATH", os.getenv("LOCAL_INDEX_PATH", "") if backend == "local" else "")
+    if lexical_path and _enabled("HYBRID_SEARCH"):
+        vectorstore = with_lexical_search(vectorstore, lexical_path)
+
+    # Fetch RERANK_FETCH_K candidates and keep the reranker's top k (RERANKER=none to disable)
+    vectorstore = with_reranking(vectorstore)
+
+    # Restrict searches to the committees and meetings named in the question (tagged corpora only)
+    vectorstore = with_query_scope(vectorstore, probe=dense_vectorstore)
+    return vectorstore, corpus_version
+
+
+# Create multiple prompt options
+def create_prompt_template(template_type="comprehensive", language=None):
+    """Create different types of prompt templates (static system prefix, context and question last)"""
+    from prompts import build_prompt
+
+    return build_prompt(template_type, language=language)
+
+
+def build_rag_system(embedding=None, llm=None, vectorstore=None, corpus_version=None, index=None,
+                     namespace=None, router=None, tracer=None):
+    """Components in the same shape as the app's initialize_rag_system, for the query engine and batch runner
+
+    Every argument is optional; what is not given comes from the shared
+    get_* clients and the environment. An injected vectorstore is used
+    as is (no hybrid search, reranking or scoping layered on) and needs a
+    corpus_version unless it has a fingerprint method.
+    """
+    load_environment()
+    from chain_registry import ChainRegistry, build_qa_chain
+    from context_packing import DEFAULT_TOKEN_BUDGET
+    from language_routing import router_from_env
+    from query_scope import committee_filter, scoping_enabled
+    from tracing import tracer_from_env
+
+    embedding = embedding if embedding is not None else get_embedding()
+    llm = llm if llm is not None else get_llm()
+    namespace = namespace if namespace is not None else os.getenv("PINECONE_NAMESPACE")
+    pc = None
+    if vectorstore is None:
+        if index is None and os.getenv("VECTOR_BACKEND", "pinecone") != "local":
+            pc, index = get_pinecone(), get_index()
+        vectorstore, built_version = build_vectorstore(embedding, index, namespace)
+        corpus_version = corpus_version or built_version
+    elif corpus_version is None:
+        corpus_version = getattr(vectorstore, "fingerprint", None) or (lambda: "unversioned")
+    token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", str(DEFAULT_TOKEN_BUDGET)))
+
+    return {
+        'vectorstore': vectorstore,
+        'embedding': embedding,
+        'llm': llm,
+        'pc': pc,
+        'index': index,
+        'namespace': namespace,
+        'corpus_version': corpus_version,
+        # QA chains are built on first use for each (prompt_type, k, language, committee) and then reused
+        'chains': ChainRegistry(
+            lambda prompt_type, retrieval_k, language=None, committee=None: build_qa_chain(
+                llm, vectorstore, create_prompt_template(prompt_type, language), retrieval_k,
+                token_budget=token_budget,
+                # Committee filters need a tagged corpus (untagged chunks would match nothing)
+                metadata_filter=committee_filter(committee) if scoping_enabled(vectorstore) else None
+            )
+        ),
+        # Route each question to a single-language prompt (LANGUAGE_ROUTING=0 keeps the bilingual one)
+        'router': router or router_from_env(),
+        # Per-stage tracing (JSONL/OpenTelemetry export and /metrics endpoint configured by env)
+        'tracer': tracer or tracer_from_env()
+    }
+
+
+@once
+def get_rag_system():
+    return build_rag_system()
+
+
+_RAG_SYSTEM_ATTRIBUTES = ('vectorstore', 'embedding', 'llm', 'pc', 'index', 'corpus_version', 'chains',
+                          'router', 'tracer')
+
+
+def __getattr__(name):
+    # Module attributes of the eager version of this module, built on first access
+    if name == 'rag_system':
+        return get_rag_system()
+    if name == 'answer_cache':
+        return get_answer_cache()
+    if name in _RAG_SYSTEM_ATTRIBUTES:
+        return get_rag_system()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Enhanced function to query the system with different prompt options
-def query_meti_committees(question, prompt_type="comprehensive", retrieval_k=5):
+def query_meti_committees(question, prompt_type="comprehensive", retrieval_k=5, committee=None, rag_system=None):
     """
     Query the METI committee knowledge base with customizable prompts
     
@@ -154,30 +278,56 @@ def query_meti_committees(question, prompt_type="comprehensive", retrieval_k=5):
         question (str): The user's question
         prompt_type (str): "comprehensive" or "simple" prompt template
         retrieval_k (int): Number of documents to retrieve (default: 5)
+        committee (str): Only search this committee (a query_scope key, default: all)
+        rag_system (dict): Components to query with (default: get_rag_system())
     
     Returns:
         dict: Query results with answer and source documents
     """
     try:
-        # Create the appropriate prompt template
-        current_prompt = create_prompt_template(prompt_type)
+        from language_routing import router_of
+        from tracing import TracingCallbackHandler
+
+        rag_system = rag_system or get_rag_system()
+        tracer = rag_system['tracer']
         
-        # Create QA chain with the selected prompt
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vectorstore.as_retriever(search_kwargs={"k": retrieval_k}),
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": current_prompt}
+        # Check the answer cache first, in the partition of the question's routed language
+        route = router_of(rag_system).route(question)
+        answer_cache = get_answer_cache()
+        answer_cache.check_corpus_version(rag_system['corpus_version'])
+        cached, hit_type, query_embedding = answer_cache.get(
+            question, prompt_type, retrieval_k, embed_fn=rag_system['embedding'].embed_query, committee=committee,
+            language=route.language
         )
+        if cached:
+            print(f"\n⚡ Cache hit ({hit_type}) for: {question}")
+            print(f"\n📢 Answer:\n{cached['result']}")
+            return cached
         
-        # Execute the query
-        result = qa_chain.invoke({"query": question})
+        # Get the QA chain for the selected prompt and the question's language
+        options = route.chain_options()
+        if committee:
+            options['committee'] = committee
+        qa_chain = rag_system['chains'].get(prompt_type, retrieval_k, **options)
+        
+        # Execute the query, recording retrieval and LLM spans
+        trace = tracer.start_trace("rag.query", prompt_type=prompt_type, retrieval_k=retrieval_k,
+                                   language=route.language)
+        try:
+            result = qa_chain.invoke({"query": question}, config={"callbacks": [TracingCallbackHandler(trace)]})
+        except Exception as e:
+            tracer.finish(trace, error=e)
+            raise
+        tracer.finish(trace)
+        result['trace'] = trace.summary()
+        answer_cache.put(question, prompt_type, retrieval_k, result, query_embedding, committee=committee,
+                         language=route.language)
         
         # Display results
         print(f"\n🔍 Query: {question}")
-        print(f"📝 Prompt Type: {prompt_type}")
+        print(f"📝 Prompt Type: {prompt_type} ({route.language})")
         print(f"📄 Documents Retrieved: {len(result['source_documents'])}")
+        print("⏱️  " + ", ".join(f"{span['name']} {span['duration']:.2f}s" for span in result['trace']['spans']))
         print(f"\n📢 Answer:\n{result['result']}")
         
         if result['source_documents']:
@@ -239,42 +389,44 @@ def interactive_query():
             print("❌ Query failed. Please try again.")
 
 # Batch query function for testing
-def batch_query_test(test_queries, prompt_type="comprehensive"):
-    """Run multiple test queries in batch"""
+def batch_query_test(test_queries, prompt_type="comprehensive", output_path="batch_results.jsonl", workers=4,
+                     rag_system=None):
+    """Run multiple test queries in parallel and write results to a JSONL file"""
+    from batch_runner import question_id, run_batch
+    
     print(f"\n🧪 Running batch test with {prompt_type} prompt")
     print("=" * 60)
     
-    for i, query in enumerate(test_queries, 1):
-        print(f"\n🔬 Test Query {i}/{len(test_queries)}")
-        result = query_meti_committees(query, prompt_type)
-        
-        if i < len(test_queries):
-            print("\n" + "="*100)
-            input("⏸️  Press Enter to continue to next query...")
+    items = [
+        {"id": question_id(query, prompt_type, 5), "question": query,
+         "prompt_type": prompt_type, "retrieval_k": 5}
+        for query in test_queries
+    ]
+    summary = run_batch(rag_system or get_rag_system(), items, output_path, workers=workers)
     
-    print("\n✅ Batch testing completed!")
+    print(f"\n✅ Batch testing completed! Results written to {output_path}")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--query", help="Answer one question")
+    parser.add_argument("--interactive", action="store_true", help="Ask questions in a prompt loop")
+    parser.add_argument("--prompt-type", choices=("comprehensive", "simple"), default="comprehensive")
+    parser.add_argument("--k", type=int, default=5, help="Documents to retrieve")
+    parser.add_argument("--committee", help="Only search this committee (a query_scope key)")
+    parser.add_argument("--out", default="batch_results.jsonl", help="Batch test results file")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.interactive:
+        interactive_query()
+    elif args.query:
+        if query_meti_committees(args.query, args.prompt_type, args.k, committee=args.committee) is None:
+            raise SystemExit(1)
+    else:
+        # Test queries covering different committee topics
+        batch_query_test(TEST_QUERIES, args.prompt_type, output_path=args.out, workers=args.workers)
+
 
-# Example usage
 if __name__ == "__main__":
-    # Test queries covering different committee topics
-    test_queries = [
-        "What external changes are impacting Japan's electricity system?",
-        "What are the key challenges in renewable energy integration discussed in the committees?",
-        "What is the current status of electricity market reforms in Japan?",
-        "How is Japan addressing carbon management in the electricity sector?",
-        "What are the main focus areas of the Watt Bit Collaboration Forum?",
-        "What distributed power system technologies are being discussed?"
-    ]
-    
-    # Option 1: Interactive mode
-    # interactive_query()
-    
-    # Option 2: Batch testing mode
-    batch_query_test(test_queries, "comprehensive")
-    
-    # Option 3: Single query example
-    # single_result = query_meti_committees(
-    #     "What external changes are impacting Japan's electricity system?",
-    #     prompt_type="comprehensive",
-    #     retrieval_k=3
-    # )
\ No newline at end of file
+    main()
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_EXPIRATION = 3600
+# Refresh a URL once less than this fraction of its lifetime remains
+DEFAULT_REFRESH_FRACTION = 0.5
+DEFAULT_MAX_ENTRIES = 2048
+
+
+def parse_s3_uri(s3_uri):
+    """Split s3://bucket/key into (bucket, key); key is "" when the URI names only a bucket"""
+    bucket, _, key = s3_uri.replace("s3://", "", 1).partition("/")
+    return bucket, key
+
+
+class PresignedUrlCache:
+    """Cache presigned GET URLs per (bucket, key) and refresh them before they expire
+
+    presign is called as presign(bucket, key, expiration) and returns a URL;
+    in the app it wraps a single shared boto3 S3 client. The page is not
+    part of the signed URL: links add it as a #page= fragment, so every page
+    of a PDF shares one URL.
+    """
+
+    def __init__(self, presign, expiration=DEFAULT_EXPIRATION, refresh_fraction=DEFAULT_REFRESH_FRACTION,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.presign = presign
+        self.expiration = expiration
+        self.refresh_fraction = refresh_fraction
+        self.max_entries = max_entries
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _is_fresh(self, expires_at, expiration, now):
+        return expires_at - now > expiration * self.refresh_fraction
+
+    def get(self, bucket, key, expiration=None):
+        """Return a presigned URL with plenty of validity left"""
+        expiration = expiration or self.expiration
+        cache_key = (bucket, key)
+        now = time.time()
+        with self._lock:
+            cached = self._urls.get(cache_key)
+            if cached is not None and self._is_fresh(cached[1], expiration, now):
+                self._urls.move_to_end(cache_key)
+                self.hits += 1
+                return cached[0]
+
+        url = self.presign(bucket, key, expiration)
+        with self._lock:
+            self._urls[cache_key] = (url, now + expiration)
+            self._urls.move_to_end(cache_key)
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+            self.misses += 1
+        return url
+
+    def get_many(self, items, expiration=None):
+        """Presign a batch of (bucket, key) pairs, signing each distinct object once
+
+        Returns {(bucket, key): url}. Objects that fail to sign map to
+        the exception that was raised.
+        """
+        urls = {}
+        for item in dict.fromkeys(items):
+            try:
+                urls[item] = self.get(*item, expiration=expiration)
+            except Exception as e:
+                urls[item] = e
+        return urls
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._urls), "hits": self.hits, "misses": self.misses}
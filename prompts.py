@@ -0,0 +1,196 @@
+"""Prompt templates shared by the app and the retrieval scripts
+
+Each prompt is a static system message (role, committee knowledge base,
+response rules) followed by a human message holding only the variable
+parts: the retrieved context and the question, last. The system message
+is byte-identical on every query, so every query shares the same prefix.
+No cache_control breakpoint is sent: the prefixes are shorter than the
+minimum Anthropic will cache (the token report below shows the margin).
+
+Each prompt type has a bilingual variant and one per language ('en',
+'ja') for questions routed by language_routing, which replace the
+"answer in the language of the question" instruction with a fixed one.
+
+Print a token report for the templates:
+
+    python prompts.py
+"""
+import argparse
+import hashlib
+
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
+
+from tracing import estimate_tokens
+
+PROMPT_TYPES = ("comprehensive", "simple")
+
+# Anthropic only caches prefixes of at least this many tokens (2048 for the Haiku models)
+MIN_CACHEABLE_TOKENS = {"default": 1024, "haiku": 2048}
+
+COMMITTEE_KNOWLEDGE_BASE = """## Knowledge Base
+Official 2025 meeting documents from 8 METI (Ministry of Economy, Trade and Industry) committees:
+
+1. Subcommittee on Basic Electricity and Gas Policy (電力・ガス基本政策小委員会), meetings 85-87: electricity and gas policy frameworks, regulatory reform, market mechanisms
+2. Subcommittee on Large-Scale Introduction of Renewable Energy and Next-Generation Electricity Networks (再生可能エネルギー大量導入・次世代電力ネットワーク小委員会), meetings 72-74: large-scale renewables, grid modernization, network infrastructure
+3. Next Generation Power System Working Group (次世代電力系統ワーキンググループ), 2025 sessions 1-2: advanced power system technology, grid flexibility, smart grids
+4. Study Group on Next-Generation Distributed Power Systems (次世代の分散型電力システムに関する検討会), meeting 12: distributed energy resources, microgrids, decentralized systems
+5. Watt Bit Collaboration Public-Private Forum (ワット・ビット連携官民懇談会), 2025 sessions 1-3: digital transformation of energy, data utilization, public-private partnership
+6. Carbon Management Subcommittee (カーボンマネジメント小委員会), meeting 9: carbon management, decarbonization, emission reduction
+7. Study Group on the Status of Simultaneous Markets (同時市場の在り方等に関する検討会), meetings 13-17: market design, market coupling, simultaneous market operation
+8. Committee on Adjustment Capacity and Supply-Demand Balance Evaluation (調整力及び需給バランス評価等に関する委員会): balancing services, supply-demand management, adjustment capacity"""
+
+LANGUAGE_RULE = ("Answer in the language of the question: entirely in Japanese if it is written in Japanese, "
+                 "in English if it is written in English.")
+
+# Variants for questions already routed to one language (see language_routing); None is bilingual
+LANGUAGES = ("en", "ja")
+LANGUAGE_RULES = {
+    None: LANGUAGE_RULE,
+    "en": "Answer in English.",
+    "ja": "Answer entirely in Japanese.",
+}
+COMPREHENSIVE_TERMINOLOGY_RULES = {
+    None: "Use official METI terminology and include Japanese terms where appropriate",
+    "en": "Use official METI terminology and include Japanese terms where appropriate",
+    "ja": "Use official METI terminology",
+}
+SIMPLE_TERMINOLOGY_RULES = {
+    None: "Include Japanese terminology for technical terms where appropriate",
+    "en": "Include Japanese terminology for technical terms where appropriate",
+    "ja": "Use official METI terminology for technical terms",
+}
+NO_INFORMATION_ANSWERS = {
+    None: "The provided documents do not contain information related to this question.",
+    "en": "The provided documents do not contain information related to this question.",
+    "ja": "提供された文書には、この質問に関連する情報は含まれていません。",
+}
+
+COMPREHENSIVE_SYSTEM_TEMPLATE = """You are an expert assistant on Japan's electricity and energy policy, answering from retrieved METI committee meeting documents.
+
+{knowledge_base}
+
+## Answer Structure
+1. Direct answer: a clear, concise answer to the question
+2. Supporting details: relevant data and policy specifics from the meetings
+3. Committee context: which committee(s) discussed the topic and why it is relevant
+4. Sources: the specific meetings and documents used
+5. Related information: related topics or cross-committee discussions, when relevant
+
+## Rules
+- Use only the retrieved documents; do not speculate beyond them
+- If the documents do not cover the question, say so clearly
+- {terminology_rule}
+- Keep a professional, authoritative tone suited to government policy
+- {language_rule}"""
+
+SIMPLE_SYSTEM_TEMPLATE = """You are a METI energy policy expert answering from official 2025 committee meeting documents.
+
+## Rules
+- Answer using only the retrieved documents
+- Cite committee names and meeting numbers where possible
+- {terminology_rule}
+- Keep a formal, policy-expert tone
+- If the documents contain nothing relevant, say: "{no_information}"
+- {language_rule}"""
+
+
+def _system_prompt(template, terminology_rules, language):
+    return template.format(
+        knowledge_base=COMMITTEE_KNOWLEDGE_BASE,
+        terminology_rule=terminology_rules[language],
+        no_information=NO_INFORMATION_ANSWERS[language],
+        language_rule=LANGUAGE_RULES[language],
+    )
+
+
+# Keyed by (prompt_type, language)
+SYSTEM_PROMPTS = {
+    (prompt_type, language): _system_prompt(template, terminology_rules, language)
+    for prompt_type, template, terminology_rules in (
+        ("comprehensive", COMPREHENSIVE_SYSTEM_TEMPLATE, COMPREHENSIVE_TERMINOLOGY_RULES),
+        ("simple", SIMPLE_SYSTEM_TEMPLATE, SIMPLE_TERMINOLOGY_RULES),
+    )
+    for language in (None,) + LANGUAGES
+}
+COMPREHENSIVE_SYSTEM_PROMPT = SYSTEM_PROMPTS[("comprehensive", None)]
+SIMPLE_SYSTEM_PROMPT = SYSTEM_PROMPTS[("simple", None)]
+
+# The only per-query part, kept last so everything before it is a reusable prefix
+QUESTION_TEMPLATE = """Retrieved documents from METI committee meetings:
+
+{context}
+
+Question: {question}"""
+
+
+def system_message(prompt_type="comprehensive", language=None):
+    if prompt_type not in PROMPT_TYPES:
+        raise ValueError("prompt_type must be 'comprehensive' or 'simple'")
+    if language is not None and language not in LANGUAGES:
+        raise ValueError(f"language must be one of {LANGUAGES} or None")
+    return SystemMessage(content=SYSTEM_PROMPTS[(prompt_type, language)])
+
+
+def build_prompt(prompt_type="comprehensive", language=None):
+    """Chat prompt with input variables context and question
+
+    language ('en' or 'ja') selects the single-language variant for a routed
+    question; None keeps the bilingual instructions.
+    """
+    return ChatPromptTemplate.from_messages([
+        system_message(prompt_type, language),
+        HumanMessagePromptTemplate.from_template(QUESTION_TEMPLATE),
+    ])
+
+
+def prompt_version():
+    """Short hash of every template, stored with precomputed answers so a prompt change invalidates them"""
+    digest = hashlib.sha256()
+    for prompt_type in PROMPT_TYPES:
+        for language in (None,) + LANGUAGES:
+            digest.update(SYSTEM_PROMPTS[(prompt_type, language)].encode("utf-8") + b"\x00")
+    digest.update(QUESTION_TEMPLATE.encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def token_report(context_tokens=(0, 1500, 3000), question_tokens=30):
+    """Estimated tokens per template: static prefix, per-query part and totals for some context sizes"""
+    question_overhead = estimate_tokens(QUESTION_TEMPLATE.format(context="", question=""))
+    rows = []
+    for prompt_type in PROMPT_TYPES:
+        for language in (None,) + LANGUAGES:
+            prefix = estimate_tokens(SYSTEM_PROMPTS[(prompt_type, language)])
+            rows.append({
+                "prompt_type": prompt_type,
+                "language": language,
+                "prefix_tokens": prefix,
+                "variable_overhead_tokens": question_overhead,
+                "totals": {context: prefix + question_overhead + question_tokens + context
+                           for context in context_tokens},
+                "cacheable": {model: prefix >= minimum for model, minimum in MIN_CACHEABLE_TOKENS.items()},
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimated token counts of the prompt templates")
+    parser.add_argument("--context-tokens", default="0,1500,3000",
+                        help="Comma-separated retrieved context sizes to show totals for")
+    args = parser.parse_args()
+    context_sizes = tuple(int(size) for size in args.context_tokens.split(","))
+
+    print("📏 Prompt token report (estimated)")
+    print("=" * 60)
+    for row in token_report(context_sizes):
+        print(f"\n{row['prompt_type']} ({row['language'] or 'bilingual'}):")
+        print(f"  static prefix (system):   {row['prefix_tokens']:>6}")
+        print(f"  per-query template text:  {row['variable_overhead_tokens']:>6}")
+        for context, total in row["totals"].items():
+            print(f"  total with {context:>5} context: {total:>6}")
+        cacheable = ", ".join(f"{model}: {'yes' if ok else 'no'}" for model, ok in row["cacheable"].items())
+        print(f"  prefix long enough to cache ({cacheable})")
+
+
+if __name__ == "__main__":
+    main()
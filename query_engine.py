@@ -0,0 +1,339 @@
+"""Asyncio query engine for serving many concurrent questions
+
+One event loop (on a background thread) runs every query in the process.
+Each upstream (embedding, retrieval, generation) has its own in-flight
+limit, and requests are taken from a fair queue that round-robins between
+sessions, so one user firing many questions cannot starve the others.
+
+Synchronous callers (Streamlit script threads, batch runners) use submit()
+for a future or stream() for incremental events.
+"""
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+from langchain_core.prompts import format_document
+
+from language_routing import router_of
+from tracing import Tracer, estimate_tokens, usage_from_message
+
+DEFAULT_MAX_CONCURRENT_QUERIES = 16
+DEFAULT_STAGE_LIMITS = {
+    "embedding": 8,
+    "retrieval": 8,
+    "generation": 4,
+}
+
+_DONE = "done"
+_ERROR = "error"
+
+
+class FairQueue:
+    """Async queue that serves sessions round-robin instead of first-come-first-served"""
+
+    def __init__(self):
+        self._sessions = OrderedDict()
+        self._not_empty = asyncio.Condition()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    async def put(self, session_id, item):
+        async with self._not_empty:
+            self._sessions.setdefault(session_id, deque()).append(item)
+            self._size += 1
+            self._not_empty.notify()
+
+    async def get(self):
+        async with self._not_empty:
+            while not self._sessions:
+                await self._not_empty.wait()
+            session_id, items = self._sessions.popitem(last=False)
+            item = items.popleft()
+            self._size -= 1
+            # The session goes to the back of the line if it still has work queued
+            if items:
+                self._sessions[session_id] = items
+            return item
+
+
+class _Request:
+    __slots__ = ("question", "prompt_type", "retrieval_k", "committee", "session_id", "on_event", "future",
+                 "embedded", "submitted_at", "timings", "trace")
+
+    def __init__(self, question, prompt_type, retrieval_k, committee, session_id, on_event, future, embedded=None):
+        self.question = question
+        self.prompt_type = prompt_type
+        self.retrieval_k = retrieval_k
+        self.committee = committee
+        self.session_id = session_id
+        self.on_event = on_event
+        self.future = future
+        # (start_ns, end_ns) of an embedding of the question the caller already made
+        self.embedded = embedded
+        self.submitted_at = time.perf_counter()
+        self.timings = {}
+        self.trace = None
+
+
+class QueryEngine:
+    """Run RAG queries concurrently on a shared event loop
+
+    rag_system is the dict built by initialize_rag_system (it needs
+    'embedding', 'chains' and the chains' retriever and prompt, and uses
+    its 'router' when present). Each query is first routed to a language,
+    which selects the chain's prompt variant. The embedding stage runs
+    first so the retriever's own embedding call is a local hit in the
+    CachedEmbeddings wrapper. Every query is traced with
+    tracer (a tracing.Tracer, metrics only when none is given).
+    """
+
+    def __init__(self, rag_system, max_concurrent_queries=DEFAULT_MAX_CONCURRENT_QUERIES, stage_limits=None,
+                 tracer=None):
+        self.rag_system = rag_system
+        self.router = router_of(rag_system)
+        self.tracer = tracer or Tracer()
+        self.max_concurrent_queries = max_concurrent_queries
+        self.stage_limits = dict(DEFAULT_STAGE_LIMITS, **(stage_limits or {}))
+        self._loop = None
+        self._thread = None
+        self._started = threading.Event()
+        self._start_lock = threading.Lock()
+        self._queue = None
+        self._semaphores = {}
+        self._workers = []
+        self._in_flight = {stage: 0 for stage in self.stage_limits}
+        self._anonymous_sessions = itertools.count()
+        self.completed = 0
+        self.failed = 0
+
+    # ----- lifecycle -----
+
+    def start(self):
+        """Start the background event loop (idempotent)"""
+        with self._start_lock:
+            if self._thread is not None:
+                return self
+            self._thread = threading.Thread(target=self._run_loop, name="query-engine", daemon=True)
+            self._thread.start()
+        self._started.wait()
+        return self
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._setup())
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _setup(self):
+        self._queue = FairQueue()
+        self._semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in self.stage_limits.items()}
+        self._workers = [self._loop.create_task(self._worker()) for _ in range(self.max_concurrent_queries)]
+
+    async def _shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    def stop(self):
+        """Cancel the workers and stop the event loop"""
+        with self._start_lock:
+            if self._thread is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._thread = None
+            self._loop = None
+            self._started.clear()
+
+    # ----- public API -----
+
+    def submit(self, question, prompt_type="comprehensive", retrieval_k=5, session_id=None, on_event=None,
+               committee=None, embedded=None):
+        """Queue a query from any thread; returns a concurrent.futures.Future of the result dict
+
+        on_event(event, payload) is called from the engine thread with
+        ("sources", documents) and ("token", text) as they happen. committee
+        restricts retrieval to one committee (a query_scope key). embedded
+        is the (start_ns, end_ns) interval of an embedding of the question
+        the caller already made, such as the answer cache lookup
+        (tracing.TimedCall): it becomes the trace's embedding span, and the
+        trace starts there, instead of timing a cached re-embedding.
+        """
+        return self.schedule(self.aquery(question, prompt_type, retrieval_k, session_id, on_event, committee,
+                                         embedded))
+
+    def schedule(self, coroutine):
+        """Run a coroutine on the engine loop from another thread; returns a concurrent.futures.Future"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def stream(self, question, prompt_type="comprehensive", retrieval_k=5, session_id=None, timeout=None,
+               committee=None, embedded=None):
+        """Yield (event, payload) pairs in the calling thread
+
+        Events are ("sources", documents), ("token", text) and finally
+        ("done", result). Exceptions from the query are re-raised.
+        """
+        events = queue.Queue()
+        future = self.submit(question, prompt_type, retrieval_k, session_id,
+                             on_event=lambda event, payload: events.put((event, payload)), committee=committee,
+                             embedded=embedded)
+        future.add_done_callback(lambda f: events.put((_ERROR, f.exception()) if f.exception() else (_DONE, f.result())))
+        while True:
+            event, payload = events.get(timeout=timeout)
+            if event == _ERROR:
+                raise payload
+            yield event, payload
+            if event == _DONE:
+                return
+
+    async def aquery(self, question, prompt_type="comprehensive", retrieval_k=5, session_id=None, on_event=None,
+                     committee=None, embedded=None):
+        """Queue a query on the engine loop and wait for its result"""
+        if session_id is None:
+            session_id = f"anonymous-{next(self._anonymous_sessions)}"
+        future = self._loop.create_future()
+        request = _Request(question, prompt_type, retrieval_k, committee, session_id, on_event, future, embedded)
+        await self._queue.put(session_id, request)
+        return await future
+
+    def stats(self):
+        return {
+            "queued": len(self._queue) if self._queue is not None else 0,
+            "in_flight": dict(self._in_flight),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    # ----- pipeline -----
+
+    async def _worker(self):
+        while True:
+            request = await self._queue.get()
+            request.trace = self.tracer.start_trace(
+                "rag.query", prompt_type=request.prompt_type, retrieval_k=request.retrieval_k,
+                committee=request.committee, session_id=request.session_id
+            )
+            # The root span starts at submission so queueing time is visible, or at the caller's embedding
+            request.trace.root.start_ns -= int((time.perf_counter() - request.submitted_at) * 1e9)
+            if request.embedded:
+                request.trace.root.start_ns = min(request.trace.root.start_ns, request.embedded[0])
+            try:
+                result = await self._process(request)
+            except Exception as e:
+                self.tracer.finish(request.trace, error=e)
+                self.failed += 1
+                if not request.future.done():
+                    request.future.set_exception(e)
+            else:
+                self.tracer.finish(request.trace)
+                self.completed += 1
+                if not request.future.done():
+                    request.future.set_result(result)
+
+    async def _stage(self, request, stage, coroutine, traced=True):
+        """Run one upstream call under its in-flight limit and record its duration"""
+        async with self._semaphores[stage]:
+            self._in_flight[stage] += 1
+            start = time.perf_counter()
+            try:
+                if not traced:
+                    return await coroutine
+                with request.trace.span(stage):
+                    return await coroutine
+            finally:
+                request.timings[stage] = time.perf_counter() - start
+                self._in_flight[stage] -= 1
+
+    def _emit(self, request, event, payload):
+        if request.on_event is not None:
+            request.on_event(event, payload)
+
+    async def _process(self, request):
+        request.timings["queued"] = time.perf_counter() - request.submitted_at
+        start = time.perf_counter()
+        with request.trace.span("routing") as span:
+            route = self.router.route(request.question)
+            span.attributes["japanese_ratio"] = round(route.japanese_ratio, 3)
+        request.trace.root.attributes["language"] = route.language
+        request.timings["routing"] = time.perf_counter() - start
+
+        # Language variants and committee-filtered chains are separate registry entries
+        options = route.chain_options()
+        if request.committee:
+            options['committee'] = request.committee
+        chain = self.rag_system['chains'].get(request.prompt_type, request.retrieval_k, **options)
+
+        if request.embedded:
+            # Already embedded by the caller: record that call, the retriever finds the vector in the cache
+            start_ns, end_ns = request.embedded
+            request.trace.start_span("embedding", start_ns=start_ns, source="caller").end(end_ns)
+            request.timings["embedding"] = (end_ns - start_ns) / 1e9
+        else:
+            await self._stage(request, "embedding",
+                              self.rag_system['embedding'].aembed_query(request.question))
+
+        documents = await self._stage(request, "retrieval", chain.retriever.ainvoke(request.question))
+        self._emit(request, "sources", documents)
+
+        # Generation records its own prompt assembly and LLM spans
+        answer = await self._stage(request, "generation", self._generate(request, chain, documents), traced=False)
+
+        request.timings["total"] = time.perf_counter() - request.submitted_at
+        return {
+            "query": request.question,
+            "result": answer,
+            "source_documents": documents,
+            "timings": dict(request.timings),
+            "trace": request.trace.summary(),
+        }
+
+    async def _generate(self, request, chain, documents):
+        """Stream the answer from the chain's LLM using the chain's "stuff" prompt"""
+        trace = request.trace
+        stuff_chain = chain.combine_documents_chain
+        with trace.span("prompt_assembly") as span:
+            context = stuff_chain.document_separator.join(
+                format_document(doc, stuff_chain.document_prompt) for doc in documents
+            )
+            prompt_value = stuff_chain.llm_chain.prompt.format_prompt(context=context, question=request.question)
+            span.attributes["context_chars"] = len(context)
+
+        parts = []
+        # Streaming usage is split across chunks (input tokens first, output tokens last)
+        usage = None
+        completion = trace.start_span("llm.completion")
+        try:
+            async for chunk in stuff_chain.llm_chain.llm.astream(prompt_value):
+                chunk_usage = usage_from_message(chunk)
+                if chunk_usage:
+                    usage = tuple(a + b for a, b in zip(usage or (0, 0, 0), chunk_usage))
+                text = chunk.content if hasattr(chunk, "content") else chunk
+                if not text:
+                    continue
+                if not parts:
+                    # Measured from submission, which is the wait the user sees
+                    request.timings["ttft"] = time.perf_counter() - request.submitted_at
+                    trace.start_span("llm.first_token", start_ns=completion.start_ns).end()
+                parts.append(text)
+                self._emit(request, "token", text)
+        except BaseException as e:
+            completion.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            completion.end()
+
+        answer = "".join(parts)
+        if usage:
+            trace.add_usage(*usage)
+        else:
+            trace.add_usage(estimate_tokens(prompt_value.to_string()), estimate_tokens(answer), estimated=True)
+        return answer
@@ -0,0 +1,432 @@
+"""Committee and meeting detection, turned into metadata filters
+
+Every chunk belongs to one of the eight committees and usually to one
+meeting, so a question that names them ("第85回 電力・ガス基本政策小委員会",
+"the 15th Simultaneous Markets meeting") only needs to search that part
+of the corpus. analyze_query finds the mentions with a few regexes over
+the committee names (English and Japanese, as in the app's
+COMMITTEES_INFO) and returns a QueryScope, whose to_filter() is a
+Pinecone-style filter on the "committee" and "meeting" metadata fields.
+The local index answers the same filter from cached row partitions.
+
+Chunks uploaded through the Bedrock knowledge base carry only their S3
+URI and page number, so the fields are derived once from the URI and the
+start of the chunk text:
+
+    python query_scope.py tag --snapshot snapshots/meti     # rewrite a snapshot
+    python query_scope.py tag                               # update PINECONE_NAMESPACE in place
+    python query_scope.py analyze "第15回 同時市場の在り方等に関する検討会の論点は？"
+
+ScopedVectorStore wraps the vector store and applies the detected scope
+to every search that has no explicit filter. If the scoped search finds
+nothing (e.g. a meeting that was not tagged) it widens to the committee
+alone and then to the whole corpus, so detection can only narrow the
+search, never lose the answer; filters that found nothing are skipped
+for the next empty_filter_ttl seconds, so a newly tagged meeting is
+searched again once they expire. with_query_scope() probes the corpus once and
+only wraps it when chunks carry the committee field, so an untagged
+Bedrock knowledge base namespace is searched as before, and the app
+hides its committee filter.
+"""
+import argparse
+import json
+import os
+import re
+import time
+import unicodedata
+from urllib.parse import unquote
+
+from langchain_core.vectorstores import VectorStore
+
+COMMITTEE_FIELD = "committee"
+MEETING_FIELD = "meeting"
+# Only the start of a chunk is used to tag it (cover pages and headers name the meeting)
+TAG_TEXT_CHARS = 400
+# Seconds a filter that matched nothing is skipped before it is tried again
+DEFAULT_EMPTY_FILTER_TTL = 300
+
+
+class Committee:
+    """One committee: display names, aliases that always identify it, topic-like aliases and known meetings
+
+    Topic aliases ("carbon management", "distributed power system") are
+    also ordinary subjects, so they only count when the query also talks
+    about a committee or meeting.
+    """
+
+    __slots__ = ("key", "name_en", "name_ja", "aliases", "topic_aliases", "meetings")
+
+    def __init__(self, key, name_en, name_ja, aliases=(), topic_aliases=(), meetings=()):
+        self.key = key
+        self.name_en = name_en
+        self.name_ja = name_ja
+        self.aliases = tuple(_normalize(alias) for alias in (name_ja, *aliases))
+        self.topic_aliases = tuple(_normalize(alias) for alias in (name_en, *topic_aliases))
+        self.meetings = tuple(meetings)
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKC", text).lower().replace("&", "and")
+    text = re.sub(r"[\s_\-]+", " ", text)
+    # "ワット・ビット" and "ワットビット" are the same name
+    return text.replace("・", "").replace("･", "")
+
+
+COMMITTEES = (
+    Committee("basic_policy", "Basic Electricity & Gas Policy", "電力・ガス基本政策小委員会",
+              aliases=("Subcommittee on Basic Electricity and Gas Policy", "電力・ガス基本政策"),
+              meetings=range(85, 88)),
+    Committee("renewable_networks", "Renewable Energy & Networks",
+              "再生可能エネルギー大量導入・次世代電力ネットワーク小委員会",
+              aliases=("Large-Scale Introduction of Renewable Energy", "Next-Generation Electricity Networks",
+                       "再エネ大量導入", "次世代電力ネットワーク小委員会"),
+              meetings=range(72, 75)),
+    Committee("next_gen_power_system", "Next Generation Power System", "次世代電力系統ワーキンググループ",
+              aliases=("Next Generation Power System Working Group", "Next-Generation Power System Working Group",
+                       "次世代電力系統"),
+              meetings=range(1, 3)),
+    Committee("distributed_power", "Distributed Power Systems", "次世代の分散型電力システムに関する検討会",
+              aliases=("Study Group on Next-Generation Distributed Power Systems",),
+              topic_aliases=("distributed power system", "分散型電力システム"),
+              meetings=(12,)),
+    Committee("watt_bit", "Watt Bit Collaboration", "ワット・ビット連携官民懇談会",
+              aliases=("Watt Bit", "Watt-Bit", "ワット・ビット"),
+              meetings=range(1, 4)),
+    Committee("carbon_management", "Carbon Management", "カーボンマネジメント小委員会",
+              aliases=("Carbon Management Subcommittee",),
+              topic_aliases=("カーボンマネジメント",),
+              meetings=(9,)),
+    Committee("simultaneous_markets", "Simultaneous Markets", "同時市場の在り方等に関する検討会",
+              aliases=("Study Group on the Status of Simultaneous Markets", "同時市場"),
+              topic_aliases=("simultaneous market",),
+              meetings=range(13, 18)),
+    Committee("adjustment_capacity", "Adjustment Capacity", "調整力及び需給バランス評価等に関する委員会",
+              aliases=("Committee on Adjustment Capacity", "Supply-Demand Balance Evaluation",
+                       "調整力及び需給バランス評価"),
+              topic_aliases=("調整力",)),
+)
+COMMITTEES_BY_KEY = {committee.key: committee for committee in COMMITTEES}
+
+_MEETING_PATTERNS = (
+    re.compile(r"第\s*(\d{1,3})\s*回"),
+    # "15th meeting", "15th Simultaneous Markets meeting"
+    re.compile(r"\b(\d{1,3})(?:st|nd|rd|th)(?:\s+[a-z]+){0,5}?\s+(?:meeting|session)"),
+    re.compile(r"\b(?:meeting|session)\s*(?:no\.?|number|#)?\s*(\d{1,3})\b"),
+)
+_COMMITTEE_CONTEXT = re.compile(
+    r"committee|subcommittee|working group|study group|forum|meeting|session|"
+    r"委員会|検討会|懇談会|ワーキンググループ|第\s*\d+\s*回"
+)
+
+
+class QueryScope:
+    """Committees and meeting numbers a query is about (empty means the whole corpus)"""
+
+    __slots__ = ("committees", "meetings")
+
+    def __init__(self, committees=(), meetings=()):
+        self.committees = tuple(sorted(set(committees)))
+        self.meetings = tuple(sorted(set(meetings)))
+
+    def __bool__(self):
+        return bool(self.committees)
+
+    def __eq__(self, other):
+        return isinstance(other, QueryScope) and (self.committees, self.meetings) == (other.committees, other.meetings)
+
+    def __hash__(self):
+        return hash((self.committees, self.meetings))
+
+    def __repr__(self):
+        return f"QueryScope(committees={self.committees}, meetings={self.meetings})"
+
+    def to_filter(self):
+        """Pinecone metadata filter for this scope (None for the whole corpus)"""
+        if not self.committees:
+            return None
+        metadata_filter = {COMMITTEE_FIELD: _one_or_in(self.committees)}
+        if self.meetings:
+            metadata_filter[MEETING_FIELD] = _one_or_in(self.meetings)
+        return metadata_filter
+
+    def committee_only(self):
+        return QueryScope(self.committees)
+
+
+def _one_or_in(values):
+    return {"$eq": values[0]} if len(values) == 1 else {"$in": list(values)}
+
+
+def committee_filter(committee_key):
+    """Filter for a single committee chosen in the UI (None for all committees)"""
+    if not committee_key:
+        return None
+    if committee_key not in COMMITTEES_BY_KEY:
+        raise ValueError(f"Unknown committee: {committee_key}")
+    return QueryScope([committee_key]).to_filter()
+
+
+def _find_committees(text, topics):
+    found = []
+    for committee in COMMITTEES:
+        aliases = committee.aliases + committee.topic_aliases if topics else committee.aliases
+        if any(alias in text for alias in aliases):
+            found.append(committee.key)
+    return found
+
+
+def _find_meetings(text):
+    return {int(number) for pattern in _MEETING_PATTERNS for number in pattern.findall(text)}
+
+
+def _resolve(committees, meetings):
+    """Keep meeting numbers that exist for the committees; infer the committee from a meeting number alone"""
+    if committees:
+        known = set()
+        for key in committees:
+            known.update(COMMITTEES_BY_KEY[key].meetings or meetings)
+        return QueryScope(committees, meetings & known)
+    candidates = [committee.key for committee in COMMITTEES if meetings & set(committee.meetings)]
+    if not candidates:
+        return QueryScope()
+    return QueryScope(candidates, meetings)
+
+
+def analyze_query(question):
+    """Detect committee and meeting mentions in an English or Japanese question"""
+    text = _normalize(question)
+    meetings = _find_meetings(text)
+    committees = _find_committees(text, topics=bool(meetings) or bool(_COMMITTEE_CONTEXT.search(text)))
+    return _resolve(committees, meetings)
+
+
+def tag_metadata(metadata, text=""):
+    """The committee and meeting fields for a chunk, from its S3 URI and then the start of its text
+
+    Returns {} when the chunk cannot be attributed to a committee.
+    """
+    metadata = metadata or {}
+    source = _normalize(unquote(metadata.get("x-amz-bedrock-kb-source-uri", metadata.get("source", "")) or ""))
+    head = _normalize((text or "")[:TAG_TEXT_CHARS])
+
+    # A file path is committee context already, so topic aliases count there
+    committees = _find_committees(source, topics=True) or _find_committees(head, topics=True)
+    if len(committees) != 1:
+        return {}
+    scope = _resolve(committees, _find_meetings(source) or _find_meetings(head))
+    tags = {COMMITTEE_FIELD: scope.committees[0]}
+    if len(scope.meetings) == 1:
+        tags[MEETING_FIELD] = scope.meetings[0]
+    return tags
+
+
+class ScopedVectorStore(VectorStore):
+    """Vector store that restricts each search to the committees and meetings named in the query (read-only)"""
+
+    def __init__(self, vectorstore, empty_filter_ttl=DEFAULT_EMPTY_FILTER_TTL):
+        self.vectorstore = vectorstore
+        self.empty_filter_ttl = empty_filter_ttl
+        self.scoped_searches = 0
+        self.widened_searches = 0
+        # Filters that matched nothing (meetings that are not tagged) -> when to try them again
+        self._empty_filters = {}
+
+    @property
+    def embeddings(self):
+        return self.vectorstore.embeddings
+
+    def fingerprint(self):
+        return self.vectorstore.fingerprint()
+
+    def _filters(self, query, explicit_filter):
+        """Filters to try in order: the explicit filter or the full scope, the committee alone, then no filter"""
+        if explicit_filter is not None:
+            filters = [explicit_filter]
+        else:
+            scope = analyze_query(query)
+            if not scope:
+                return [None]
+            self.scoped_searches += 1
+            filters = [scope.to_filter()]
+            if scope.meetings:
+                filters.append(scope.committee_only().to_filter())
+        return filters + [None]
+
+    def _skip(self, metadata_filter):
+        if metadata_filter is None:
+            return False
+        key = _filter_key(metadata_filter)
+        retry_at = self._empty_filters.get(key)
+        if retry_at is None:
+            return False
+        if time.monotonic() < retry_at:
+            return True
+        self._empty_filters.pop(key, None)
+        return False
+
+    def _found(self, i, metadata_filter, results):
+        if results:
+            self.widened_searches += bool(i)
+            return True
+        if metadata_filter is not None:
+            self._empty_filters[_filter_key(metadata_filter)] = time.monotonic() + self.empty_filter_ttl
+        return False
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        for i, metadata_filter in enumerate(self._filters(query, filter)):
+            if self._skip(metadata_filter):
+                continue
+            results = self.vectorstore.similarity_search_with_score(query, k=k, filter=metadata_filter, **kwargs)
+            if self._found(i, metadata_filter, results):
+                return results
+        return []
+
+    async def asimilarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        for i, metadata_filter in enumerate(self._filters(query, filter)):
+            if self._skip(metadata_filter):
+                continue
+            results = await self.vectorstore.asimilarity_search_with_score(
+                query, k=k, filter=metadata_filter, **kwargs
+            )
+            if self._found(i, metadata_filter, results):
+                return results
+        return []
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    async def asimilarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, filter, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return self.vectorstore._select_relevance_score_fn()
+
+    def stats(self):
+        return {"scoped_searches": self.scoped_searches, "widened_searches": self.widened_searches}
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("ScopedVectorStore is read-only")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Wrap an existing vector store with ScopedVectorStore(vectorstore)")
+
+
+def _filter_key(metadata_filter):
+    return json.dumps(metadata_filter, sort_keys=True)
+
+
+def corpus_is_tagged(vectorstore):
+    """Whether any chunk carries the committee field (one k=1 search filtered to the known committees)"""
+    probe_filter = {COMMITTEE_FIELD: {"$in": [committee.key for committee in COMMITTEES]}}
+    return bool(vectorstore.similarity_search_with_score(COMMITTEES[0].name_en, k=1, filter=probe_filter))
+
+
+def with_query_scope(vectorstore, probe=None):
+    """Wrap vectorstore in ScopedVectorStore when QUERY_SCOPE_FILTER is on and the corpus is tagged
+
+    probe is the store the tag check searches (the plain dense store under
+    any hybrid or reranking wrappers), vectorstore by default.
+    """
+    if os.getenv("QUERY_SCOPE_FILTER", "1").lower() not in ("1", "true", "yes"):
+        return vectorstore
+    if not corpus_is_tagged(probe if probe is not None else vectorstore):
+        print("No committee metadata in the corpus, committee filters are off (python query_scope.py tag)")
+        return vectorstore
+    return ScopedVectorStore(
+        vectorstore,
+        empty_filter_ttl=float(os.getenv("QUERY_SCOPE_EMPTY_FILTER_TTL", str(DEFAULT_EMPTY_FILTER_TTL)))
+    )
+
+
+def scoping_enabled(vectorstore):
+    """Whether searches of vectorstore honour committee filters"""
+    return isinstance(vectorstore, ScopedVectorStore)
+
+
+def tag_snapshot(path):
+    """Rewrite a snapshot with committee/meeting metadata; returns (tagged, total)"""
+    import numpy as np
+
+    from snapshot import SnapshotWriter, open_snapshot
+
+    snapshot = open_snapshot(path)
+    writer = SnapshotWriter(path, snapshot.manifest["dimension"], dtype=snapshot.manifest["dtype"],
+                            namespace=snapshot.manifest.get("namespace"))
+    tagged = 0
+    try:
+        for position in range(len(snapshot)):
+            text = snapshot.texts[position]
+            metadata = dict(snapshot.metadatas[position] or {})
+            tags = tag_metadata(metadata, text)
+            tagged += bool(tags)
+            metadata.update(tags)
+            writer.add(snapshot.ids[position], np.asarray(snapshot.vectors[position], dtype=np.float32),
+                       text, metadata)
+        snapshot.close()
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    return tagged, len(writer)
+
+
+def tag_namespace(index, namespace, text_key="text", batch_size=100):
+    """Set committee/meeting metadata on every vector of a Pinecone namespace; returns (tagged, total)"""
+    tagged = total = 0
+    for id_batch in index.list(namespace=namespace, limit=batch_size):
+        fetched = index.fetch(ids=list(id_batch), namespace=namespace).vectors
+        for vector_id, vector in fetched.items():
+            total += 1
+            metadata = dict(vector.metadata or {})
+            tags = tag_metadata(metadata, metadata.get(text_key, ""))
+            if tags and any(metadata.get(field) != value for field, value in tags.items()):
+                index.update(id=vector_id, set_metadata=tags, namespace=namespace)
+                tagged += 1
+    if tagged:
+        # Metadata updates keep the vector count: bump the corpus version so caches are rebuilt
+        from answer_cache import mark_corpus_version
+
+        mark_corpus_version(index, namespace, f"tagged-{int(time.time())}")
+    return tagged, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect query scopes and tag the corpus with committee metadata")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    analyze_parser = subparsers.add_parser("analyze", help="Show the scope and filter detected for a question")
+    analyze_parser.add_argument("question")
+
+    tag_parser = subparsers.add_parser("tag", help="Add committee/meeting metadata to a snapshot or namespace")
+    tag_parser.add_argument("--snapshot", help="Snapshot directory (default: the Pinecone namespace)")
+    tag_parser.add_argument("--namespace", help="Defaults to PINECONE_NAMESPACE")
+
+    args = parser.parse_args()
+
+    if args.command == "analyze":
+        start = time.perf_counter()
+        scope = analyze_query(args.question)
+        elapsed = time.perf_counter() - start
+        print(f"🔎 {scope} in {elapsed * 1e6:.0f}µs")
+        print(f"Filter: {json.dumps(scope.to_filter(), ensure_ascii=False)}")
+        return
+
+    if args.snapshot:
+        tagged, total = tag_snapshot(args.snapshot)
+        print(f"✅ Tagged {tagged} of {total} chunks in {args.snapshot}")
+        return
+
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+
+    load_dotenv()
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    index = pc.Index(os.getenv("PINECONE_INDEX_NAME"))
+    namespace = args.namespace or os.getenv("PINECONE_NAMESPACE")
+    tagged, total = tag_namespace(index, namespace)
+    print(f"✅ Updated {tagged} of {total} vectors in namespace {namespace!r}")
+
+
+if __name__ == "__main__":
+    main()
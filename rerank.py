@@ -0,0 +1,213 @@
+"""Retrieve many, rerank few: a cheap CPU reranking stage before generation
+
+Raising k to get better answers makes every Haiku prompt longer. Instead,
+RerankedVectorStore fetches fetch_k candidates (30 by default, which costs
+little more than 5 from Pinecone or the local index), rescores them on CPU
+and returns only the top k to the chain. k from the caller decides how
+many chunks are kept unless RERANK_TOP_K sets a cap (none by default).
+
+LexicalReranker is a fixed linear model over three features:
+
+    bm25      BM25 of the query over the candidate set (idf from the candidates)
+    coverage  fraction of distinct query terms the chunk contains
+    prior     the chunk's position in the retrieval ranking
+
+Terms are the lexical index tokens (ASCII words and CJK bigrams), so it
+works for Japanese and English alike and takes about a millisecond for 30
+candidates. CrossEncoderReranker uses a small multilingual cross-encoder
+when sentence-transformers is installed, on the lexical top candidates.
+
+    python benchmarks/reranking.py      # latency and quality against k-only retrieval
+"""
+import math
+import os
+import threading
+from collections import Counter
+from functools import lru_cache
+
+from langchain_core.vectorstores import VectorStore
+
+from lexical_index import DEFAULT_B, DEFAULT_K1, tokenize
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+DEFAULT_FETCH_K = 30
+DEFAULT_WEIGHTS = {"bm25": 0.5, "coverage": 0.3, "prior": 0.2}
+# Multilingual (Japanese included) MiniLM trained on mMARCO, ~120M parameters
+DEFAULT_CROSS_ENCODER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+DEFAULT_CROSS_ENCODER_CANDIDATES = 12
+RERANKERS = ("none", "lexical", "cross-encoder")
+
+
+@lru_cache(maxsize=8192)
+def _term_counts(text):
+    # The same chunks come back for many queries, so tokenize each once
+    return Counter(tokenize(text))
+
+
+class LexicalReranker:
+    """Linear model over BM25, query term coverage and retrieval rank"""
+
+    def __init__(self, weights=None, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query, documents):
+        """Scores in [0, 1] for documents given in retrieval order"""
+        if not documents:
+            return []
+        query_terms = set(tokenize(query))
+        counts = [_term_counts(doc.page_content) for doc in documents]
+        lengths = [sum(c.values()) for c in counts]
+        average_length = sum(lengths) / len(lengths) or 1.0
+        total = len(documents)
+
+        idf = {}
+        for term in query_terms:
+            frequency = sum(1 for c in counts if term in c)
+            idf[term] = math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+
+        bm25 = []
+        for c, length in zip(counts, lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / average_length)
+            bm25.append(sum(idf[term] * c[term] * (self.k1 + 1) / (c[term] + norm)
+                            for term in query_terms if term in c))
+        top_bm25 = max(bm25) or 1.0
+
+        scores = []
+        for rank, (c, doc_bm25) in enumerate(zip(counts, bm25)):
+            coverage = sum(1 for term in query_terms if term in c) / len(query_terms) if query_terms else 0.0
+            prior = 1.0 - rank / total
+            scores.append(self.weights["bm25"] * doc_bm25 / top_bm25 + self.weights["coverage"] * coverage
+                          + self.weights["prior"] * prior)
+        return scores
+
+    def rerank(self, query, scored_documents, k):
+        """Return the top-k (document, rerank_score) of retrieval-ordered (document, score) pairs"""
+        documents = [doc for doc, _ in scored_documents]
+        ranked = sorted(zip(documents, self.score(query, documents)), key=lambda pair: pair[1], reverse=True)
+        return ranked[:k]
+
+    def relevance(self, score):
+        return score
+
+
+class CrossEncoderReranker:
+    """Cross-encoder over the lexical reranker's top candidates (requires sentence-transformers)"""
+
+    def __init__(self, model_name=DEFAULT_CROSS_ENCODER_MODEL, candidates=DEFAULT_CROSS_ENCODER_CANDIDATES,
+                 prefilter=None):
+        if CrossEncoder is None:
+            raise ImportError("sentence-transformers is required for the cross-encoder reranker "
+                              "(pip install sentence-transformers)")
+        self.model_name = model_name
+        self.candidates = candidates
+        self.prefilter = prefilter or LexicalReranker()
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        # Loaded on first use, the weights take a few seconds to read
+        with self._lock:
+            if self._model is None:
+                self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def rerank(self, query, scored_documents, k):
+        candidates = self.prefilter.rerank(query, scored_documents, max(k, self.candidates))
+        if not candidates:
+            return []
+        scores = self.model.predict([(query, doc.page_content) for doc, _ in candidates])
+        ranked = sorted(zip((doc for doc, _ in candidates), (float(s) for s in scores)),
+                        key=lambda pair: pair[1], reverse=True)
+        return ranked[:k]
+
+    def relevance(self, score):
+        # Logits to (0, 1)
+        return 1.0 / (1.0 + math.exp(-score))
+
+
+class RerankedVectorStore(VectorStore):
+    """Vector store that fetches fetch_k candidates and returns the reranker's top k (read-only)
+
+    top_k caps the documents returned whatever k the caller asks for (None
+    for no cap).
+    """
+
+    def __init__(self, vectorstore, reranker, fetch_k=DEFAULT_FETCH_K, top_k=None):
+        self.vectorstore = vectorstore
+        self.reranker = reranker
+        self.fetch_k = fetch_k
+        self.top_k = top_k
+
+    def _keep(self, k):
+        return min(k, self.top_k) if self.top_k else k
+
+    @property
+    def embeddings(self):
+        return self.vectorstore.embeddings
+
+    def fingerprint(self):
+        return self.vectorstore.fingerprint()
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        candidates = self.vectorstore.similarity_search_with_score(
+            query, k=max(k, self.fetch_k), filter=filter, **kwargs
+        )
+        return self.reranker.rerank(query, candidates, self._keep(k))
+
+    async def asimilarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        candidates = await self.vectorstore.asimilarity_search_with_score(
+            query, k=max(k, self.fetch_k), filter=filter, **kwargs
+        )
+        return self.reranker.rerank(query, candidates, self._keep(k))
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    async def asimilarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, filter, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return self.reranker.relevance
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("RerankedVectorStore is read-only")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Wrap an existing vector store with RerankedVectorStore(vectorstore, reranker)")
+
+
+def build_reranker(name="lexical"):
+    """Reranker by name ("none" returns None); the cross-encoder falls back to lexical if unavailable"""
+    if name not in RERANKERS:
+        raise ValueError(f"reranker must be one of {RERANKERS}")
+    if name == "none":
+        return None
+    if name == "cross-encoder":
+        if CrossEncoder is not None:
+            return CrossEncoderReranker(os.getenv("CROSS_ENCODER_MODEL", DEFAULT_CROSS_ENCODER_MODEL))
+        print("sentence-transformers is not installed, using the lexical reranker")
+    return LexicalReranker()
+
+
+def with_reranking(vectorstore):
+    """Wrap vectorstore as configured by RERANKER, RERANK_FETCH_K and RERANK_TOP_K (unchanged when RERANKER=none)
+
+    RERANK_TOP_K caps the chunks kept whatever k is asked for (unset or 0: k decides).
+    """
+    reranker = build_reranker(os.getenv("RERANKER", "lexical"))
+    if reranker is None:
+        return vectorstore
+    return RerankedVectorStore(
+        vectorstore,
+        reranker,
+        fetch_k=int(os.getenv("RERANK_FETCH_K", str(DEFAULT_FETCH_K))),
+        top_k=int(os.getenv("RERANK_TOP_K", "0")) or None
+    )
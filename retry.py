@@ -0,0 +1,39 @@
+"""Retry helpers shared by the batch runner, the embedding batcher and the ingestor
+
+is_throttling_error tells rate limiting and overload apart from real
+failures for Bedrock, S3 and Pinecone errors; backoff_delay is the sleep
+before the next attempt.
+"""
+import random
+
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 30.0
+
+# Error codes Bedrock, S3 and Pinecone use for rate limiting / overload
+THROTTLING_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "SlowDown",
+    "RequestLimitExceeded",
+}
+
+
+def is_throttling_error(error):
+    """True if the error means "slow down and try again" rather than a real failure"""
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        code = response.get("Error", {}).get("Code")
+        if code in THROTTLING_CODES:
+            return True
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if status in (429, 503):
+        return True
+    message = str(error)
+    return any(code in message for code in THROTTLING_CODES) or "Too Many Requests" in message
+
+
+def backoff_delay(attempt, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
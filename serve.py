@@ -0,0 +1,36 @@
+"""Start the Streamlit app with its shared resources warmed up
+
+`streamlit run app.py` builds the clients, chains and caches inside the
+first user's request. This launcher starts the warm-up (warmup.py) on a
+background thread first, then runs the same Streamlit server in the same
+process, so the first session finds everything built. Arguments are
+passed on to `streamlit run`:
+
+    python serve.py
+    python serve.py --server.port 8080 --server.headless true
+    READINESS_PORT=8502 python serve.py     # /ready answers 200 once warm-up has finished
+"""
+import logging
+import os
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def main():
+    from streamlit.web import cli
+
+    from app_resources import get_warmup
+
+    # Cached resources are built outside a script run here, which Streamlit warns about on every call
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+        lambda record: "missing ScriptRunContext" not in record.getMessage()
+    )
+    get_warmup()
+
+    sys.argv = ["streamlit", "run", APP_PATH, *sys.argv[1:]]
+    sys.exit(cli.main())
+
+
+if __name__ == "__main__":
+    main()
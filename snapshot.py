@@ -0,0 +1,333 @@
+"""Compact, memory-mapped snapshots of the Pinecone namespace
+
+A snapshot is a directory:
+
+    manifest.json   count, dimension, dtype, namespace, fingerprint (of ids, texts and metadata)
+    vectors.bin     count x dimension array (float32 or float16), L2-normalized
+    offsets.bin     (count + 1) x 3 uint64 byte offsets into the three blobs below
+    ids.bin         UTF-8 vector ids, concatenated
+    texts.bin       UTF-8 chunk texts, concatenated
+    meta.bin        UTF-8 JSON metadata per record, concatenated
+
+Everything is opened with mmap, so loading does no parsing: texts and
+metadata are decoded only for the rows that are actually read. float32
+vectors are searched in place; float16 halves the file size but is
+converted to float32 when the index loads.
+
+    python snapshot.py export --out snapshots/meti
+    python snapshot.py export --out snapshots/meti --incremental
+    python snapshot.py import --jsonl snapshots/meti.jsonl --out snapshots/meti
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 1
+DTYPES = ("float32", "float16")
+_ID, _TEXT, _META = 0, 1, 2
+
+
+class _Blob:
+    """Read-only mmap of a concatenated blob file"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def read(self, start, end):
+        return self._mmap[start:end]
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+        self._file.close()
+
+
+class _LazyColumn:
+    """Sequence view that decodes one field of a record on access"""
+
+    def __init__(self, blob, offsets, field, decode):
+        self._blob = blob
+        self._offsets = offsets
+        self._field = field
+        self._decode = decode
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        value = self._cache.get(position)
+        if value is None:
+            start = int(self._offsets[position, self._field])
+            end = int(self._offsets[position + 1, self._field])
+            value = self._decode(self._blob.read(start, end))
+            self._cache[position] = value
+        return value
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class Snapshot:
+    """An opened snapshot directory (vectors, ids, texts and metadata are lazy views)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {self.manifest.get('version')}")
+
+        count = self.manifest["count"]
+        dimension = self.manifest["dimension"]
+        if count:
+            self.vectors = np.memmap(os.path.join(path, "vectors.bin"), dtype=self.manifest["dtype"],
+                                     mode="r", shape=(count, dimension))
+        else:
+            self.vectors = np.zeros((0, dimension), dtype=self.manifest["dtype"])
+        self.offsets = np.memmap(os.path.join(path, "offsets.bin"), dtype=np.uint64, mode="r",
+                                 shape=(count + 1, 3))
+        self._blobs = [_Blob(os.path.join(path, name)) for name in ("ids.bin", "texts.bin", "meta.bin")]
+        decode = lambda raw: bytes(raw).decode("utf-8")
+        self.ids = _LazyColumn(self._blobs[_ID], self.offsets, _ID, decode)
+        self.texts = _LazyColumn(self._blobs[_TEXT], self.offsets, _TEXT, decode)
+        self.metadatas = _LazyColumn(self._blobs[_META], self.offsets, _META,
+                                     lambda raw: json.loads(bytes(raw).decode("utf-8")))
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    @property
+    def fingerprint(self):
+        return self.manifest["fingerprint"]
+
+    def position_by_id(self):
+        """Map vector id -> row position (decodes every id, so only used by export)"""
+        return {vector_id: i for i, vector_id in enumerate(self.ids)}
+
+    def close(self):
+        for blob in self._blobs:
+            blob.close()
+
+
+def open_snapshot(path):
+    return Snapshot(path)
+
+
+class SnapshotWriter:
+    """Stream records into a new snapshot directory, then publish it atomically"""
+
+    def __init__(self, path, dimension, dtype="float32", namespace=None):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}")
+        self.path = path
+        self.dimension = dimension
+        self.dtype = dtype
+        self.namespace = namespace
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._tmp = tempfile.mkdtemp(prefix=".snapshot-", dir=parent)
+        self._vectors = open(os.path.join(self._tmp, "vectors.bin"), "wb")
+        self._blobs = [open(os.path.join(self._tmp, name), "wb") for name in ("ids.bin", "texts.bin", "meta.bin")]
+        self._offsets = [(0, 0, 0)]
+        self._digest = hashlib.sha256()
+
+    def add(self, vector_id, vector, text, metadata):
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.dimension,):
+            raise ValueError(f"Vector {vector_id} has shape {vector.shape}, expected ({self.dimension},)")
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        vector.astype(self.dtype).tofile(self._vectors)
+
+        fields = (str(vector_id), text or "", json.dumps(metadata or {}, ensure_ascii=False))
+        last = self._offsets[-1]
+        next_offsets = []
+        for blob, field, start in zip(self._blobs, fields, last):
+            raw = field.encode("utf-8")
+            blob.write(raw)
+            next_offsets.append(start + len(raw))
+        self._offsets.append(tuple(next_offsets))
+        # Metadata is part of the fingerprint, so re-tagging a snapshot invalidates the caches built on it
+        canonical_metadata = json.dumps(metadata or {}, ensure_ascii=False, sort_keys=True)
+        self._digest.update(fields[0].encode("utf-8") + b"\x00" + hashlib.sha256(fields[1].encode("utf-8")).digest()
+                            + hashlib.sha256(canonical_metadata.encode("utf-8")).digest())
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def close(self):
+        """Finish writing and replace any existing snapshot at self.path"""
+        self._vectors.close()
+        for blob in self._blobs:
+            blob.close()
+        np.asarray(self._offsets, dtype=np.uint64).tofile(os.path.join(self._tmp, "offsets.bin"))
+        manifest = {
+            "version": FORMAT_VERSION,
+            "count": len(self),
+            "dimension": self.dimension,
+            "dtype": self.dtype,
+            "namespace": self.namespace,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "fingerprint": f"snapshot:{len(self)}:{self._digest.hexdigest()[:16]}",
+        }
+        with open(os.path.join(self._tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        if os.path.exists(self.path):
+            old = self.path + ".old"
+            shutil.rmtree(old, ignore_errors=True)
+            os.rename(self.path, old)
+            os.rename(self._tmp, self.path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.rename(self._tmp, self.path)
+        return manifest
+
+    def abort(self):
+        self._vectors.close()
+        for blob in self._blobs:
+            blob.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+def export_snapshot(index, namespace, path, text_key="text", dtype="float32", incremental=False,
+                    refresh_ids=None, batch_size=100):
+    """Export a Pinecone namespace to a snapshot directory
+
+    With incremental=True, vectors already present in the existing snapshot
+    are copied from it instead of being fetched again; only new ids (and any
+    in refresh_ids) go over the network, and ids no longer in the namespace
+    are dropped.
+    """
+    previous, previous_positions = None, {}
+    refresh_ids = set(refresh_ids or ())
+    writer = None
+    stats = {"reused": 0, "fetched": 0}
+    try:
+        if incremental and os.path.exists(os.path.join(path, "manifest.json")):
+            previous = open_snapshot(path)
+            previous_positions = previous.position_by_id()
+
+        for id_batch in index.list(namespace=namespace, limit=batch_size):
+            id_batch = list(id_batch)
+            to_fetch = [i for i in id_batch if i not in previous_positions or i in refresh_ids]
+            fetched = index.fetch(ids=to_fetch, namespace=namespace).vectors if to_fetch else {}
+
+            for vector_id in id_batch:
+                if vector_id in fetched:
+                    vector = fetched[vector_id]
+                    metadata = dict(vector.metadata or {})
+                    text = metadata.pop(text_key, "")
+                    values = vector.values
+                    stats["fetched"] += 1
+                elif vector_id in previous_positions:
+                    position = previous_positions[vector_id]
+                    values = np.asarray(previous.vectors[position], dtype=np.float32)
+                    text = previous.texts[position]
+                    metadata = previous.metadatas[position]
+                    stats["reused"] += 1
+                else:
+                    continue
+
+                if writer is None:
+                    writer = SnapshotWriter(path, len(values), dtype=dtype, namespace=namespace)
+                writer.add(vector_id, values, text, metadata)
+
+        if writer is None:
+            raise ValueError(f"Namespace {namespace!r} is empty, nothing to export")
+        # Release the old mmaps before the directory is replaced
+        if previous is not None:
+            previous.close()
+            previous = None
+        stats["manifest"] = writer.close()
+        return stats
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        if previous is not None:
+            previous.close()
+
+
+def import_jsonl(jsonl_path, path, dtype="float32"):
+    """Convert a JSONL export ({"id", "values", "text", "metadata"} per line) to a snapshot"""
+    writer = None
+    try:
+        with open(jsonl_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if writer is None:
+                    writer = SnapshotWriter(path, len(record["values"]), dtype=dtype)
+                writer.add(record["id"], record["values"], record.get("text", ""), record.get("metadata", {}))
+        if writer is None:
+            raise ValueError(f"{jsonl_path} contains no records")
+        return writer.close()
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export/import compact snapshots of the Pinecone namespace")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the Pinecone namespace")
+    export_parser.add_argument("--out", required=True, help="Snapshot directory")
+    export_parser.add_argument("--namespace", help="Defaults to PINECONE_NAMESPACE")
+    export_parser.add_argument("--dtype", choices=DTYPES, default="float32")
+    export_parser.add_argument("--incremental", action="store_true",
+                               help="Only fetch vectors that are not already in the snapshot")
+    export_parser.add_argument("--refresh-ids", help="File with vector ids to re-fetch (one per line)")
+
+    import_parser = subparsers.add_parser("import", help="Convert a JSONL export to a snapshot")
+    import_parser.add_argument("--jsonl", required=True)
+    import_parser.add_argument("--out", required=True)
+    import_parser.add_argument("--dtype", choices=DTYPES, default="float32")
+
+    args = parser.parse_args()
+
+    if args.command == "import":
+        manifest = import_jsonl(args.jsonl, args.out, dtype=args.dtype)
+        print(f"✅ Imported {manifest['count']} vectors to {args.out}")
+        return
+
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+
+    load_dotenv()
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    index = pc.Index(os.getenv("PINECONE_INDEX_NAME"))
+
+    refresh_ids = None
+    if args.refresh_ids:
+        with open(args.refresh_ids, encoding="utf-8") as f:
+            refresh_ids = [line.strip() for line in f if line.strip()]
+
+    stats = export_snapshot(index, args.namespace or os.getenv("PINECONE_NAMESPACE"), args.out,
+                            dtype=args.dtype, incremental=args.incremental, refresh_ids=refresh_ids)
+    print(f"✅ Exported {stats['manifest']['count']} vectors to {args.out} "
+          f"({stats['fetched']} fetched, {stats['reused']} reused)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""Per-stage tracing for the RAG pipeline
+
+Every query produces one trace with a root span and one child span per
+stage: embedding, retrieval (the Pinecone or local index query), prompt
+assembly, LLM first token and LLM completion. Prompt and completion token
+counts are attached to the trace, taken from the model's usage metadata
+when Bedrock reports it and estimated from the text otherwise.
+
+Finished traces feed:
+- Prometheus metrics (stage latency histograms, token and query counters),
+  served as text on /metrics by start_prometheus_server
+- exporters: JsonlSpanExporter writes OTLP/JSON spans to a local file, and
+  OpenTelemetryExporter forwards spans to the globally configured
+  OpenTelemetry tracer provider (requires opentelemetry-api)
+
+    TRACE_EXPORT_PATH=traces/spans.jsonl
+    TRACE_OTEL=1
+    PROMETHEUS_PORT=9464
+"""
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+SERVICE_NAME = "meti-rag"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff66-\uff9f]")
+
+
+def estimate_tokens(text):
+    """Rough token count when the model does not report usage
+
+    About one token per CJK character and one per four characters of other
+    text, which is close enough for Claude on mixed English/Japanese text.
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + max(1, (len(text) - cjk) // 4)
+
+
+def usage_from_message(message):
+    """(prompt_tokens, completion_tokens, cache_read_tokens) from a message's usage metadata, or None"""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    cache_read = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    return usage.get("input_tokens", 0), usage.get("output_tokens", 0), cache_read
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name, parent_id=None, start_ns=None, attributes=None):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    @property
+    def duration(self):
+        return (self.end_ns - self.start_ns) / 1e9 if self.end_ns is not None else None
+
+    def end(self, end_ns=None):
+        if self.end_ns is None:
+            self.end_ns = end_ns if end_ns is not None else time.time_ns()
+
+
+class TimedCall:
+    """Wrap fn and keep the (start_ns, end_ns) wall-clock interval of its last call in .interval
+
+    Used for work done before a trace starts (the answer cache embedding
+    the question), so the trace can record it as its own span.
+    """
+
+    __slots__ = ("fn", "interval")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.interval = None
+
+    def __call__(self, *args, **kwargs):
+        start_ns = time.time_ns()
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            self.interval = (start_ns, time.time_ns())
+
+
+class Trace:
+    """The spans of one query; the first span is the root"""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = secrets.token_hex(16)
+        self.root = Span(name, attributes=attributes)
+        self.spans = [self.root]
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_read_tokens = 0
+        self.tokens_estimated = False
+
+    def start_span(self, name, start_ns=None, **attributes):
+        span = Span(name, parent_id=self.root.span_id, start_ns=start_ns, attributes=attributes)
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end()
+
+    def add_usage(self, prompt_tokens, completion_tokens, cache_read_tokens=0, estimated=False):
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cache_read_tokens += cache_read_tokens
+        self.tokens_estimated = self.tokens_estimated or estimated
+
+    def summary(self):
+        """Stage offsets and durations in seconds, for the app's timing panel"""
+        return {
+            "trace_id": self.trace_id,
+            "spans": [
+                {
+                    "name": span.name,
+                    "offset": (span.start_ns - self.root.start_ns) / 1e9,
+                    "duration": span.duration,
+                }
+                for span in sorted(self.spans[1:], key=lambda span: (span.start_ns, span.end_ns or 0))
+                if span.end_ns is not None
+            ],
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "tokens_estimated": self.tokens_estimated,
+        }
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+class JsonlSpanExporter:
+    """Append each trace as one OTLP/JSON ExportTraceServiceRequest line
+
+    The lines can be replayed to an OpenTelemetry collector's OTLP/HTTP
+    endpoint or inspected directly.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        spans = []
+        for span in trace.spans:
+            attributes = dict(span.attributes)
+            if span is trace.root:
+                attributes.update({
+                    "llm.usage.prompt_tokens": trace.prompt_tokens,
+                    "llm.usage.completion_tokens": trace.completion_tokens,
+                    "llm.usage.cache_read_tokens": trace.cache_read_tokens,
+                    "llm.usage.estimated": trace.tokens_estimated,
+                })
+            record = {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": _otlp_attributes(attributes),
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                record["parentSpanId"] = span.parent_id
+            spans.append(record)
+
+        line = {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+class OpenTelemetryExporter:
+    """Replay finished traces into the globally configured OpenTelemetry tracer provider"""
+
+    def __init__(self, tracer_name=SERVICE_NAME):
+        if otel_trace is None:
+            raise ImportError("opentelemetry-api is required for TRACE_OTEL (pip install opentelemetry-sdk)")
+        self._tracer = otel_trace.get_tracer(tracer_name)
+
+    def export(self, trace):
+        root = trace.root
+        attributes = dict(root.attributes, **{
+            "llm.usage.prompt_tokens": trace.prompt_tokens,
+            "llm.usage.completion_tokens": trace.completion_tokens,
+            "llm.usage.cache_read_tokens": trace.cache_read_tokens,
+        })
+        root_span = self._tracer.start_span(root.name, start_time=root.start_ns, attributes=attributes)
+        context = otel_trace.set_span_in_context(root_span)
+        for span in trace.spans[1:]:
+            child = self._tracer.start_span(span.name, context=context, start_time=span.start_ns,
+                                            attributes=span.attributes)
+            if span.error:
+                child.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, span.error))
+            child.end(end_time=span.end_ns)
+        root_span.end(end_time=root.end_ns)
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+
+class Tracer:
+    """Create traces, aggregate their metrics and hand them to the exporters"""
+
+    def __init__(self, exporters=(), buckets=DEFAULT_BUCKETS, max_recent=100):
+        self.exporters = list(exporters)
+        self.buckets = tuple(buckets)
+        self.recent = deque(maxlen=max_recent)
+        self._histograms = {}
+        self._tokens = {"prompt": 0, "completion": 0, "cache_read": 0}
+        self._queries = {"ok": 0, "error": 0}
+        self._languages = {}
+        self._lock = threading.Lock()
+
+    def start_trace(self, name="rag.query", **attributes):
+        return Trace(name, **attributes)
+
+    def finish(self, trace, error=None):
+        """End the root span, record metrics and export the trace"""
+        if error is not None:
+            trace.root.error = f"{type(error).__name__}: {error}"
+        trace.root.end()
+
+        with self._lock:
+            for span in trace.spans:
+                if span.duration is None:
+                    continue
+                histogram = self._histograms.get(span.name)
+                if histogram is None:
+                    histogram = self._histograms[span.name] = _Histogram(self.buckets)
+                for i, bound in enumerate(self.buckets):
+                    if span.duration <= bound:
+                        histogram.counts[i] += 1
+                histogram.total += span.duration
+                histogram.count += 1
+            self._tokens["prompt"] += trace.prompt_tokens
+            self._tokens["completion"] += trace.completion_tokens
+            self._tokens["cache_read"] += trace.cache_read_tokens
+            self._queries["error" if trace.root.error else "ok"] += 1
+            language = trace.root.attributes.get("language")
+            if language:
+                self._languages[language] = self._languages.get(language, 0) + 1
+            self.recent.append(trace)
+
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                # Tracing must never fail a query
+                print(f"Error exporting trace: {e}")
+
+    def render_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                "# HELP rag_stage_duration_seconds Duration of each RAG pipeline stage",
+                "# TYPE rag_stage_duration_seconds histogram",
+            ]
+            for stage, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(self.buckets, histogram.counts):
+                    lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.total}')
+                lines.append(f'rag_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines += ["# HELP rag_tokens_total LLM tokens by kind", "# TYPE rag_tokens_total counter"]
+            lines += [f'rag_tokens_total{{kind="{kind}"}} {count}' for kind, count in self._tokens.items()]
+            lines += ["# HELP rag_queries_total Finished queries by status", "# TYPE rag_queries_total counter"]
+            lines += [f'rag_queries_total{{status="{status}"}} {count}' for status, count in self._queries.items()]
+            lines += ["# HELP rag_queries_by_language_total Queries by routed language",
+                      "# TYPE rag_queries_by_language_total counter"]
+            lines += [f'rag_queries_by_language_total{{language="{language}"}} {count}'
+                      for language, count in sorted(self._languages.items())]
+        return "\n".join(lines) + "\n"
+
+
+def start_prometheus_server(tracer, port, address="0.0.0.0"):
+    """Serve tracer.render_prometheus() on http://address:port/metrics from a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="prometheus-metrics", daemon=True).start()
+    return server
+
+
+def tracer_from_env():
+    """Build a tracer from TRACE_EXPORT_PATH, TRACE_OTEL and PROMETHEUS_PORT"""
+    exporters = []
+    if os.getenv("TRACE_EXPORT_PATH"):
+        exporters.append(JsonlSpanExporter(os.getenv("TRACE_EXPORT_PATH")))
+    if os.getenv("TRACE_OTEL", "").lower() in ("1", "true", "yes"):
+        exporters.append(OpenTelemetryExporter())
+    tracer = Tracer(exporters)
+    if os.getenv("PROMETHEUS_PORT"):
+        start_prometheus_server(tracer, int(os.getenv("PROMETHEUS_PORT")))
+    return tracer
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Fill a trace from the callbacks of a synchronous RetrievalQA run
+
+    For chain.invoke callers (meti_retrieval_2, the threaded batch runner).
+    The retriever span covers the query embedding and the vector search,
+    since the vector store embeds the question internally.
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._retrieval = None
+        self._llm_start_ns = None
+        self._first_token = None
+        self._prompt_text = ""
+        self._completion_text = ""
+
+    def on_retriever_start(self, serialized, query, **kwargs):
+        self._retrieval = self.trace.start_span("retrieval")
+
+    def on_retriever_end(self, documents, **kwargs):
+        if self._retrieval is not None:
+            self._retrieval.attributes["documents"] = len(documents)
+            self._retrieval.end()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._llm_start_ns = time.time_ns()
+        self._prompt_text = "\n".join(prompts)
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self._first_token is None and token:
+            self._first_token = self.trace.start_span("llm.first_token", start_ns=self._llm_start_ns)
+            self._first_token.end()
+        self._completion_text += token
+
+    def on_llm_end(self, response, **kwargs):
+        completion = self.trace.start_span("llm.completion", start_ns=self._llm_start_ns)
+        completion.end()
+
+        usage = None
+        generations = response.generations[0] if response.generations else []
+        if generations:
+            usage = usage_from_message(getattr(generations[0], "message", None))
+            if not self._completion_text:
+                self._completion_text = generations[0].text
+        if usage:
+            self.trace.add_usage(*usage)
+        else:
+            self.trace.add_usage(estimate_tokens(self._prompt_text), estimate_tokens(self._completion_text),
+                                 estimated=True)
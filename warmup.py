@@ -0,0 +1,237 @@
+"""Cold-start warm-up of the query path, with a readiness signal
+
+After a deploy or restart the first question would otherwise pay for
+building the clients, the first Pinecone and Bedrock TLS handshakes,
+compiling chains and embedding its question. WarmUp runs those steps on a
+background thread when the server starts (serve.py) and records how long
+each one took:
+
+    clients       build the rag_system (Bedrock clients, Pinecone index, vector store)
+    connections   read the corpus version (Pinecone describe_index_stats) and
+                  generate one token, leaving TLS connections in the pools
+    chains        build the ChainRegistry entries for every prompt type, k and
+                  language variant the router can pick
+    embeddings    embed the example questions into the query-embedding cache
+    answers       check the precomputed example answers and put them in the
+                  semantic answer cache, so rephrased examples hit it too
+
+A step that fails is recorded and the rest still run: a slow first query
+is better than an app that never becomes ready. The readiness server
+answers /ready with 200 once warm-up has finished and 503 before, with the
+step report as JSON.
+
+    WARMUP=1                # 0 leaves everything to the first request
+    WARMUP_LLM=1            # 0 skips the one-token generation
+    READINESS_PORT=8502     # serve /ready on this port
+
+    python warmup.py        # warm up meti_retrieval_2's system and print the step timings
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from language_routing import LANGUAGES, router_of
+from prompts import PROMPT_TYPES
+
+DEFAULT_RETRIEVAL_KS = (5,)
+WARMUP_PROMPT = "Reply with OK."
+
+
+class _Step:
+    __slots__ = ("name", "run", "status", "duration", "error")
+
+    def __init__(self, name, run):
+        self.name = name
+        self.run = run
+        self.status = "pending"
+        self.duration = None
+        self.error = None
+
+
+class WarmUp:
+    """Run named warm-up steps in order, once, and report readiness
+
+    steps are (name, callable) pairs; each callable gets the results of
+    the steps before it as a dict keyed by step name.
+    """
+
+    def __init__(self, steps):
+        self.steps = [_Step(name, run) for name, run in steps]
+        self.results = {}
+        self.started_at = None
+        self.finished_at = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        """Run the steps on a background thread (idempotent)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def run(self):
+        self.started_at = time.time()
+        for step in self.steps:
+            step.status = "running"
+            start = time.perf_counter()
+            try:
+                self.results[step.name] = step.run(self.results)
+                step.status = "done"
+            except Exception as e:
+                step.status = "failed"
+                step.error = f"{type(e).__name__}: {e}"
+                print(f"Warm-up step {step.name} failed: {step.error}")
+            step.duration = time.perf_counter() - start
+        self.finished_at = time.time()
+        self._ready.set()
+
+    def wait(self, timeout=None):
+        """Block until warm-up has finished; returns whether it has"""
+        return self._ready.wait(timeout)
+
+    def status(self):
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        return {
+            "ready": self.ready,
+            "elapsed": round(elapsed, 3),
+            "steps": [
+                {"name": step.name, "status": step.status,
+                 "duration": None if step.duration is None else round(step.duration, 3), "error": step.error}
+                for step in self.steps
+            ],
+        }
+
+
+def warm_connections(rag_system, generate=True):
+    """Open the Pinecone and Bedrock connections the first query would otherwise open"""
+    corpus_version = rag_system['corpus_version']()
+    if generate:
+        rag_system['llm'].invoke(WARMUP_PROMPT, max_tokens=1)
+    return corpus_version
+
+
+def preload_chains(rag_system, prompt_types=PROMPT_TYPES, retrieval_ks=DEFAULT_RETRIEVAL_KS):
+    """Build the chains for every prompt type and k, in each language variant the router can choose"""
+    option_sets = [{'language': language} for language in LANGUAGES] if router_of(rag_system).enabled else [{}]
+    rag_system['chains'].preload(prompt_types, retrieval_ks, option_sets)
+    return len(rag_system['chains'])
+
+
+def prime_embeddings(rag_system, questions):
+    """Embed questions in one batch; returns {question: vector}"""
+    questions = list(dict.fromkeys(questions))
+    return dict(zip(questions, rag_system['embedding'].embed_documents(questions)))
+
+
+def prime_answer_cache(answer_cache, example_answers, rag_system, embeddings=None):
+    """Put the current precomputed example answers in the answer cache; returns how many were added"""
+    answer_cache.check_corpus_version(rag_system['corpus_version'])
+    if not example_answers.check(force=True):
+        return 0
+    embeddings = embeddings or {}
+    router = router_of(rag_system)
+    count = 0
+    for question, prompt_type, retrieval_k, result in example_answers.index.results():
+        vector = embeddings.get(question)
+        if vector is None:
+            vector = rag_system['embedding'].embed_query(question)
+        answer_cache.put(question, prompt_type, retrieval_k, result, vector, language=router.route(question).language)
+        count += 1
+    return count
+
+
+def query_path_steps(get_rag_system, questions, get_answer_cache=None, get_example_answers=None, extra_steps=(),
+                     generate=True, retrieval_ks=DEFAULT_RETRIEVAL_KS):
+    """The warm-up steps for a rag_system built by get_rag_system()
+
+    extra_steps are appended (other shared resources to build). The
+    answers step runs only with both get_answer_cache and get_example_answers.
+    """
+    def clients(results):
+        rag_system = get_rag_system()
+        if not rag_system:
+            raise RuntimeError("RAG system could not be initialized")
+        return rag_system
+
+    def system(results):
+        if "clients" not in results:
+            raise RuntimeError("skipped, the clients step failed")
+        return results["clients"]
+
+    steps = [
+        ("clients", clients),
+        ("connections", lambda results: warm_connections(system(results), generate)),
+        ("chains", lambda results: preload_chains(system(results), retrieval_ks=retrieval_ks)),
+        ("embeddings", lambda results: prime_embeddings(system(results), questions)),
+    ]
+    if get_answer_cache is not None and get_example_answers is not None:
+        steps.append(("answers", lambda results: prime_answer_cache(
+            get_answer_cache(), get_example_answers(), system(results), results.get("embeddings")
+        )))
+    return steps + list(extra_steps)
+
+
+def start_readiness_server(warmup, port, address="0.0.0.0"):
+    """Serve warmup.status() on http://address:port/ready (200 when ready, 503 before) from a daemon thread"""
+
+    class ReadinessHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/ready":
+                self.send_error(404)
+                return
+            body = json.dumps(warmup.status()).encode("utf-8")
+            self.send_response(200 if warmup.ready else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), ReadinessHandler)
+    threading.Thread(target=server.serve_forever, name="readiness", daemon=True).start()
+    return server
+
+
+def warmup_from_env(steps):
+    """WarmUp of steps, with the readiness server on READINESS_PORT; an empty one when WARMUP=0"""
+    enabled = os.getenv("WARMUP", "1").lower() in ("1", "true", "yes")
+    warmup = WarmUp(steps if enabled else [])
+    if os.getenv("READINESS_PORT"):
+        start_readiness_server(warmup, int(os.getenv("READINESS_PORT")))
+    return warmup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm up the meti_retrieval_2 query path and print the step timings")
+    parser.add_argument("--k", default=",".join(str(k) for k in DEFAULT_RETRIEVAL_KS),
+                        help="Comma-separated retrieval k values to preload chains for")
+    parser.add_argument("--no-generate", action="store_true", help="Skip the one-token generation")
+    args = parser.parse_args()
+
+    from example_answers import EXAMPLE_QUESTIONS
+    from meti_retrieval_2 import get_rag_system
+
+    questions = [question for language_questions in EXAMPLE_QUESTIONS.values() for question in language_questions]
+    warmup = WarmUp(query_path_steps(get_rag_system, questions, generate=not args.no_generate,
+                                     retrieval_ks=[int(k) for k in args.k.split(",")]))
+    warmup.run()
+    for step in warmup.status()["steps"]:
+        print(f"{'✅' if step['status'] == 'done' else '❌'} {step['name']:<12} {step['duration']:.2f}s"
+              + (f"  {step['error']}" if step['error'] else ""))
+    print(f"Warm-up finished in {warmup.status()['elapsed']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()